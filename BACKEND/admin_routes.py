@@ -1,171 +1,383 @@
 # admin_routes.py
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from datetime import date, datetime, timedelta
 from models import User, Document
-from database import get_db
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-import jwt
-import os
+from database import get_db, AsyncSessionLocal
+from pagination import keyset_page, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER
+from cid_cache import cache
+from gc_scheduler import scheduler
+from storage import storage
+from reconcile import reconciler
+from content_refs import release_refs, unpin_orphans
+from versions import purge_documents
+from storage_usage import (
+    IST, head_state, track_document, track_owners_flagged,
+    usage_summary, usage_by_user, usage_by_type, usage_by_day, rebuild as rebuild_usage,
+)
+from bulk_admin import BulkFileRequest, BulkUserRequest, bulk_files, bulk_users
+from extraction import extraction_stats
+from db_pool import pool_stats
+from auth import get_current_admin, revocations, auth_stats
+from passwords import password_stats
+from last_login import writer as last_login_writer
+from app_logging import logging_stats
+import json
 
 # -------------------------
 # Router & Security
 # -------------------------
 router = APIRouter(tags=["Admin"])
-security = HTTPBearer()
-SECRET_KEY = os.getenv("JWT_SECRET_KEY", "supersecretkey")
-ALGORITHM = "HS256"
 
-def get_current_admin(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    token = credentials.credentials
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+EXPORT_BATCH_SIZE = 1000
 
-    if payload.get("role") != "admin":
-        raise HTTPException(status_code=403, detail="Admin privileges required")
-    return payload
+def user_row(u: User) -> dict:
+    return {
+        "id": u.id,
+        "email": u.email,
+        "full_name": u.full_name,
+        "role": u.role,
+        "deleted": u.deleted,  # include deleted status
+    }
+
+def file_row(f: Document) -> dict:
+    return {
+        "id": f.id,
+        "filename": f.filename,
+        "uploaded_by": f.uploaded_by,
+        "size": f.size,
+        "uploadedtime": f.uploadedtime,
+        "deleted": f.deleted,  # include deleted status
+    }
+
+async def ndjson_export(model, order_by, to_row):
+    """
+    Stream every row as one JSON line. Uses its own session and a
+    server-side cursor (yield_per), so only one batch is in memory at a time.
+    """
+    async with AsyncSessionLocal() as db:
+        stmt = select(model).order_by(*order_by).execution_options(yield_per=EXPORT_BATCH_SIZE)
+        async for row in await db.stream_scalars(stmt):
+            yield json.dumps(to_row(row), default=str) + "\n"
 
 # -------------------------
 # Get all users (including deleted)
 # -------------------------
 @router.get("/users", response_model=List[dict])
-def get_users(db: Session = Depends(get_db), admin: dict = Depends(get_current_admin)):
-    users = db.query(User).all()  # Include deleted users
-    return [
-        {
-            "id": u.id,
-            "email": u.email,
-            "full_name": u.full_name,
-            "role": u.role,
-            "deleted": u.deleted,  # include deleted status
-        }
-        for u in users
-    ]
+async def get_users(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    admin: dict = Depends(get_current_admin),
+):
+    # Include deleted users; next page cursor in X-Next-Cursor
+    users, next_cursor = await keyset_page(db, select(User), [User.id], cursor, limit, descending=False)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return [user_row(u) for u in users]
+
+# -------------------------
+# Export all users as NDJSON
+# -------------------------
+@router.get("/users/export")
+async def export_users(admin: dict = Depends(get_current_admin)):
+    return StreamingResponse(ndjson_export(User, [User.id], user_row), media_type="application/x-ndjson")
 
 # -------------------------
 # Promote user to admin
 # -------------------------
 @router.put("/users/{user_id}/promote")
-def promote_user(user_id: int, db: Session = Depends(get_db), admin: dict = Depends(get_current_admin)):
-    user = db.query(User).filter(User.id == user_id, User.deleted == False).first()
+async def promote_user(user_id: int, db: AsyncSession = Depends(get_db), admin: dict = Depends(get_current_admin)):
+    user = await db.scalar(select(User).where(User.id == user_id, User.deleted == False))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if user.role == "admin":
         raise HTTPException(status_code=400, detail="User is already an admin")
     user.role = "admin"
-    db.commit()
+    await db.commit()
     return {"detail": f"User '{user.email}' promoted to admin"}
 
 # -------------------------
 # Demote admin to normal user
 # -------------------------
 @router.put("/users/{user_id}/demote")
-def demote_user(user_id: int, db: Session = Depends(get_db), admin: dict = Depends(get_current_admin)):
-    user = db.query(User).filter(User.id == user_id, User.deleted == False).first()
+async def demote_user(user_id: int, db: AsyncSession = Depends(get_db), admin: dict = Depends(get_current_admin)):
+    user = await db.scalar(select(User).where(User.id == user_id, User.deleted == False))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if user.role != "admin":
         raise HTTPException(status_code=400, detail="User is not an admin")
     user.role = "user"
-    db.commit()
+    # Existing tokens still carry role=admin
+    revocations.revoke_user(db, user_id)
+    await db.commit()
     return {"detail": f"Admin '{user.email}' demoted to user"}
 
 # -------------------------
 # Soft delete a user (and their files)
 # -------------------------
 @router.put("/users/{user_id}/soft_delete")
-def soft_delete_user(user_id: int, db: Session = Depends(get_db), admin: dict = Depends(get_current_admin)):
-    user = db.query(User).filter(User.id == user_id, User.deleted == False).first()
+async def soft_delete_user(user_id: int, db: AsyncSession = Depends(get_db), admin: dict = Depends(get_current_admin)):
+    user = await db.scalar(select(User).where(User.id == user_id, User.deleted == False))
     if not user:
         raise HTTPException(status_code=404, detail="User not found or already deleted")
 
     user.deleted = True
-    db.query(Document).filter(Document.uploaded_by == user_id).update({"deleted": True})
-    db.commit()
+    await db.execute(update(Document).where(Document.uploaded_by == user_id).values(deleted=True))
+    await db.run_sync(track_owners_flagged, [user_id], True)
+    revocations.revoke_user(db, user_id)
+    await db.commit()
     return {"detail": f"User {user.email} and their files marked as deleted"}
 
 # -------------------------
 # Restore a soft-deleted user (and files)
 # -------------------------
 @router.put("/users/{user_id}/restore")
-def restore_user(user_id: int, db: Session = Depends(get_db), admin: dict = Depends(get_current_admin)):
-    user = db.query(User).filter(User.id == user_id, User.deleted == True).first()
+async def restore_user(user_id: int, db: AsyncSession = Depends(get_db), admin: dict = Depends(get_current_admin)):
+    user = await db.scalar(select(User).where(User.id == user_id, User.deleted == True))
     if not user:
         raise HTTPException(status_code=404, detail="User not found or not deleted")
 
     user.deleted = False
-    db.query(Document).filter(Document.uploaded_by == user_id).update({"deleted": False})
-    db.commit()
+    await db.execute(update(Document).where(Document.uploaded_by == user_id).values(deleted=False))
+    await db.run_sync(track_owners_flagged, [user_id], False)
+    await db.commit()
     return {"detail": f"User {user.email} and their files restored"}
 
 # -------------------------
 # Permanent delete a user (and their files)
 # -------------------------
 @router.delete("/users/{user_id}/permanent")
-def permanent_delete_user(user_id: int, db: Session = Depends(get_db), admin: dict = Depends(get_current_admin)):
-    user = db.query(User).filter(User.id == user_id).first()
+async def permanent_delete_user(user_id: int, db: AsyncSession = Depends(get_db), admin: dict = Depends(get_current_admin)):
+    user = await db.scalar(select(User).where(User.id == user_id))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    db.query(Document).filter(Document.uploaded_by == user_id).delete()
-    db.delete(user)
-    db.commit()
-    return {"detail": f"User {user.email} and all their files permanently deleted"}
+    email = user.email
+    doc_ids = (await db.scalars(select(Document.id).where(Document.uploaded_by == user_id))).all()
+    orphans = await db.run_sync(lambda session: release_refs(session, purge_documents(session, doc_ids)))
+    await db.delete(user)
+    revocations.revoke_user(db, user_id)
+    await db.commit()
+    unpin_orphans(orphans)
+    return {"detail": f"User {email} and all their files permanently deleted"}
+
+# -------------------------
+# Log a user out everywhere
+# -------------------------
+@router.post("/users/{user_id}/revoke_sessions")
+async def revoke_user_sessions(user_id: int, db: AsyncSession = Depends(get_db), admin: dict = Depends(get_current_admin)):
+    user = await db.scalar(select(User).where(User.id == user_id))
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    revocations.revoke_user(db, user_id)
+    await db.commit()
+    return {"detail": f"All sessions of {user.email} revoked"}
+
+# -------------------------
+# Bulk user operations
+# -------------------------
+@router.post("/users/bulk")
+async def bulk_user_action(request: BulkUserRequest, db: AsyncSession = Depends(get_db), admin: dict = Depends(get_current_admin)):
+    # One UPDATE/DELETE per chunk of ids, each chunk its own transaction; outcome per id
+    return await db.run_sync(bulk_users, request, admin.get("user_id"))
 
 # -------------------------
 # Get all files (including deleted)
 # -------------------------
 @router.get("/files", response_model=List[dict])
-def get_files(db: Session = Depends(get_db), admin: dict = Depends(get_current_admin)):
-    files = db.query(Document).all()
-    return [
-        {
-            "id": f.id,
-            "filename": f.filename,
-            "uploaded_by": f.uploaded_by,
-            "size": f.size,
-            "uploadedtime": f.uploadedtime,
-            "deleted": f.deleted,  # include deleted status
-        }
-        for f in files
-    ]
+async def get_files(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    admin: dict = Depends(get_current_admin),
+):
+    # Newest first; next page cursor in X-Next-Cursor
+    files, next_cursor = await keyset_page(db, select(Document), [Document.uploadedtime, Document.id], cursor, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return [file_row(f) for f in files]
+
+# -------------------------
+# Export all files as NDJSON
+# -------------------------
+@router.get("/files/export")
+async def export_files(admin: dict = Depends(get_current_admin)):
+    order_by = [Document.uploadedtime.desc(), Document.id.desc()]
+    return StreamingResponse(ndjson_export(Document, order_by, file_row), media_type="application/x-ndjson")
 
 # -------------------------
 # Soft delete a single file
 # -------------------------
 @router.put("/files/{file_id}/soft_delete")
-def soft_delete_file(file_id: int, db: Session = Depends(get_db), admin: dict = Depends(get_current_admin)):
-    file = db.query(Document).filter(Document.id == file_id, Document.deleted == False).first()
+async def soft_delete_file(file_id: int, db: AsyncSession = Depends(get_db), admin: dict = Depends(get_current_admin)):
+    file = await db.scalar(select(Document).where(Document.id == file_id, Document.deleted == False))
     if not file:
         raise HTTPException(status_code=404, detail="File not found or already deleted")
+    before = head_state(file)
     file.deleted = True
-    db.commit()
+    await db.run_sync(track_document, before, file)
+    await db.commit()
     return {"detail": f"File {file.filename} marked as deleted"}
 
 # -------------------------
 # Restore a soft-deleted file
 # -------------------------
 @router.put("/files/{file_id}/restore")
-def restore_file(file_id: int, db: Session = Depends(get_db), admin: dict = Depends(get_current_admin)):
-    file = db.query(Document).filter(Document.id == file_id, Document.deleted == True).first()
+async def restore_file(file_id: int, db: AsyncSession = Depends(get_db), admin: dict = Depends(get_current_admin)):
+    file = await db.scalar(select(Document).where(Document.id == file_id, Document.deleted == True))
     if not file:
         raise HTTPException(status_code=404, detail="File not found or not deleted")
+    before = head_state(file)
     file.deleted = False
-    db.commit()
+    await db.run_sync(track_document, before, file)
+    await db.commit()
     return {"detail": f"File {file.filename} restored"}
 
 # -------------------------
 # Permanent delete a file
 # -------------------------
 @router.delete("/files/{file_id}/permanent")
-def permanent_delete_file(file_id: int, db: Session = Depends(get_db), admin: dict = Depends(get_current_admin)):
-    file = db.query(Document).filter(Document.id == file_id).first()
+async def permanent_delete_file(file_id: int, db: AsyncSession = Depends(get_db), admin: dict = Depends(get_current_admin)):
+    file = await db.scalar(select(Document).where(Document.id == file_id))
     if not file:
         raise HTTPException(status_code=404, detail="File not found")
-    db.delete(file)
-    db.commit()
-    return {"detail": f"File {file.filename} permanently deleted"}
+    filename = file.filename
+    orphans = await db.run_sync(lambda session: release_refs(session, purge_documents(session, [file.id])))
+    await db.commit()
+    unpin_orphans(orphans)
+    return {"detail": f"File {filename} permanently deleted"}
+
+# -------------------------
+# Bulk file operations
+# -------------------------
+@router.post("/files/bulk")
+async def bulk_file_action(request: BulkFileRequest, db: AsyncSession = Depends(get_db), admin: dict = Depends(get_current_admin)):
+    # Unpins of content left unreferenced are queued once each chunk has committed
+    return await db.run_sync(bulk_files, request)
+
+# -------------------------
+# Download cache statistics
+# -------------------------
+@router.get("/cache/stats")
+async def cache_stats(admin: dict = Depends(get_current_admin)):
+    return cache.stats()
+
+# -------------------------
+# IPFS unpin queue / GC statistics
+# -------------------------
+@router.get("/ipfs/gc")
+async def ipfs_gc_stats(admin: dict = Depends(get_current_admin)):
+    return scheduler.stats()
+
+# -------------------------
+# Storage / database reconciliation
+# -------------------------
+@router.post("/reconcile", status_code=202)
+async def start_reconciliation(
+    dry_run: bool = True,
+    rate: Optional[float] = Query(None, ge=0),
+    admin: dict = Depends(get_current_admin),
+):
+    # Dry runs report what would be unpinned or flagged without changing anything
+    if not reconciler.start(dry_run=dry_run, rate=rate):
+        raise HTTPException(status_code=409, detail="A reconciliation is already running")
+    return {"detail": "Reconciliation started", "dry_run": dry_run}
+
+@router.get("/reconcile")
+async def reconciliation_status(admin: dict = Depends(get_current_admin)):
+    return reconciler.stats()
+
+@router.get("/reconcile/missing", response_model=List[dict])
+async def files_with_missing_content(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    admin: dict = Depends(get_current_admin),
+):
+    # Documents whose current content the last applied reconciliation could not find
+    stmt = select(Document).where(Document.content_missing == True)
+    files, next_cursor = await keyset_page(db, stmt, [Document.id], cursor, limit, descending=False)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return [{**file_row(f), "cid": f.cid} for f in files]
+
+# -------------------------
+# Storage analytics
+# -------------------------
+@router.get("/analytics/summary")
+async def analytics_summary(db: AsyncSession = Depends(get_db), admin: dict = Depends(get_current_admin)):
+    return await db.run_sync(usage_summary)
+
+@router.get("/analytics/users", response_model=List[dict])
+async def analytics_by_user(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    sort: str = "bytes",
+    db: AsyncSession = Depends(get_db),
+    admin: dict = Depends(get_current_admin),
+):
+    # Read from the running totals, not the documents table
+    return await db.run_sync(usage_by_user, limit, sort)
+
+@router.get("/analytics/types", response_model=List[dict])
+async def analytics_by_type(db: AsyncSession = Depends(get_db), admin: dict = Depends(get_current_admin)):
+    return await db.run_sync(usage_by_type)
+
+@router.get("/analytics/daily", response_model=List[dict])
+async def analytics_by_day(
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    user_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+    admin: dict = Depends(get_current_admin),
+):
+    # Defaults to the last 30 days
+    until = until or datetime.now(IST).date()
+    since = since or until - timedelta(days=29)
+    return await db.run_sync(usage_by_day, since, until, user_id)
+
+@router.post("/analytics/rebuild")
+async def rebuild_analytics(db: AsyncSession = Depends(get_db), admin: dict = Depends(get_current_admin)):
+    # Recomputes every total from documents and versions; writers wait until it commits
+    return await db.run_sync(rebuild_usage)
+
+# -------------------------
+# Storage backend statistics
+# -------------------------
+@router.get("/storage/stats")
+async def storage_stats(admin: dict = Depends(get_current_admin)):
+    return storage.stats()
+
+# -------------------------
+# Content extraction statistics
+# -------------------------
+@router.get("/extraction/stats")
+async def content_extraction_stats(admin: dict = Depends(get_current_admin)):
+    return extraction_stats()
+
+# -------------------------
+# Database connection pool statistics
+# -------------------------
+@router.get("/db/pool")
+async def db_pool_stats(admin: dict = Depends(get_current_admin)):
+    return pool_stats()
+
+# -------------------------
+# Log queue statistics
+# -------------------------
+@router.get("/logging/stats")
+async def log_queue_stats(admin: dict = Depends(get_current_admin)):
+    return logging_stats()
+
+# -------------------------
+# Token cache / revocation / password hashing statistics
+# -------------------------
+@router.get("/auth/stats")
+async def token_auth_stats(admin: dict = Depends(get_current_admin)):
+    return {**auth_stats(), "passwords": password_stats(), "last_login": last_login_writer.stats()}
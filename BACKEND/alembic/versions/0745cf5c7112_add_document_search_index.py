@@ -0,0 +1,61 @@
+"""Add full-text search index over document filename/description
+
+Revision ID: 0745cf5c7112
+Revises: 5407ecfdd162
+Create Date: 2026-10-18 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0745cf5c7112'
+down_revision = '5407ecfdd162'
+branch_labels = None
+depends_on = None
+
+# Frozen copies of search.py's DDL at this revision; later edits there need their own migration.
+# The index expression must stay identical to the one search.py queries with.
+PG_INDEX_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_documents_search ON documents USING gin (("
+    "setweight(to_tsvector('simple', regexp_replace(coalesce(filename, ''), '[^[:alnum:]]+', ' ', 'g')), 'A') || "
+    "setweight(to_tsvector('simple', regexp_replace(coalesce(description, ''), '[^[:alnum:]]+', ' ', 'g')), 'B')))",
+]
+
+SQLITE_INDEX_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+        filename, description, content='documents', content_rowid='id', tokenize='unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS documents_fts_ai AFTER INSERT ON documents BEGIN
+        INSERT INTO documents_fts(rowid, filename, description)
+        VALUES (new.id, new.filename, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS documents_fts_ad AFTER DELETE ON documents BEGIN
+        INSERT INTO documents_fts(documents_fts, rowid, filename, description)
+        VALUES ('delete', old.id, old.filename, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS documents_fts_au AFTER UPDATE OF filename, description ON documents BEGIN
+        INSERT INTO documents_fts(documents_fts, rowid, filename, description)
+        VALUES ('delete', old.id, old.filename, old.description);
+        INSERT INTO documents_fts(rowid, filename, description)
+        VALUES (new.id, new.filename, new.description);
+    END""",
+    "INSERT INTO documents_fts(documents_fts) VALUES ('rebuild')",
+]
+
+
+def upgrade() -> None:
+    """GIN tsvector index on PostgreSQL; FTS5 table + triggers on SQLite."""
+    dialect = op.get_bind().dialect.name
+    for statement in PG_INDEX_DDL if dialect == 'postgresql' else SQLITE_INDEX_DDL if dialect == 'sqlite' else []:
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    """Drop the search index."""
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_documents_search')
+    else:
+        for trigger in ('documents_fts_ai', 'documents_fts_ad', 'documents_fts_au'):
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        op.execute('DROP TABLE IF EXISTS documents_fts')
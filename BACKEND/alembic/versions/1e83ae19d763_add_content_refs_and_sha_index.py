@@ -0,0 +1,50 @@
+"""Add content_refs table and document hash/CID indexes
+
+Revision ID: 1e83ae19d763
+Revises: 0093f85f5fdc
+Create Date: 2026-10-18 09:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '1e83ae19d763'
+down_revision = '0093f85f5fdc'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Create content_refs, backfill it from documents, and index sha256/cid."""
+    op.create_index('ix_documents_sha256', 'documents', ['sha256'])
+    op.create_index('ix_documents_cid', 'documents', ['cid'])
+
+    op.create_table(
+        'content_refs',
+        sa.Column('cid', sa.String(), primary_key=True),
+        sa.Column('sha256', sa.String(), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=True),
+        sa.Column('refcount', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('createdtime', sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index('ix_content_refs_sha256', 'content_refs', ['sha256'])
+
+    # One ref per existing document row pointing at the CID
+    op.execute(
+        """
+        INSERT INTO content_refs (cid, sha256, size, refcount, createdtime)
+        SELECT cid, MIN(sha256), MAX(size), COUNT(*), MIN(uploadedtime)
+        FROM documents
+        WHERE cid IS NOT NULL
+        GROUP BY cid
+        """
+    )
+
+
+def downgrade() -> None:
+    """Drop content_refs and the document hash/CID indexes."""
+    op.drop_index('ix_content_refs_sha256', table_name='content_refs')
+    op.drop_table('content_refs')
+    op.drop_index('ix_documents_cid', table_name='documents')
+    op.drop_index('ix_documents_sha256', table_name='documents')
@@ -0,0 +1,31 @@
+"""Add content_missing flags
+
+Revision ID: 4b8e2d7c9f15
+Revises: 7d2f9a6c1b83
+Create Date: 2026-10-18 16:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '4b8e2d7c9f15'
+down_revision = '7d2f9a6c1b83'
+branch_labels = None
+depends_on = None
+
+TABLES = ['documents', 'document_versions']
+
+
+def upgrade() -> None:
+    """Add content_missing to documents and document_versions."""
+    for table in TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('content_missing', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+
+def downgrade() -> None:
+    """Drop content_missing."""
+    for table in TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('content_missing')
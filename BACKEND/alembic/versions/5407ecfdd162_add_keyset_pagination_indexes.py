@@ -0,0 +1,27 @@
+"""Add keyset pagination indexes on documents
+
+Revision ID: 5407ecfdd162
+Revises: 5a890f8888f4
+Create Date: 2026-10-18 11:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '5407ecfdd162'
+down_revision = '5a890f8888f4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Index (uploaded_by, uploadedtime, id) and (uploadedtime, id) for cursor listing."""
+    op.create_index('ix_documents_owner_uploadedtime_id', 'documents', ['uploaded_by', 'uploadedtime', 'id'])
+    op.create_index('ix_documents_uploadedtime_id', 'documents', ['uploadedtime', 'id'])
+
+
+def downgrade() -> None:
+    """Drop the keyset pagination indexes."""
+    op.drop_index('ix_documents_uploadedtime_id', table_name='documents')
+    op.drop_index('ix_documents_owner_uploadedtime_id', table_name='documents')
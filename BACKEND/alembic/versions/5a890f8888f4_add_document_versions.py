@@ -0,0 +1,50 @@
+"""Add document_versions table
+
+Revision ID: 5a890f8888f4
+Revises: 1e83ae19d763
+Create Date: 2026-10-18 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '5a890f8888f4'
+down_revision = '1e83ae19d763'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Create document_versions and seed it with each document's current version."""
+    op.create_table(
+        'document_versions',
+        sa.Column('document_id', sa.Integer(), sa.ForeignKey('documents.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('version', sa.Integer(), primary_key=True),
+        sa.Column('filename', sa.String(), nullable=False),
+        sa.Column('filetype', sa.String(), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=True),
+        sa.Column('cid', sa.String(), nullable=False),
+        sa.Column('sha256', sa.String(), nullable=False),
+        sa.Column('uploadedtime', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('uploaded_by', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+    )
+    op.create_index('ix_document_versions_cid', 'document_versions', ['cid'])
+    op.create_index('ix_documents_owner_filename', 'documents', ['uploaded_by', 'filename'])
+
+    op.execute(
+        """
+        INSERT INTO document_versions
+            (document_id, version, filename, filetype, size, cid, sha256, uploadedtime, uploaded_by)
+        SELECT id, COALESCE(version, 1), filename, filetype, size, cid, sha256, uploadedtime, uploaded_by
+        FROM documents
+        WHERE cid IS NOT NULL
+        """
+    )
+
+
+def downgrade() -> None:
+    """Drop document_versions."""
+    op.drop_index('ix_documents_owner_filename', table_name='documents')
+    op.drop_index('ix_document_versions_cid', table_name='document_versions')
+    op.drop_table('document_versions')
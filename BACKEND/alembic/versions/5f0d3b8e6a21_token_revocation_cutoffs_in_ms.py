@@ -0,0 +1,26 @@
+"""Store token revocation cutoffs in milliseconds
+
+Revision ID: 5f0d3b8e6a21
+Revises: e2a7c5d19b34
+Create Date: 2026-10-18 21:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '5f0d3b8e6a21'
+down_revision = 'e2a7c5d19b34'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """issued_before: inclusive epoch seconds -> exclusive epoch milliseconds."""
+    # A cutoff of second s covered tokens with iat <= s, i.e. issued before (s + 1) * 1000 ms
+    op.execute('UPDATE token_revocations SET issued_before = (issued_before + 1) * 1000 WHERE issued_before IS NOT NULL')
+
+
+def downgrade() -> None:
+    """issued_before back to inclusive epoch seconds (rounded so nothing revoked becomes valid)."""
+    op.execute('UPDATE token_revocations SET issued_before = (issued_before + 999) / 1000 - 1 WHERE issued_before IS NOT NULL')
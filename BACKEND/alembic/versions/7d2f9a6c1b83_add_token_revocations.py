@@ -0,0 +1,36 @@
+"""Add token revocations
+
+Revision ID: 7d2f9a6c1b83
+Revises: c3b1e0f4a2d6
+Create Date: 2026-10-18 15:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '7d2f9a6c1b83'
+down_revision = 'c3b1e0f4a2d6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Create token_revocations."""
+    op.create_table(
+        'token_revocations',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('jti', sa.String(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('issued_before', sa.BigInteger(), nullable=True),
+        sa.Column('expires_at', sa.BigInteger(), nullable=False),
+    )
+    op.create_index('ix_token_revocations_id', 'token_revocations', ['id'])
+    op.create_index('ix_token_revocations_expires_at', 'token_revocations', ['expires_at'])
+
+
+def downgrade() -> None:
+    """Drop token_revocations."""
+    op.drop_index('ix_token_revocations_expires_at', table_name='token_revocations')
+    op.drop_index('ix_token_revocations_id', table_name='token_revocations')
+    op.drop_table('token_revocations')
@@ -0,0 +1,87 @@
+"""Add storage usage summary tables
+
+Revision ID: 8c41f6a2d0e9
+Revises: 4b8e2d7c9f15
+Create Date: 2026-10-18 18:00:00
+
+"""
+from collections import defaultdict
+from datetime import timedelta, timezone
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '8c41f6a2d0e9'
+down_revision = '4b8e2d7c9f15'
+branch_labels = None
+depends_on = None
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+
+def upgrade() -> None:
+    """Create storage_usage/storage_usage_daily and fill them from the existing rows."""
+    usage = op.create_table(
+        'storage_usage',
+        sa.Column('user_id', sa.Integer(), primary_key=True),
+        sa.Column('filetype', sa.String(), primary_key=True),
+        sa.Column('files', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('bytes', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('deleted_files', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('deleted_bytes', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('versions', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('version_bytes', sa.BigInteger(), nullable=False, server_default='0'),
+    )
+    daily = op.create_table(
+        'storage_usage_daily',
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), primary_key=True),
+        sa.Column('versions', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('bytes', sa.BigInteger(), nullable=False, server_default='0'),
+    )
+    op.create_index('ix_storage_usage_daily_user_id', 'storage_usage_daily', ['user_id'])
+
+    # Same grouping as storage_usage.rebuild(), so incremental updates start from correct totals
+    conn = op.get_bind()
+    totals = defaultdict(lambda: dict.fromkeys(['files', 'bytes', 'deleted_files', 'deleted_bytes', 'versions', 'version_bytes'], 0))
+    days = defaultdict(lambda: {'versions': 0, 'bytes': 0})
+    heads = conn.execute(sa.text(
+        "SELECT uploaded_by, filetype, deleted, COUNT(*), SUM(size) FROM documents GROUP BY uploaded_by, filetype, deleted"
+    ))
+    for user_id, filetype, deleted, count, size in heads:
+        row = totals[(user_id or 0, filetype)]
+        prefix = 'deleted_' if deleted else ''
+        row[prefix + 'files'] += count
+        row[prefix + 'bytes'] += size or 0
+    # Typed columns, so uploadedtime comes back as a datetime on every dialect
+    version_rows = sa.table(
+        'document_versions',
+        sa.column('uploaded_by', sa.Integer()),
+        sa.column('filetype', sa.String()),
+        sa.column('size', sa.BigInteger()),
+        sa.column('uploadedtime', sa.DateTime(timezone=True)),
+    )
+    versions = conn.execute(sa.select(*version_rows.c))
+    for user_id, filetype, size, uploadedtime in versions:
+        row = totals[(user_id or 0, filetype)]
+        row['versions'] += 1
+        row['version_bytes'] += size or 0
+        if uploadedtime is None:
+            continue
+        if uploadedtime.tzinfo is not None:
+            uploadedtime = uploadedtime.astimezone(IST)
+        row = days[(uploadedtime.date(), user_id or 0)]
+        row['versions'] += 1
+        row['bytes'] += size or 0
+
+    if totals:
+        op.bulk_insert(usage, [{'user_id': u, 'filetype': t, **v} for (u, t), v in totals.items()])
+    if days:
+        op.bulk_insert(daily, [{'day': d, 'user_id': u, **v} for (d, u), v in days.items()])
+
+
+def downgrade() -> None:
+    """Drop the storage usage tables."""
+    op.drop_index('ix_storage_usage_daily_user_id', table_name='storage_usage_daily')
+    op.drop_table('storage_usage_daily')
+    op.drop_table('storage_usage')
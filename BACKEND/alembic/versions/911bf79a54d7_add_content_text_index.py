@@ -0,0 +1,41 @@
+"""Add extracted content text and inverted index tables
+
+Revision ID: 911bf79a54d7
+Revises: 0745cf5c7112
+Create Date: 2026-10-18 13:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '911bf79a54d7'
+down_revision = '0745cf5c7112'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Create document_texts and content_postings."""
+    op.create_table(
+        'document_texts',
+        sa.Column('sha256', sa.String(), primary_key=True),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('text', sa.Text(), nullable=True),
+        sa.Column('error', sa.String(), nullable=True),
+        sa.Column('extractedtime', sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_table(
+        'content_postings',
+        sa.Column('token', sa.String(), primary_key=True),
+        sa.Column('sha256', sa.String(), primary_key=True),
+        sa.Column('tf', sa.Integer(), nullable=False),
+    )
+    op.create_index('ix_content_postings_sha256', 'content_postings', ['sha256'])
+
+
+def downgrade() -> None:
+    """Drop the content text tables."""
+    op.drop_index('ix_content_postings_sha256', table_name='content_postings')
+    op.drop_table('content_postings')
+    op.drop_table('document_texts')
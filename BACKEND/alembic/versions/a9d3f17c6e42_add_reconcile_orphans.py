@@ -0,0 +1,32 @@
+"""Add reconcile_orphans
+
+Revision ID: a9d3f17c6e42
+Revises: 5f0d3b8e6a21
+Create Date: 2026-10-18 22:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'a9d3f17c6e42'
+down_revision = '5f0d3b8e6a21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Create reconcile_orphans (orphans waiting out the grace period)."""
+    op.create_table(
+        'reconcile_orphans',
+        sa.Column('cid', sa.String(), primary_key=True),
+        sa.Column('first_seen', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('last_seen', sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index('ix_reconcile_orphans_last_seen', 'reconcile_orphans', ['last_seen'])
+
+
+def downgrade() -> None:
+    """Drop reconcile_orphans."""
+    op.drop_index('ix_reconcile_orphans_last_seen', table_name='reconcile_orphans')
+    op.drop_table('reconcile_orphans')
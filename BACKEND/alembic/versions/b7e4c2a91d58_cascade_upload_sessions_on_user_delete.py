@@ -0,0 +1,33 @@
+"""Delete upload sessions along with their user
+
+Revision ID: b7e4c2a91d58
+Revises: a9d3f17c6e42
+Create Date: 2026-10-18 23:00:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'b7e4c2a91d58'
+down_revision = 'a9d3f17c6e42'
+branch_labels = None
+depends_on = None
+
+FK_NAME = 'upload_sessions_user_id_fkey'
+
+
+def upgrade() -> None:
+    """upload_sessions.user_id: ON DELETE CASCADE."""
+    # SQLite does not enforce foreign keys here (no PRAGMA foreign_keys), so only PostgreSQL changes
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_constraint(FK_NAME, 'upload_sessions', type_='foreignkey')
+    op.create_foreign_key(FK_NAME, 'upload_sessions', 'users', ['user_id'], ['id'], ondelete='CASCADE')
+
+
+def downgrade() -> None:
+    """upload_sessions.user_id back to a plain foreign key."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_constraint(FK_NAME, 'upload_sessions', type_='foreignkey')
+    op.create_foreign_key(FK_NAME, 'upload_sessions', 'users', ['user_id'], ['id'])
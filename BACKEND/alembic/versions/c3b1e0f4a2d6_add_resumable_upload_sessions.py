@@ -0,0 +1,55 @@
+"""Add resumable upload sessions and widen size columns
+
+Revision ID: c3b1e0f4a2d6
+Revises: 911bf79a54d7
+Create Date: 2026-10-18 14:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'c3b1e0f4a2d6'
+down_revision = '911bf79a54d7'
+branch_labels = None
+depends_on = None
+
+SIZE_COLUMNS = [('documents', 'size'), ('document_versions', 'size'), ('content_refs', 'size')]
+
+
+def upgrade() -> None:
+    """Create upload_sessions/upload_chunks and make file sizes 64-bit."""
+    for table, column in SIZE_COLUMNS:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column(column, type_=sa.BigInteger(), existing_type=sa.Integer(), existing_nullable=True)
+
+    op.create_table(
+        'upload_sessions',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('filename', sa.String(), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=False),
+        sa.Column('expected_sha256', sa.String(), nullable=True),
+        sa.Column('status', sa.String(), nullable=False, server_default='open'),
+        sa.Column('document_id', sa.Integer(), sa.ForeignKey('documents.id', ondelete='SET NULL'), nullable=True),
+        sa.Column('createdtime', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('updatedtime', sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index('ix_upload_sessions_user_id', 'upload_sessions', ['user_id'])
+    op.create_table(
+        'upload_chunks',
+        sa.Column('session_id', sa.String(), sa.ForeignKey('upload_sessions.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('offset', sa.BigInteger(), primary_key=True),
+        sa.Column('length', sa.Integer(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    """Drop the upload session tables and restore 32-bit sizes."""
+    op.drop_table('upload_chunks')
+    op.drop_index('ix_upload_sessions_user_id', table_name='upload_sessions')
+    op.drop_table('upload_sessions')
+
+    for table, column in SIZE_COLUMNS:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column(column, type_=sa.Integer(), existing_type=sa.BigInteger(), existing_nullable=True)
@@ -0,0 +1,27 @@
+"""Add chunk_writes to upload sessions
+
+Revision ID: e2a7c5d19b34
+Revises: 8c41f6a2d0e9
+Create Date: 2026-10-18 20:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'e2a7c5d19b34'
+down_revision = '8c41f6a2d0e9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Add upload_sessions.chunk_writes."""
+    with op.batch_alter_table('upload_sessions') as batch_op:
+        batch_op.add_column(sa.Column('chunk_writes', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    """Drop upload_sessions.chunk_writes."""
+    with op.batch_alter_table('upload_sessions') as batch_op:
+        batch_op.drop_column('chunk_writes')
@@ -0,0 +1,206 @@
+# app_logging.py
+import os
+import sys
+import json
+import copy
+import uuid
+import queue
+import atexit
+import logging
+import threading
+import contextvars
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from dotenv import load_dotenv
+
+# -------------------------
+# Config
+# -------------------------
+load_dotenv()
+# Level of this application's loggers...
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# ...and of third-party libraries (SQLAlchemy, httpx, aiosqlite, ...)
+LOG_LIBRARY_LEVEL = os.getenv("LOG_LIBRARY_LEVEL", "WARNING").upper()
+# "json" (one object per line) or "text"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# Records waiting for the writer thread; beyond this they are dropped, never waited on
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Fraction of DEBUG records kept, per call site (1 = all, 0 = none)
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.1"))
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# Correlation id of the request being handled; "-" outside requests
+request_id_var = contextvars.ContextVar("request_id", default="-")
+
+# Attributes every LogRecord has; anything else came from `extra=`
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id", "sample_rate"}
+
+
+# -------------------------
+# Filters (run in the calling thread, before the record is queued)
+# -------------------------
+class RequestContextFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class DebugSampler(logging.Filter):
+    """Keep 1 in N DEBUG records from each call site; other levels always pass"""
+
+    def __init__(self, rate: float = LOG_DEBUG_SAMPLE_RATE):
+        super().__init__()
+        self.every = max(round(1 / rate), 1) if rate > 0 else 0
+        self._counts = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.every == 1:
+            return True
+        if self.every == 0:
+            return False
+        site = (record.name, record.lineno)
+        seen = self._counts.get(site, 0)
+        self._counts[site] = seen + 1
+        if seen % self.every:
+            return False
+        record.sample_rate = 1 / self.every
+        return True
+
+
+# -------------------------
+# Non-blocking handler
+# -------------------------
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops (and counts) records when the queue is full"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Render message and traceback now, but leave formatting to the listener
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# -------------------------
+# Formatters
+# -------------------------
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        if hasattr(record, "sample_rate"):
+            entry["sample_rate"] = record.sample_rate
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+TEXT_FORMAT = "%(asctime)s %(levelname)-7s %(name)s [%(request_id)s] %(message)s"
+
+
+# -------------------------
+# Setup
+# -------------------------
+_lock = threading.Lock()
+_handler = None
+_listener = None
+
+
+def configure():
+    """Route the root logger through the queue; safe to call more than once"""
+    global _handler, _listener
+    with _lock:
+        if _handler is not None:
+            return
+
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        _handler = DroppingQueueHandler(log_queue)
+        _handler.addFilter(RequestContextFilter())
+        _handler.addFilter(DebugSampler())
+
+        root = logging.getLogger()
+        root.setLevel(LOG_LIBRARY_LEVEL)
+        root.addHandler(_handler)
+
+        _listener = QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+        # Flush whatever is still queued on shutdown
+        atexit.register(_listener.stop)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger for an application module, at LOG_LEVEL"""
+    configure()
+    logger = logging.getLogger(name)
+    logger.setLevel(LOG_LEVEL)
+    return logger
+
+
+def logging_stats() -> dict:
+    return {
+        "level": LOG_LEVEL,
+        "library_level": LOG_LIBRARY_LEVEL,
+        "format": LOG_FORMAT,
+        "queued": _handler.queue.qsize() if _handler else 0,
+        "queue_size": LOG_QUEUE_SIZE,
+        "dropped": _handler.dropped if _handler else 0,
+        "debug_sample_rate": LOG_DEBUG_SAMPLE_RATE,
+    }
+
+
+# -------------------------
+# Correlation id middleware
+# -------------------------
+class RequestIdMiddleware:
+    """
+    Plain ASGI middleware: takes the caller's X-Request-ID (or makes one),
+    exposes it to every log record of the request and echoes it back.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:128]
+                break
+        request_id = request_id or uuid.uuid4().hex
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id_var.reset(token)
@@ -1,40 +1,275 @@
-from passlib.context import CryptContext
-from jose import JWTError, jwt
-from datetime import datetime, timedelta
-from typing import Optional
+# auth.py
 import os
+import time
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+import jwt
 from dotenv import load_dotenv
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import delete, select, event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models import TokenRevocation
+from app_logging import get_logger
+
+logger = get_logger(__name__)
 
-# Load .env file variables
+# -------------------------
+# JWT Config
+# -------------------------
 load_dotenv()
+SECRET_KEY = os.getenv("JWT_SECRET_KEY", "supersecretkey")
+ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
+# Verified tokens kept in memory per worker
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+# How often each worker pulls revocations made by the other workers
+AUTH_REVOCATION_SYNC_SECONDS = float(os.getenv("AUTH_REVOCATION_SYNC_SECONDS", "15"))
 
-# Secret key and algorithm for JWT
-SECRET_KEY = os.getenv("SECRET_KEY")  # must match .env key name
-ALGORITHM = os.getenv("ALGORITHM")
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ATEXPIRE"))
+security = HTTPBearer()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+def create_access_token(data: dict, expires_delta: timedelta = None) -> str:
+    """Signed token; `jti` and `iat_ms` let a single token or all of a user's tokens be revoked"""
+    now = datetime.now(timezone.utc)
+    to_encode = data.copy()
+    to_encode.update({
+        "exp": now + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)),
+        "iat": now,
+        # `iat` is whole seconds; a login in the same second as a revocation must stay distinguishable
+        "iat_ms": int(now.timestamp() * 1000),
+        "jti": uuid.uuid4().hex,
+    })
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
 
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
-    
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+# -------------------------
+# Verified-token cache
+# -------------------------
+class TokenCache:
+    """
+    Decoded payloads of tokens whose signature already checked out, keyed
+    by the token's SHA256 and evicted least-recently-used. Entries are
+    dropped once their `exp` passes, so expiry is enforced exactly as
+    jwt.decode() would.
+    """
+
+    def __init__(self, max_size: int = AUTH_TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None and payload["exp"] <= time.time():
+                del self._entries[key]
+                payload = None
+            if payload is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def put(self, key: str, payload: dict):
+        with self._lock:
+            self._entries[key] = payload
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# -------------------------
+# Revocation list
+# -------------------------
+class RevocationList:
+    """
+    Revoked token ids and per-user cutoffs held in memory, so the check
+    costs a dict lookup. Revocations are written to token_revocations and
+    a background thread pulls new rows every AUTH_REVOCATION_SYNC_SECONDS,
+    which is how other workers learn about them. The worker that made a
+    revocation applies it once its transaction commits (see the session
+    hooks below), so a failed commit revokes nothing anywhere.
+    """
+
+    def __init__(self, interval: float = AUTH_REVOCATION_SYNC_SECONDS):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread = None
+        self._tokens = {}  # jti -> expires_at (epoch seconds)
+        self._users = {}   # user_id -> (tokens issued before, in epoch ms; expires_at)
+        self._last_id = 0
+        self.last_sync_at = None
+        self.sync_errors = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="auth-revocations", daemon=True)
+                self._thread.start()
+                logger.info("Revocation sync started")
+
+    def is_revoked(self, payload: dict) -> bool:
+        jti = payload.get("jti")
+        if jti is not None and jti in self._tokens:
+            return True
+        cutoff = self._users.get(payload.get("user_id"))
+        if cutoff is None:
+            return False
+        issued = payload.get("iat_ms")
+        if issued is None:
+            # Tokens from before iat_ms: the start of their second, so same-second ones count as revoked
+            issued = payload.get("iat", 0) * 1000
+        return issued < cutoff[0]
+
+    def _apply(self, entry: tuple):
+        jti, user_id, issued_before, expires_at = entry
+        with self._lock:
+            if jti:
+                self._tokens[jti] = expires_at
+            if user_id is not None:
+                previous = self._users.get(user_id)
+                if previous is None or issued_before > previous[0]:
+                    self._users[user_id] = (issued_before, expires_at)
+
+    @staticmethod
+    def _record(db, row: TokenRevocation):
+        db.add(row)
+        # Plain values: the row itself is expired by the time the commit hook runs
+        session = getattr(db, "sync_session", db)
+        session.info.setdefault(PENDING_KEY, []).append((row.jti, row.user_id, row.issued_before, row.expires_at))
+
+    def revoke_token(self, db: AsyncSession, payload: dict):
+        """Revoke one token (logout). Takes effect once the caller commits."""
+        self._record(db, TokenRevocation(jti=payload["jti"], expires_at=int(payload["exp"])))
+
+    def revoke_user(self, db: AsyncSession, user_id: int):
+        """Revoke every token issued to `user_id` so far. Takes effect once the caller commits."""
+        now = time.time()
+        self._record(db, TokenRevocation(
+            user_id=user_id,
+            # Exclusive bound just past this millisecond, so tokens issued in it are covered
+            issued_before=int(now * 1000) + 1,
+            # No token issued before now outlives this
+            expires_at=int(now) + ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        ))
+        logger.info("Sessions revoked for user %s", user_id)
+
+    def sync(self):
+        """Load revocations recorded since the last sync and forget expired ones"""
+        now = int(time.time())
+        db = SessionLocal()
+        try:
+            rows = db.scalars(
+                select(TokenRevocation).where(TokenRevocation.id > self._last_id).order_by(TokenRevocation.id)
+            ).all()
+            for row in rows:
+                self._apply((row.jti, row.user_id, row.issued_before, row.expires_at))
+                self._last_id = row.id
+            db.execute(delete(TokenRevocation).where(TokenRevocation.expires_at < now))
+            db.commit()
+        finally:
+            db.close()
 
+        with self._lock:
+            self._tokens = {jti: exp for jti, exp in self._tokens.items() if exp >= now}
+            self._users = {uid: cutoff for uid, cutoff in self._users.items() if cutoff[1] >= now}
+        self.last_sync_at = datetime.now(timezone.utc).isoformat()
+
+    def _run(self):
+        while True:
+            try:
+                self.sync()
+            except Exception as e:
+                self.sync_errors += 1
+                logger.warning("Revocation sync failed: %s", e)
+            time.sleep(self.interval)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "revoked_tokens": len(self._tokens),
+                "revoked_users": len(self._users),
+                "sync_interval_seconds": self.interval,
+                "last_sync_at": self.last_sync_at,
+                "sync_errors": self.sync_errors,
+            }
+
+
+token_cache = TokenCache()
+revocations = RevocationList()
+
+# Revocations recorded in a session, waiting for its transaction to commit
+PENDING_KEY = "pending_revocations"
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_committed_revocations(session):
+    for entry in session.info.pop(PENDING_KEY, ()):
+        revocations._apply(entry)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _drop_rolled_back_revocations(session, transaction):
+    # After a commit the list is already gone; what is left was rolled back.
+    # Savepoints ending do not count: their outer transaction may still commit.
+    if transaction.parent is None:
+        session.info.pop(PENDING_KEY, None)
+
+
+# -------------------------
+# FastAPI dependencies
+# -------------------------
 def verify_token(token: str) -> dict:
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except JWTError:
-        raise Exception("Invalid token or expired token")
+    """Payload of a valid, unexpired, unrevoked token; raises 401 otherwise"""
+    revocations.start()
+    key = hashlib.sha256(token.encode()).hexdigest()
+    payload = token_cache.get(key)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options={"require": ["exp"]})
+        except jwt.ExpiredSignatureError:
+            raise HTTPException(status_code=401, detail="Token has expired")
+        except jwt.InvalidTokenError:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        token_cache.put(key, payload)
+
+    if revocations.is_revoked(payload):
+        raise HTTPException(status_code=401, detail="Token has been revoked")
+    return payload
+
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    return verify_token(credentials.credentials)
+
+
+async def get_current_admin(payload: dict = Depends(get_current_user)) -> dict:
+    if payload.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin privileges required")
+    return payload
+
+
+def auth_stats() -> dict:
+    return {"token_cache": token_cache.stats(), "revocations": revocations.stats()}
@@ -0,0 +1,160 @@
+# benchmarks/fake_ipfs.py
+import json
+import time
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+CHUNK_SIZE = 1024 * 1024
+
+
+# -------------------------
+# In-memory node
+# -------------------------
+class FakeNode:
+    """
+    Blocks and pins held in memory. CIDs are derived from the SHA256 of the
+    content, so identical uploads get identical CIDs as on a real node.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.blocks = {}  # cid -> bytes
+        self.pins = set()
+
+    @staticmethod
+    def cid_for(data: bytes) -> str:
+        return "Qm" + hashlib.sha256(data).hexdigest()[:44]
+
+    def add(self, data: bytes, pin: bool) -> str:
+        cid = self.cid_for(data)
+        with self.lock:
+            self.blocks[cid] = data
+            if pin:
+                self.pins.add(cid)
+        return cid
+
+    def gc(self) -> list:
+        with self.lock:
+            removed = [cid for cid in self.blocks if cid not in self.pins]
+            for cid in removed:
+                del self.blocks[cid]
+        return removed
+
+
+def _read_body(handler) -> bytes:
+    if handler.headers.get("Transfer-Encoding", "").lower() == "chunked":
+        body = bytearray()
+        while True:
+            size = int(handler.rfile.readline().strip().split(b";")[0], 16)
+            if size == 0:
+                handler.rfile.readline()
+                return bytes(body)
+            body += handler.rfile.read(size)
+            handler.rfile.readline()
+    return handler.rfile.read(int(handler.headers.get("Content-Length", 0)))
+
+
+def _multipart_file(body: bytes, content_type: str) -> bytes:
+    boundary = content_type.split("boundary=", 1)[1].strip('"').encode()
+    part = body.split(b"--" + boundary)[1]
+    return part.split(b"\r\n\r\n", 1)[1][:-2]
+
+
+# -------------------------
+# Kubo RPC subset (/api/v0)
+# -------------------------
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Small chunked writes would otherwise stall on Nagle + delayed ACK (~40 ms)
+    disable_nagle_algorithm = True
+    node: FakeNode = None
+    latency: float = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, message: str):
+        self._send(status, json.dumps({"Message": message, "Code": 0, "Type": "error"}).encode())
+
+    def _stream(self, chunks, content_type: str):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for chunk in chunks:
+            if chunk:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        body = _read_body(self)
+        endpoint = url.path[len("/api/v0/"):]
+        if self.latency:
+            time.sleep(self.latency)
+
+        if endpoint == "add":
+            data = _multipart_file(body, self.headers["Content-Type"])
+            cid = self.node.add(data, params.get("pin", ["true"])[0] == "true")
+            self._send(200, json.dumps({"Name": "file", "Hash": cid, "Size": str(len(data))}).encode() + b"\n")
+        elif endpoint == "cat":
+            data = self.node.blocks.get(params["arg"][0])
+            if data is None:
+                return self._error(500, "block was not found locally (offline)")
+            offset = int(params.get("offset", ["0"])[0])
+            length = params.get("length")
+            data = data[offset:offset + int(length[0])] if length else data[offset:]
+            view = memoryview(data)
+            self._stream((view[i:i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE)), "text/plain")
+        elif endpoint == "pin/rm":
+            with self.node.lock:
+                missing = [cid for cid in params["arg"] if cid not in self.node.pins]
+                if missing:
+                    return self._error(500, f"{missing[0]} is not pinned")
+                self.node.pins.difference_update(params["arg"])
+            self._send(200, json.dumps({"Pins": params["arg"]}).encode())
+        elif endpoint == "pin/ls":
+            with self.node.lock:
+                pins = sorted(self.node.pins)
+            if "arg" in params:
+                missing = [cid for cid in params["arg"] if cid not in pins]
+                if missing:
+                    return self._error(500, f"path '{missing[0]}' is not pinned")
+                pins = params["arg"]
+            if params.get("stream", ["false"])[0] == "true":
+                self._stream((json.dumps({"Cid": cid, "Type": "recursive"}).encode() + b"\n" for cid in pins), "application/json")
+            else:
+                self._send(200, json.dumps({"Keys": {cid: {"Type": "recursive"} for cid in pins}}).encode())
+        elif endpoint == "files/stat":
+            cid = params["arg"][0].rsplit("/", 1)[-1]
+            data = self.node.blocks.get(cid)
+            if data is None:
+                return self._error(500, f"block {cid} was not found locally (offline)")
+            self._send(200, json.dumps({"Hash": cid, "Size": len(data), "CumulativeSize": len(data), "Type": "file"}).encode())
+        elif endpoint == "repo/gc":
+            removed = self.node.gc()
+            self._stream((json.dumps({"Key": {"/": cid}}).encode() + b"\n" for cid in removed), "application/json")
+        elif endpoint in ("version", "id"):
+            self._send(200, json.dumps({"Version": "fake-0.0.0", "ID": "fake"}).encode())
+        else:
+            self._error(404, f"unknown command {endpoint}")
+
+
+def start(port: int = 0, latency_ms: float = 0.0):
+    """Serve a fresh fake node on 127.0.0.1; returns (server, node, api_url)"""
+    node = FakeNode()
+    handler = type("Handler", (_Handler,), {"node": node, "latency": latency_ms / 1000})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-ipfs", daemon=True).start()
+    return server, node, f"http://127.0.0.1:{server.server_address[1]}"
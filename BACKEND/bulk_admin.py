@@ -0,0 +1,246 @@
+# bulk_admin.py
+import os
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Dict, List, Literal, Optional
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from pydantic import BaseModel
+from sqlalchemy import select, update, delete
+from sqlalchemy.orm import Session
+from models import User, Document
+from content_refs import release_refs, unpin_orphans
+from versions import purge_documents
+from storage_usage import track_flagged, track_owners_flagged
+from auth import revocations
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+# -------------------------
+# Config
+# -------------------------
+load_dotenv()
+# IDs per statement and transaction; keeps row locks short on big batches
+ADMIN_BULK_CHUNK_SIZE = int(os.getenv("ADMIN_BULK_CHUNK_SIZE", "500"))
+# Upper bound on the IDs one request may touch (explicit or matched by a filter)
+ADMIN_BULK_MAX_IDS = int(os.getenv("ADMIN_BULK_MAX_IDS", "100000"))
+
+
+# -------------------------
+# Schemas
+# -------------------------
+class FileFilter(BaseModel):
+    uploaded_by: Optional[List[int]] = None
+    deleted: Optional[bool] = None
+    filetype: Optional[str] = None
+    uploaded_before: Optional[datetime] = None
+    uploaded_after: Optional[datetime] = None
+
+
+class UserFilter(BaseModel):
+    role: Optional[str] = None
+    deleted: Optional[bool] = None
+    email_domain: Optional[str] = None
+    last_login_before: Optional[datetime] = None
+
+
+class BulkFileRequest(BaseModel):
+    action: Literal["soft_delete", "restore", "permanent_delete"]
+    ids: Optional[List[int]] = None
+    filter: Optional[FileFilter] = None
+
+
+class BulkUserRequest(BaseModel):
+    action: Literal["soft_delete", "restore", "promote", "demote", "revoke_sessions", "permanent_delete"]
+    ids: Optional[List[int]] = None
+    filter: Optional[UserFilter] = None
+
+
+# -------------------------
+# Target selection
+# -------------------------
+def _file_conditions(f: FileFilter) -> list:
+    conditions = []
+    if f.uploaded_by is not None:
+        conditions.append(Document.uploaded_by.in_(f.uploaded_by))
+    if f.deleted is not None:
+        conditions.append(Document.deleted == f.deleted)
+    if f.filetype is not None:
+        conditions.append(Document.filetype == f.filetype)
+    if f.uploaded_before is not None:
+        conditions.append(Document.uploadedtime < f.uploaded_before)
+    if f.uploaded_after is not None:
+        conditions.append(Document.uploadedtime >= f.uploaded_after)
+    return conditions
+
+
+def _user_conditions(f: UserFilter) -> list:
+    conditions = []
+    if f.role is not None:
+        conditions.append(User.role == f.role)
+    if f.deleted is not None:
+        conditions.append(User.deleted == f.deleted)
+    if f.email_domain is not None:
+        conditions.append(User.email.ilike("%@" + f.email_domain.lstrip("@")))
+    if f.last_login_before is not None:
+        conditions.append(User.last_login < f.last_login_before)
+    return conditions
+
+
+def resolve_ids(db: Session, id_column, ids: Optional[List[int]], conditions: list) -> List[int]:
+    """
+    The request's target IDs: the explicit list (order kept, duplicates
+    dropped), the rows matching the filter, or the listed IDs that also
+    match it when both are given.
+    """
+    if ids is None and not conditions:
+        raise HTTPException(status_code=400, detail="Provide ids or a non-empty filter")
+    if ids is not None:
+        ids = list(dict.fromkeys(ids))
+        if len(ids) > ADMIN_BULK_MAX_IDS:
+            raise HTTPException(status_code=400, detail=f"At most {ADMIN_BULK_MAX_IDS} ids per request")
+        if not conditions:
+            return ids
+
+    stmt = select(id_column).where(*conditions).order_by(id_column)
+    if ids is not None:
+        matched = set()
+        for chunk in _chunks(ids):
+            matched.update(db.scalars(stmt.where(id_column.in_(chunk))))
+        return [i for i in ids if i in matched]
+
+    matched = db.scalars(stmt.limit(ADMIN_BULK_MAX_IDS + 1)).all()
+    if len(matched) > ADMIN_BULK_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Filter matches more than {ADMIN_BULK_MAX_IDS} rows; narrow it")
+    return matched
+
+
+def _chunks(ids: List[int], size: int = ADMIN_BULK_CHUNK_SIZE):
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+# -------------------------
+# Chunked execution
+# -------------------------
+def _run_chunks(db: Session, model, ids: List[int], apply: Callable[[Session, List[int], List[str]], Dict[int, str]]) -> dict:
+    """
+    Run `apply` on each chunk of existing IDs in its own transaction.
+    `apply` returns {id: outcome} for the rows it changed or skipped and
+    adds CIDs that lost their last reference to the list it is given;
+    they are queued for unpinning only after the chunk commits. IDs with
+    no row are reported as not_found; a failed chunk is rolled back and
+    its IDs reported as failed.
+    """
+    outcomes = {}
+    unpins = 0
+    for chunk in _chunks(ids):
+        existing = set(db.scalars(select(model.id).where(model.id.in_(chunk))))
+        orphans = []
+        try:
+            changed = apply(db, [i for i in chunk if i in existing], orphans) if existing else {}
+            db.commit()
+        except Exception:
+            db.rollback()
+            logger.exception("Bulk chunk of %s ids failed", len(chunk))
+            outcomes.update({i: "failed" for i in chunk if i in existing})
+            outcomes.update({i: "not_found" for i in chunk if i not in existing})
+            continue
+        for i in chunk:
+            outcomes[i] = changed.get(i, "unchanged") if i in existing else "not_found"
+        # Unpins happen in the background, after the rows are gone for good
+        unpin_orphans(orphans)
+        unpins += len(orphans)
+
+    counts = Counter(outcomes.values())
+    return {
+        "requested": len(ids),
+        "counts": dict(counts),
+        "unpins_queued": unpins,
+        "results": [{"id": i, "outcome": outcomes[i]} for i in ids],
+    }
+
+
+def _set_flag(db: Session, model, ids: List[int], column, value, outcome: str, *extra) -> Dict[int, str]:
+    """UPDATE ... WHERE id IN (...) AND column IS DISTINCT FROM value RETURNING id, as one statement"""
+    changed = db.scalars(
+        update(model)
+        .where(model.id.in_(ids), column.is_distinct_from(value), *extra)
+        .values({column: value})
+        .returning(model.id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    return {i: outcome for i in changed}
+
+
+def _purge(db: Session, document_ids: List[int], orphans: List[str]):
+    orphans.extend(release_refs(db, purge_documents(db, document_ids)))
+
+
+# -------------------------
+# Files
+# -------------------------
+def bulk_files(db: Session, request: BulkFileRequest) -> dict:
+    conditions = _file_conditions(request.filter) if request.filter else []
+    ids = resolve_ids(db, Document.id, request.ids, conditions)
+
+    def apply(db: Session, chunk: List[int], orphans: List[str]) -> Dict[int, str]:
+        if request.action in ("soft_delete", "restore"):
+            deleted = request.action == "soft_delete"
+            changed = _set_flag(db, Document, chunk, Document.deleted, deleted, "soft_deleted" if deleted else "restored")
+            track_flagged(db, list(changed), deleted)
+            return changed
+        _purge(db, chunk, orphans)
+        return {i: "permanently_deleted" for i in chunk}
+
+    result = _run_chunks(db, Document, ids, apply)
+    logger.info("Bulk %s on %s files: %s", request.action, len(ids), result["counts"])
+    return {"action": request.action, **result}
+
+
+# -------------------------
+# Users
+# -------------------------
+def bulk_users(db: Session, request: BulkUserRequest, admin_id: int) -> dict:
+    conditions = _user_conditions(request.filter) if request.filter else []
+    ids = resolve_ids(db, User.id, request.ids, conditions)
+    # Never lock the caller out of the admin API by their own filter
+    protect_self = request.action in ("soft_delete", "demote", "revoke_sessions", "permanent_delete")
+
+    def apply(db: Session, chunk: List[int], orphans: List[str]) -> Dict[int, str]:
+        skipped = {}
+        if protect_self and admin_id in chunk:
+            skipped[admin_id] = "skipped_self"
+            chunk = [i for i in chunk if i != admin_id]
+        if not chunk:
+            return skipped
+
+        if request.action == "soft_delete":
+            changed = _set_flag(db, User, chunk, User.deleted, True, "soft_deleted")
+            db.execute(update(Document).where(Document.uploaded_by.in_(list(changed))).values(deleted=True))
+            track_owners_flagged(db, changed, True)
+        elif request.action == "restore":
+            changed = _set_flag(db, User, chunk, User.deleted, False, "restored")
+            db.execute(update(Document).where(Document.uploaded_by.in_(list(changed))).values(deleted=False))
+            track_owners_flagged(db, changed, False)
+        elif request.action == "promote":
+            changed = _set_flag(db, User, chunk, User.role, "admin", "promoted", User.deleted == False)
+        elif request.action == "demote":
+            changed = _set_flag(db, User, chunk, User.role, "user", "demoted", User.deleted == False)
+        elif request.action == "revoke_sessions":
+            changed = {i: "sessions_revoked" for i in chunk}
+        else:
+            _purge(db, db.scalars(select(Document.id).where(Document.uploaded_by.in_(chunk))).all(), orphans)
+            db.execute(delete(User).where(User.id.in_(chunk)))
+            changed = {i: "permanently_deleted" for i in chunk}
+
+        # Existing tokens carry the old role and stay valid for deleted users otherwise
+        if request.action in ("soft_delete", "demote", "revoke_sessions", "permanent_delete"):
+            for user_id in changed:
+                revocations.revoke_user(db, user_id)
+        return {**changed, **skipped}
+
+    result = _run_chunks(db, User, ids, apply)
+    logger.info("Bulk %s on %s users: %s", request.action, len(ids), result["counts"])
+    return {"action": request.action, **result}
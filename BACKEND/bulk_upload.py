@@ -0,0 +1,251 @@
+# bulk_upload.py
+import os
+import tarfile
+import zipfile
+import posixpath
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+from ingest import store_content_detached, INGEST_SPOOL_MAX_MEMORY
+from upload import record_document
+from extraction import schedule_extraction
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+# -------------------------
+# Config
+# -------------------------
+load_dotenv()
+# Hashing releases the GIL and IPFS adds are I/O, so threads scale with cores
+BULK_WORKERS = int(os.getenv("BULK_WORKERS", str(min(32, (os.cpu_count() or 1) * 2))))
+# Documents inserted per transaction
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "100"))
+BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES", "10000"))
+# Zip/tar bomb guards: what one request's archives may expand to, in total
+# and relative to the archive's own size (checked against member headers
+# before anything is read)
+BULK_MAX_UNCOMPRESSED_BYTES = int(os.getenv("BULK_MAX_UNCOMPRESSED_BYTES", str(10 * 1024 ** 3)))
+BULK_MAX_COMPRESSION_RATIO = float(os.getenv("BULK_MAX_COMPRESSION_RATIO", "100"))
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+# (filename, opener) where opener() returns a readable binary file object
+Entry = Tuple[str, Callable]
+
+
+class ArchiveLimitError(ValueError):
+    """An archive expands past the configured limits, or a member past its declared size"""
+
+
+# -------------------------
+# Archive expansion
+# -------------------------
+def is_archive(filename: str) -> bool:
+    return filename.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def safe_archive_name(name: str) -> str:
+    """Archive member path without leading slashes or parent references"""
+    parts = [p for p in posixpath.normpath(name.replace("\\", "/")).split("/") if p not in ("", ".", "..")]
+    return "/".join(parts)
+
+
+class _BoundedMember:
+    """Archive member stream that fails once it yields more bytes than its header declared"""
+
+    def __init__(self, source, name: str, declared: int):
+        self._source = source
+        self._name = name
+        self._declared = declared
+        self._read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._source.read(size)
+        self._read += len(chunk)
+        if self._read > self._declared:
+            raise ArchiveLimitError(f"{self._name} holds more than its declared {self._declared} bytes")
+        return chunk
+
+    def close(self):
+        self._source.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ExpansionBudget:
+    """Uncompressed bytes declared so far by one request's archives"""
+
+    def __init__(self, limit: Optional[int] = None, ratio: Optional[float] = None):
+        self.limit = BULK_MAX_UNCOMPRESSED_BYTES if limit is None else limit
+        self.ratio = BULK_MAX_COMPRESSION_RATIO if ratio is None else ratio
+        self.total = 0
+
+    def take(self, filename: str, declared: int, archive_expanded: int, archive_size: Optional[int]):
+        """Account for a member of `declared` bytes; `archive_expanded` includes it"""
+        self.total += declared
+        if self.total > self.limit:
+            raise ArchiveLimitError(f"Archives expand to more than {self.limit} bytes")
+        if archive_size and archive_expanded > archive_size * self.ratio:
+            raise ArchiveLimitError(f"{filename} expands more than {self.ratio:g}x its size")
+
+
+def _remaining_size(fileobj) -> Optional[int]:
+    """Bytes from the current position to the end, if the upload is seekable"""
+    try:
+        start = fileobj.tell()
+        end = fileobj.seek(0, os.SEEK_END)
+        fileobj.seek(start)
+        return end - start
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def iter_archive(fileobj, filename: str, budget: Optional[ExpansionBudget] = None) -> Iterator[Entry]:
+    """
+    Yield the regular files inside a zip or tar archive.
+    Zip members are opened lazily by the workers (ZipFile serialises the
+    underlying reads); tar is sequential, so members are spooled as read.
+    Declared member sizes are charged to `budget` before any member is
+    read (the whole zip up front, tar member by member), and a member that
+    turns out larger than declared fails with ArchiveLimitError.
+    """
+    budget = budget or ExpansionBudget()
+    archive_size = _remaining_size(fileobj)
+    expanded = 0
+    if filename.lower().endswith(".zip"):
+        archive = zipfile.ZipFile(fileobj)
+        members = [(safe_archive_name(info.filename), info) for info in archive.infolist() if not info.is_dir()]
+        members = [(name, info) for name, info in members if name]
+        for name, info in members:
+            expanded += info.file_size
+            budget.take(filename, info.file_size, expanded, archive_size)
+        for name, info in members:
+            yield name, (lambda name=name, info=info: _BoundedMember(archive.open(info), name, info.file_size))
+        return
+
+    with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+        for member in archive:
+            name = safe_archive_name(member.name)
+            if not member.isfile() or not name:
+                continue
+            expanded += member.size
+            budget.take(filename, member.size, expanded, archive_size)
+            spool = tempfile.SpooledTemporaryFile(max_size=INGEST_SPOOL_MAX_MEMORY)
+            source = _BoundedMember(archive.extractfile(member), name, member.size)
+            for chunk in iter(lambda: source.read(1024 * 1024), b""):
+                spool.write(chunk)
+            spool.seek(0)
+            yield name, (lambda spool=spool: spool)
+
+
+def _failed(error: Exception) -> Callable:
+    def opener():
+        raise error
+    return opener
+
+
+def expand_uploads(files: Iterable[Tuple[str, object]], expand_archives: bool = True) -> Iterator[Entry]:
+    """
+    Turn uploaded (filename, fileobj) pairs into entries, unpacking archives.
+    An archive over the expansion limits becomes one failed entry; members
+    of a tar already yielded before the limit was reached are kept.
+    """
+    budget = ExpansionBudget()
+    for filename, fileobj in files:
+        if not (expand_archives and is_archive(filename)):
+            yield filename, (lambda fileobj=fileobj: fileobj)
+            continue
+        try:
+            yield from iter_archive(fileobj, filename, budget)
+        except ArchiveLimitError as e:
+            logger.warning("Refusing archive %s: %s", filename, e)
+            yield filename, _failed(e)
+        except (zipfile.BadZipFile, tarfile.TarError, EOFError, OSError) as e:
+            logger.warning("Could not read archive %s: %s", filename, e)
+            yield filename, _failed(RuntimeError(f"Unreadable archive: {e}"))
+
+
+# -------------------------
+# Parallel ingest
+# -------------------------
+def _store_entry(opener: Callable):
+    # Each worker reads the dedup index through its own session
+    with opener() as source:
+        return store_content_detached(source)
+
+
+def _flush(db: Session, user_id: int, batch: list, results: List[dict]):
+    """Insert one batch of stored files in a single transaction (savepoint per file)"""
+    recorded = []
+    for index, filename, content in batch:
+        try:
+            with db.begin_nested():
+                doc = record_document(db, user_id, content, filename)
+            recorded.append((index, doc, content.deduplicated))
+        except Exception as e:
+            results[index] = {"filename": filename, "cid": content.cid, "error": str(e)}
+    db.commit()
+
+    for index, doc, deduplicated in recorded:
+        results[index] = {
+            "filename": doc.filename,
+            "version": doc.version,
+            "sha256": doc.sha256,
+            "cid": doc.cid,
+            "deduplicated": deduplicated,
+        }
+        schedule_extraction(doc.cid, doc.sha256, doc.filename)
+
+
+def bulk_upload(db: Session, user_id: int, entries: Iterable[Entry]) -> List[dict]:
+    """
+    Hash + add every entry to IPFS on a bounded worker pool, recording
+    finished files in batched transactions while later ones are still
+    being stored. Returns one result per entry in input order:
+    filename, version, sha256, cid, or an error.
+    """
+    results: List[dict] = []
+    pending = deque()
+    batch = []
+    # Bound in-flight work so a large tar is not spooled all at once
+    in_flight = threading.BoundedSemaphore(BULK_WORKERS * 2)
+
+    def collect(block: bool):
+        nonlocal batch
+        while pending and (block or pending[0][2].done()):
+            index, filename, future = pending.popleft()
+            try:
+                batch.append((index, filename, future.result()))
+            except Exception as e:
+                results[index] = {"filename": filename, "error": str(e)}
+            if len(batch) >= BULK_BATCH_SIZE:
+                _flush(db, user_id, batch, results)
+                batch = []
+
+    with ThreadPoolExecutor(max_workers=BULK_WORKERS, thread_name_prefix="bulk-ingest") as pool:
+        for filename, opener in entries:
+            if len(results) >= BULK_MAX_FILES:
+                results.append({"filename": filename, "error": f"Too many files (max {BULK_MAX_FILES})"})
+                continue
+            in_flight.acquire()
+            future = pool.submit(_store_entry, opener)
+            future.add_done_callback(lambda _: in_flight.release())
+            pending.append((len(results), filename, future))
+            results.append(None)
+            collect(block=False)
+
+        collect(block=True)
+        if batch:
+            _flush(db, user_id, batch, results)
+
+    logger.info("Processed %s files for user %s", len(results), user_id)
+    return results
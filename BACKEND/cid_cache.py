@@ -0,0 +1,281 @@
+# cid_cache.py
+import os
+import time
+import uuid
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import BinaryIO, List, Optional, Tuple
+from dotenv import load_dotenv
+from file_lock import FileLock
+from app_logging import get_logger
+from metrics import GaugeFunction
+
+logger = get_logger(__name__)
+
+# -------------------------
+# Config
+# -------------------------
+load_dotenv()
+CID_CACHE_DIR = os.getenv("CID_CACHE_DIR", os.path.join(tempfile.gettempdir(), "dms_cid_cache"))
+# Budget for the whole directory, shared by every worker on the host
+CID_CACHE_MAX_BYTES = int(os.getenv("CID_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+# Fills whose temp file has not been written to for this long were abandoned by a dead worker
+CID_CACHE_PART_MAX_AGE = float(os.getenv("CID_CACHE_PART_MAX_AGE", "3600"))
+PART_SUFFIX = ".part"
+LOCK_NAME = ".lock"
+USAGE_NAME = ".usage"
+# An eviction pass frees down to this share of the budget, so passes (a directory scan) stay rare
+EVICT_TO = 0.9
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+# -------------------------
+# Content-addressed disk cache
+# -------------------------
+class CIDCache:
+    """
+    Local copy of storage objects keyed by CID, bounded by a byte budget
+    and shared by all workers on the host. CIDs are immutable, so entries
+    are never invalidated, only evicted least recently used first (file
+    mtime, bumped on every hit). The directory itself is the index:
+    publishing, the byte count in .usage and eviction run under one
+    cross-process FileLock. Fills go to a per-process temp file and are
+    published with an atomic rename, so readers never see partial data.
+    """
+
+    def __init__(self, directory: str = CID_CACHE_DIR, max_bytes: int = CID_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # FileLock holds one descriptor, so threads of this process queue up first
+        self._thread_lock = threading.Lock()
+        self._file_lock = FileLock(os.path.join(directory, LOCK_NAME))
+        self._stats_lock = threading.Lock()
+        self._prefix = f"{os.getpid()}-"
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.fills = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self._load()
+
+    def _path(self, cid: str) -> str:
+        return os.path.join(self.directory, cid[-2:], cid)
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock, self._file_lock:
+            yield
+
+    # -------------------------
+    # Shared accounting (call with the lock held)
+    # -------------------------
+    def _read_usage(self) -> Optional[Tuple[int, int]]:
+        """(bytes, entries) as last written by any worker"""
+        try:
+            with open(os.path.join(self.directory, USAGE_NAME)) as f:
+                total, count = f.read().split()
+            return int(total), int(count)
+        except (OSError, ValueError):
+            return None
+
+    def _write_usage(self, total: int, count: int):
+        path = os.path.join(self.directory, USAGE_NAME)
+        tmp_path = f"{path}.{os.getpid()}"
+        try:
+            with open(tmp_path, "w") as f:
+                f.write(f"{total} {count}\n")
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # The next pass that scans the directory recomputes it
+            logger.warning("Could not update cache usage: %s", e)
+
+    def _scan(self) -> List[Tuple[float, str, int]]:
+        """Every entry on disk as (mtime, path, size); removes fills abandoned by dead workers"""
+        entries = []
+        stale = time.time() - CID_CACHE_PART_MAX_AGE
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.startswith("."):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if name.endswith(PART_SUFFIX):
+                    # Fills still being written (by any worker) keep a fresh mtime
+                    if st.st_mtime < stale:
+                        _remove(path)
+                    continue
+                entries.append((st.st_mtime, path, st.st_size))
+        return entries
+
+    def _rebalance_locked(self) -> Tuple[int, int]:
+        """Recount from disk and evict least recently used entries if over budget"""
+        entries = self._scan()
+        total = sum(size for _, _, size in entries)
+        count = len(entries)
+        if total > self.max_bytes:
+            target = self.max_bytes * EVICT_TO
+            for _, path, size in sorted(entries):
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    # Windows refuses to delete a file that is open; it goes next pass
+                    logger.debug("Could not evict %s: %s", path, e)
+                    continue
+                total -= size
+                count -= 1
+                with self._stats_lock:
+                    self.evictions += 1
+        self._write_usage(total, count)
+        return total, count
+
+    def _load(self):
+        """Recount the shared directory, drop abandoned fills and enforce the budget"""
+        with self._locked():
+            total, count = self._rebalance_locked()
+        logger.info("Cache holds %s entries (%s bytes) in %s", count, total, self.directory)
+
+    # -------------------------
+    # Reads
+    # -------------------------
+    def open(self, cid: str) -> Optional[BinaryIO]:
+        """
+        Open the cached copy of `cid` and mark it recently used, or None on
+        a miss. Read through the returned file: it stays readable even if
+        another worker evicts the entry meanwhile.
+        """
+        path = self._path(cid)
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            with self._stats_lock:
+                self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._stats_lock:
+            self.hits += 1
+        return f
+
+    # -------------------------
+    # Fills
+    # -------------------------
+    def _fill_path(self, cid: str, size: Optional[int]) -> Optional[str]:
+        """Temp path for a new fill, or None when the object would not fit"""
+        if size is not None and size > self.max_bytes:
+            return None
+        os.makedirs(os.path.dirname(self._path(cid)), exist_ok=True)
+        return os.path.join(self.directory, f"{self._prefix}{uuid.uuid4().hex}{PART_SUFFIX}")
+
+    def _publish(self, cid: str, tmp_path: str, written: int):
+        path = self._path(cid)
+        try:
+            with self._locked():
+                if os.path.exists(path):
+                    # Another worker published it first
+                    _remove(tmp_path)
+                    return
+                os.replace(tmp_path, path)
+                with self._stats_lock:
+                    self.fills += 1
+                usage = self._read_usage()
+                if usage is None or usage[0] + written > self.max_bytes:
+                    self._rebalance_locked()
+                else:
+                    self._write_usage(usage[0] + written, usage[1] + 1)
+        except OSError as e:
+            # The response already has every byte; only the cache entry is lost
+            logger.warning("Could not publish %s to the cache: %s", cid, e)
+            _remove(tmp_path)
+
+    def fill(self, cid: str, chunks, size: Optional[int] = None):
+        """
+        Pass `chunks` through unchanged while copying them into the cache.
+        The entry is only published once the source is fully consumed, so
+        a failed integrity check or a dropped client leaves nothing behind.
+        """
+        tmp_path = self._fill_path(cid, size)
+        if tmp_path is None:
+            yield from chunks
+            return
+
+        written = 0
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    written += len(chunk)
+                    yield chunk
+        except BaseException:
+            _remove(tmp_path)
+            if hasattr(chunks, "close"):
+                chunks.close()
+            raise
+        self._publish(cid, tmp_path, written)
+
+    async def afill(self, cid: str, chunks, size: Optional[int] = None):
+        """fill() for an async iterator of chunks"""
+        tmp_path = self._fill_path(cid, size)
+        if tmp_path is None:
+            async for chunk in chunks:
+                yield chunk
+            return
+
+        written = 0
+        try:
+            # Plain writes: one chunk into the page cache is far cheaper than a thread hop
+            with open(tmp_path, "wb") as f:
+                async for chunk in chunks:
+                    f.write(chunk)
+                    written += len(chunk)
+                    yield chunk
+        except BaseException:
+            _remove(tmp_path)
+            if hasattr(chunks, "aclose"):
+                await chunks.aclose()
+            raise
+        self._publish(cid, tmp_path, written)
+
+    def stats(self) -> dict:
+        """Entries and bytes are host-wide; the counters are this worker's"""
+        total, count = self._read_usage() or (0, 0)
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": count,
+                "bytes": total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "fills": self.fills,
+                "evictions": self.evictions,
+            }
+
+
+# Shared cache used by download/preview
+cache = CIDCache()
+
+
+def _cache_gauge():
+    stats = cache.stats()
+    for key in ("entries", "bytes", "hits", "misses", "evictions"):
+        yield (key,), stats[key]
+
+
+GaugeFunction("dms_cid_cache", "Download cache size and lookup counts", ["stat"], _cache_gauge)
@@ -0,0 +1,117 @@
+# content_refs.py
+from collections import Counter
+from typing import Iterable, List, Optional
+from sqlalchemy import func, case, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import ContentRef, Document, DocumentVersion
+from database import SessionLocal
+from gc_scheduler import scheduler
+from ipfs_service import remove_file_from_ipfs
+from extraction import drop_index
+
+# Distinct CIDs per UPDATE in release_refs()
+RELEASE_BATCH_SIZE = 500
+
+
+# -------------------------
+# Lookup by content hash
+# -------------------------
+def find_content(db: Session, sha256: str) -> Optional[ContentRef]:
+    """Return a live (still pinned and referenced) CID for this SHA256, if any"""
+    return (
+        db.query(ContentRef)
+        .filter(ContentRef.sha256 == sha256, ContentRef.refcount > 0)
+        .first()
+    )
+
+
+# -------------------------
+# Reference counting
+# -------------------------
+def acquire_ref(db: Session, cid: str, sha256: str, size: Optional[int] = None):
+    """Add one reference to `cid` (creating its row on first use). Caller commits."""
+    updated = (
+        db.query(ContentRef)
+        .filter(ContentRef.cid == cid)
+        .update({ContentRef.refcount: ContentRef.refcount + 1}, synchronize_session=False)
+    )
+    if updated:
+        return
+
+    try:
+        with db.begin_nested():
+            db.add(ContentRef(cid=cid, sha256=sha256, size=size, refcount=1))
+    except IntegrityError:
+        # Another request created the row first; just take our reference
+        db.query(ContentRef).filter(ContentRef.cid == cid).update(
+            {ContentRef.refcount: ContentRef.refcount + 1}, synchronize_session=False
+        )
+
+
+def _count_users(db: Session, cid: str) -> int:
+    versions = db.query(func.count()).filter(DocumentVersion.cid == cid).scalar()
+    heads = db.query(func.count(Document.id)).filter(Document.cid == cid).scalar()
+    return versions + heads
+
+
+def release_refs(db: Session, cids: Iterable[str]) -> List[str]:
+    """
+    Drop one reference per entry in `cids` (repeat a CID to drop several).
+    Call after the referencing rows were deleted or repointed.
+    Returns the CIDs that are now unreferenced; the caller commits and
+    then passes them to unpin_orphans(). The extracted text and search
+    postings of their content go in the same transaction.
+    Each batch of distinct CIDs is one UPDATE ... RETURNING, so bulk
+    deletes do not pay two round trips per CID.
+    """
+    counts = Counter(cid for cid in cids if cid)
+    distinct = list(counts)
+    remaining = {}
+    released = {}
+    for start in range(0, len(distinct), RELEASE_BATCH_SIZE):
+        batch = distinct[start:start + RELEASE_BATCH_SIZE]
+        drop = case({cid: counts[cid] for cid in batch}, value=ContentRef.cid)
+        rows = db.execute(
+            update(ContentRef)
+            .where(ContentRef.cid.in_(batch), ContentRef.refcount > 0)
+            .values(refcount=case((ContentRef.refcount > drop, ContentRef.refcount - drop), else_=0))
+            .returning(ContentRef.cid, ContentRef.refcount, ContentRef.sha256)
+            .execution_options(synchronize_session=False)
+        )
+        for cid, refcount, sha256 in rows:
+            remaining[cid] = refcount
+            released[cid] = sha256
+
+    orphans = []
+    for cid in distinct:
+        if cid not in remaining:
+            # No ref row (content from before ref tracking): count remaining users instead
+            db.flush()
+            remaining[cid] = _count_users(db, cid)
+        if not remaining[cid]:
+            orphans.append(cid)
+    # Content from before ref tracking has no ref row to read its hash from; its index stays
+    drop_index(db, (released[cid] for cid in orphans if cid in released))
+    return orphans
+
+
+def unpin_orphans(cids: Iterable[str]):
+    """Queue unreferenced CIDs for unpinning (call after the release is committed)"""
+    for cid in cids:
+        remove_file_from_ipfs(cid)
+
+
+def is_unreferenced(cid: str) -> bool:
+    """GC guard: re-check right before unpinning, in case the content was re-uploaded"""
+    db = SessionLocal()
+    try:
+        refcount = db.query(ContentRef.refcount).filter(ContentRef.cid == cid).scalar()
+        if refcount is None:
+            return not _count_users(db, cid)
+        return refcount == 0
+    finally:
+        db.close()
+
+
+scheduler.guard = is_unreferenced
@@ -1,22 +1,11 @@
 from pydantic import BaseModel, EmailStr
-from sqlalchemy.orm import Session
-from passlib.context import CryptContext
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from models import User  # import the actual model
+from passwords import hash_password_async, verify_password_async
+from app_logging import get_logger
 
-# -------------------------
-# Password hashing setup
-# -------------------------
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def hash_password(password: str) -> str:
-    hashed = pwd_context.hash(password)
-    print(f"[hash_password] Hashed password: {hashed}")  # DEBUG
-    return hashed
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    result = pwd_context.verify(plain_password, hashed_password)
-    print(f"[verify_password] Password match: {result}")  # DEBUG
-    return result
+logger = get_logger(__name__)
 
 # -------------------------
 # Pydantic Schemas
@@ -34,40 +23,47 @@ class UserLogin(BaseModel):
 # -------------------------
 # CRUD Functions
 # -------------------------
-def create_user(db: Session, user: UserCreate):
+# bcrypt is deliberately slow: it runs in the hashing process pool, never on the event loop
+async def create_user(db: AsyncSession, user: UserCreate):
     """Create a new user with hashed password"""
-    print(f"[create_user] Attempting to create user: {user.email}")  # DEBUG
+    logger.debug("Attempting to create user: %s", user.email)
     db_user = User(
         full_name=user.full_name,
         email=user.email,
-        hashed_password=hash_password(user.password),
+        hashed_password=await hash_password_async(user.password),
         role=user.role  # ✅ store role properly
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    print(f"[create_user] User created with ID: {db_user.id}, Role: {db_user.role}")  # DEBUG
+    await db.commit()
+    await db.refresh(db_user)
+    logger.debug("User created with ID: %s, Role: %s", db_user.id, db_user.role)
     return db_user
 
-def get_user_by_email(db: Session, email: str):
+async def get_user_by_email(db: AsyncSession, email: str):
     """Get a user by email"""
-    print(f"[get_user_by_email] Searching for user: {email}")  # DEBUG
-    user = db.query(User).filter(User.email == email).first()
+    logger.debug("Searching for user: %s", email)
+    user = await db.scalar(select(User).where(User.email == email))
     if user:
-        print(f"[get_user_by_email] Found user: {user.email}, ID: {user.id}, Role: {user.role}")  # DEBUG
+        logger.debug("Found user: %s, ID: %s, Role: %s", user.email, user.id, user.role)
     else:
-        print("[get_user_by_email] User not found")  # DEBUG
+        logger.debug("User not found")
     return user
 
-def verify_user(db: Session, email: str, password: str):
+async def verify_user(db: AsyncSession, email: str, password: str):
     """Verify user credentials for login"""
-    print(f"[verify_user] Verifying user: {email}")  # DEBUG
-    db_user = get_user_by_email(db, email)
+    logger.debug("Verifying user: %s", email)
+    db_user = await get_user_by_email(db, email)
     if not db_user:
-        print("[verify_user] User does not exist")  # DEBUG
+        logger.debug("User does not exist")
         return None
-    if not verify_password(password, db_user.hashed_password):
-        print("[verify_user] Password incorrect")  # DEBUG
+    matches, new_hash = await verify_password_async(password, db_user.hashed_password)
+    if not matches:
+        logger.debug("Password incorrect")
         return None
-    print(f"[verify_user] User verified successfully, Role: {db_user.role}")  # DEBUG
+    if new_hash:
+        # Stored hash predates the current BCRYPT_ROUNDS; the plaintext is only available now
+        db_user.hashed_password = new_hash
+        await db.commit()
+        logger.info("Password rehashed for user ID: %s", db_user.id)
+    logger.debug("User verified successfully, Role: %s", db_user.role)
     return db_user
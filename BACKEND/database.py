@@ -1,16 +1,24 @@
 # database.py
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
-from typing import Generator
+from typing import AsyncGenerator, Generator
+from db_pool import pool_options, instrument
+from metrics import DB_SESSION_SECONDS
+import time
 import os
 from dotenv import load_dotenv
+from app_logging import get_logger
+
+logger = get_logger(__name__)
 
 # -------------------------
 # Load environment variables
 # -------------------------
 load_dotenv()
-print("[database.py] Loaded .env variables")
+logger.debug("Loaded .env variables")
 
 # -------------------------
 # Get database URL from .env
@@ -19,32 +27,72 @@ SQLALDBURL = os.getenv("SQLALDBURL")
 if SQLALDBURL is None:
     raise ValueError("[database.py] ERROR: SQLALDBURL is not set in .env")
 else:
-    print(f"[database.py] SQLALDBURL: {SQLALDBURL}")
+    logger.info("SQLALDBURL: %s", make_url(SQLALDBURL).render_as_string(hide_password=True))
+
+# Async driver for each sync dialect; SQLALDBURL_ASYNC overrides the derived URL
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+    "mysql": "mysql+aiomysql",
+}
+
+def async_url(url: str) -> str:
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise ValueError(f"[database.py] ERROR: no async driver known for {parsed.drivername}")
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+SQLALDBURL_ASYNC = os.getenv("SQLALDBURL_ASYNC") or async_url(SQLALDBURL)
 
 # -------------------------
-# Create SQLAlchemy engine
+# Create SQLAlchemy engines
 # -------------------------
-engine = create_engine(SQLALDBURL, future=True)
-print("[database.py] Engine created")
+# Pool size, overflow, timeout, recycle and pre-ping come from DB_POOL_* (see db_pool.py)
+# Sync engine: migrations, create_all and the background workers (threads)
+engine = create_engine(SQLALDBURL, future=True, **pool_options(SQLALDBURL, "sync"))
+instrument(engine, "sync")
+logger.debug("Engine created")
+
+# Async engine: the request path
+async_engine = create_async_engine(SQLALDBURL_ASYNC, **pool_options(SQLALDBURL_ASYNC, "async", is_async=True))
+instrument(async_engine.sync_engine, "async")
+logger.debug("Async engine created")
 
 # -------------------------
 # Create session factory
 # -------------------------
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-print("[database.py] SessionLocal configured")
+logger.debug("SessionLocal configured")
+
+# Objects stay usable after commit: expired attributes would need a lazy load,
+# which AsyncSession cannot do implicitly
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+logger.debug("AsyncSessionLocal configured")
 
 # -------------------------
 # Base class for models
 # -------------------------
 Base = declarative_base()
-print("[database.py] Base declarative class created")
+logger.debug("Base declarative class created")
 
 # -------------------------
-# FastAPI dependency to get DB session
+# FastAPI dependencies to get DB session
 # -------------------------
-def get_db() -> Generator[Session, None, None]:
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
+    start = time.perf_counter()
+    try:
+        async with AsyncSessionLocal() as db:
+            yield db
+    finally:
+        DB_SESSION_SECONDS.labels("async").observe(time.perf_counter() - start)
+
+# For the remaining sync (threadpool) routes: bulk and resumable uploads
+def get_sync_db() -> Generator[Session, None, None]:
+    start = time.perf_counter()
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+        DB_SESSION_SECONDS.labels("sync").observe(time.perf_counter() - start)
@@ -0,0 +1,190 @@
+# db_pool.py
+import os
+import time
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from app_logging import get_logger, LOG_LIBRARY_LEVEL
+from metrics import GaugeFunction
+
+logger = get_logger(__name__)
+
+# -------------------------
+# Config
+# -------------------------
+load_dotenv()
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Seconds to wait for a free connection before failing the request
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Replace connections older than this (seconds) before server/proxy idle timeouts drop them; -1 disables
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Test connections on checkout so a database restart costs a reconnect, not a failed request
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_SLOW_CHECKOUT_MS = float(os.getenv("DB_SLOW_CHECKOUT_MS", "100"))
+SLOW_CHECKOUT_LOG_SIZE = 50
+
+
+# -------------------------
+# Checkout statistics
+# -------------------------
+class PoolStats:
+    """Counters for one engine's pool; survives pool recreation (dispose)"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.slow_checkouts = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.recent_slow = deque(maxlen=SLOW_CHECKOUT_LOG_SIZE)
+
+    def record_checkout(self, pool, seconds: float):
+        slow = seconds * 1000 >= DB_SLOW_CHECKOUT_MS
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            if slow:
+                self.slow_checkouts += 1
+                self.recent_slow.append({
+                    "at": datetime.now(timezone.utc).isoformat(),
+                    "wait_ms": round(seconds * 1000, 1),
+                    "checked_out": pool.checkedout(),
+                    "overflow": max(pool.overflow(), 0),
+                })
+        if slow:
+            logger.warning("Slow %s checkout: %.1f ms (%s)", self.name, seconds * 1000, pool.status())
+
+    def record_timeout(self, pool):
+        with self._lock:
+            self.timeouts += 1
+        logger.error("%s checkout timed out after %ss (%s)", self.name, DB_POOL_TIMEOUT, pool.status())
+
+    def record_connect(self):
+        with self._lock:
+            self.connects += 1
+
+    def record_invalidation(self, exception):
+        with self._lock:
+            self.invalidations += 1
+        logger.warning("%s connection invalidated: %s", self.name, exception)
+
+    def snapshot(self, pool) -> dict:
+        with self._lock:
+            return {
+                "pool_size": pool.size(),
+                "max_overflow": DB_MAX_OVERFLOW,
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow_in_use": max(pool.overflow(), 0),
+                "checkouts": self.checkouts,
+                "wait_ms_avg": round(self.wait_seconds_total * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+                "wait_ms_max": round(self.wait_seconds_max * 1000, 3),
+                "slow_checkout_ms": DB_SLOW_CHECKOUT_MS,
+                "slow_checkouts": self.slow_checkouts,
+                "timeouts": self.timeouts,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "recent_slow": list(self.recent_slow),
+            }
+
+
+_stats = {}
+_engines = {}
+
+
+def _stats_for(name: str) -> PoolStats:
+    return _stats.setdefault(name, PoolStats(name))
+
+
+class _TimedCheckout:
+    """Times every checkout: queue wait, overflow connects and the pre-ping"""
+
+    def connect(self):
+        stats = _stats_for(self._orig_logging_name or "default")
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            stats.record_timeout(self)
+            raise
+        stats.record_checkout(self, time.perf_counter() - start)
+        return connection
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+# SQLAlchemy logs pool internals under "<module>.<class>"; keep them at the library level
+for _pool_class in (TimedQueuePool, TimedAsyncQueuePool):
+    logging.getLogger(f"{__name__}.{_pool_class.__name__}").setLevel(LOG_LIBRARY_LEVEL)
+
+
+# -------------------------
+# Engine wiring
+# -------------------------
+def pool_options(url: str, name: str, is_async: bool = False) -> dict:
+    """create_engine() keyword arguments for the configured, instrumented pool"""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        # In-memory SQLite uses a single shared connection; there is no pool to size
+        return {}
+    return {
+        "poolclass": TimedAsyncQueuePool if is_async else TimedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_logging_name": name,
+    }
+
+
+def instrument(engine: Engine, name: str):
+    """Track connects and invalidations (e.g. failed pre-pings) of a sync engine's pool"""
+    stats = _stats_for(name)
+    _engines[name] = engine
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        stats.record_connect()
+
+    @event.listens_for(engine, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        stats.record_invalidation(exception)
+
+
+def pool_stats() -> dict:
+    """Live pool state and checkout statistics per engine"""
+    return {
+        name: _stats_for(name).snapshot(engine.pool)
+        for name, engine in _engines.items()
+        if isinstance(engine.pool, QueuePool)
+    }
+
+
+def _pool_gauge():
+    for name, engine in list(_engines.items()):
+        if isinstance(engine.pool, QueuePool):
+            yield (name, "checked_out"), engine.pool.checkedout()
+            yield (name, "idle"), engine.pool.checkedin()
+            yield (name, "overflow"), max(engine.pool.overflow(), 0)
+
+
+GaugeFunction("dms_db_pool_connections", "Pooled database connections by state", ["engine", "state"], _pool_gauge)
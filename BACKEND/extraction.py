@@ -0,0 +1,213 @@
+# extraction.py
+import io
+import os
+import zipfile
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Optional, Tuple
+from xml.etree import ElementTree
+from dotenv import load_dotenv
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models import Document, DocumentVersion, DocumentText, ContentPosting
+from storage import storage
+from search import tokenize
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+# -------------------------
+# Config
+# -------------------------
+load_dotenv()
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "2"))
+# Jobs beyond this many queued/running are dropped rather than piling up
+EXTRACT_QUEUE_MAX = int(os.getenv("EXTRACT_QUEUE_MAX", "100"))
+# Larger files are only partly read (plain text) or skipped (PDF/DOCX)
+EXTRACT_MAX_BYTES = int(os.getenv("EXTRACT_MAX_BYTES", str(20 * 1024 * 1024)))
+EXTRACT_MAX_CHARS = int(os.getenv("EXTRACT_MAX_CHARS", str(1_000_000)))
+MAX_TOKEN_LENGTH = 64
+
+TEXT_EXTENSIONS = {"txt", "md", "csv", "tsv", "json", "xml", "html", "htm", "log", "rtf", "yaml", "yml"}
+
+
+# -------------------------
+# Text extractors
+# -------------------------
+def _extract_docx(data: bytes) -> str:
+    ns = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        root = ElementTree.fromstring(archive.read("word/document.xml"))
+    paragraphs = []
+    for paragraph in root.iter(f"{ns}p"):
+        paragraphs.append("".join(node.text or "" for node in paragraph.iter(f"{ns}t")))
+    return "\n".join(paragraphs)
+
+
+def _extract_pdf(data: bytes) -> Optional[str]:
+    try:
+        from pypdf import PdfReader  # optional dependency
+    except ImportError:
+        return None
+    reader = PdfReader(io.BytesIO(data))
+    return "\n".join(page.extract_text() or "" for page in reader.pages)
+
+
+def extract_text(data: bytes, filename: str) -> Optional[str]:
+    """Return the document's text, or None if the type is not supported"""
+    extension = os.path.splitext(filename)[1][1:].lower()
+    if extension in TEXT_EXTENSIONS:
+        return data.decode("utf-8", errors="replace")
+    if extension == "docx":
+        return _extract_docx(data)
+    if extension == "pdf":
+        return _extract_pdf(data)
+    return None
+
+
+# -------------------------
+# Background worker pool
+# -------------------------
+_executor = ThreadPoolExecutor(max_workers=EXTRACT_WORKERS, thread_name_prefix="extract")
+_slots = threading.BoundedSemaphore(EXTRACT_QUEUE_MAX)
+stats = {"scheduled": 0, "dropped": 0, "skipped": 0, "extracted": 0, "unsupported": 0, "failed": 0, "read_errors": 0}
+
+
+def schedule_extraction(cid: str, sha256: str, filename: str) -> bool:
+    """
+    Queue text extraction for committed content and return immediately.
+    Never blocks the caller: when the queue is full the job is dropped.
+    """
+    if not _slots.acquire(blocking=False):
+        stats["dropped"] += 1
+        logger.warning("Queue full, skipping extraction for %s", filename)
+        return False
+    stats["scheduled"] += 1
+    future = _executor.submit(_extract_and_index, cid, sha256, filename)
+    future.add_done_callback(lambda _: _slots.release())
+    return True
+
+
+def _read_content(cid: str, limit: int) -> Tuple[bytes, bool]:
+    """Read up to `limit` bytes; the flag is True when the content was cut short"""
+    buffer = io.BytesIO()
+    chunks = storage.get(cid)
+    try:
+        for chunk in chunks:
+            buffer.write(chunk)
+            if buffer.tell() > limit:
+                return buffer.getvalue()[:limit], True
+    finally:
+        chunks.close()
+    return buffer.getvalue(), False
+
+
+def _extract_and_index(cid: str, sha256: str, filename: str):
+    db = SessionLocal()
+    try:
+        # Content is keyed by hash: unchanged content is never extracted twice.
+        # Failed extractions are retried, the parser may since have been installed or fixed.
+        existing = db.get(DocumentText, sha256)
+        if existing is not None and existing.status != "failed":
+            stats["skipped"] += 1
+            return
+
+        try:
+            data, truncated = _read_content(cid, EXTRACT_MAX_BYTES)
+        except Exception as e:
+            # Storage timeout or restart: record nothing, so the next upload of this content retries
+            stats["read_errors"] += 1
+            logger.warning("Could not read %s for extraction: %s", filename, e)
+            return
+
+        error = None
+        try:
+            extension = os.path.splitext(filename)[1][1:].lower()
+            if truncated and extension not in TEXT_EXTENSIONS:
+                text, status, error = None, "failed", "File too large to extract"
+            else:
+                text = extract_text(data, filename)
+                status = "done" if text is not None else "unsupported"
+        except Exception as e:
+            text, status, error = None, "failed", str(e)[:500]
+
+        if text is not None:
+            text = text[:EXTRACT_MAX_CHARS]
+        if existing is not None:
+            db.delete(existing)
+            db.flush()
+        db.add(DocumentText(sha256=sha256, status=status, text=text, error=error))
+
+        counts = Counter(t for t in tokenize(text or "") if 1 < len(t) <= MAX_TOKEN_LENGTH)
+        db.add_all(ContentPosting(token=token, sha256=sha256, tf=tf) for token, tf in counts.items())
+        db.commit()
+
+        stats["extracted" if status == "done" else status] += 1
+        logger.info("%s: %s, %s distinct tokens", filename, status, len(counts))
+    except IntegrityError:
+        # Same content was indexed concurrently by another job
+        db.rollback()
+        stats["skipped"] += 1
+    except Exception as e:
+        db.rollback()
+        stats["failed"] += 1
+        logger.error("Failed to index %s: %s", filename, e)
+    finally:
+        db.close()
+
+
+def extraction_stats() -> dict:
+    return {**stats, "workers": EXTRACT_WORKERS, "queue_max": EXTRACT_QUEUE_MAX}
+
+
+def drop_index(db: Session, hashes: Iterable[str]) -> int:
+    """
+    Delete the text and postings of content hashes that no document or
+    version uses any more (their last reference was released).
+    Returns how many hashes were dropped. Caller commits.
+    """
+    hashes = set(hashes)
+    if not hashes:
+        return 0
+    db.flush()
+    in_use = {sha for (sha,) in db.query(Document.sha256).filter(Document.sha256.in_(hashes)).distinct()}
+    in_use.update(sha for (sha,) in db.query(DocumentVersion.sha256).filter(DocumentVersion.sha256.in_(hashes)).distinct())
+    unused = list(hashes - in_use)
+    if unused:
+        db.query(ContentPosting).filter(ContentPosting.sha256.in_(unused)).delete(synchronize_session=False)
+        db.query(DocumentText).filter(DocumentText.sha256.in_(unused)).delete(synchronize_session=False)
+    return len(unused)
+
+
+# -------------------------
+# Content search
+# -------------------------
+def search_content(db: Session, user_id: int, query: str, limit: int, offset: int = 0) -> List[Tuple[Document, float]]:
+    """
+    Documents of `user_id` whose body contains every query term,
+    scored by total term frequency (most matches first).
+    """
+    tokens = sorted({t for t in tokenize(query) if 1 < len(t) <= MAX_TOKEN_LENGTH})
+    if not tokens:
+        return []
+
+    # One index probe per term on the postings primary key
+    matches = (
+        db.query(ContentPosting.sha256, func.sum(ContentPosting.tf).label("score"))
+        .filter(ContentPosting.token.in_(tokens))
+        .group_by(ContentPosting.sha256)
+        .having(func.count(ContentPosting.token) == len(tokens))
+        .subquery()
+    )
+    rows = (
+        db.query(Document, matches.c.score)
+        .join(matches, matches.c.sha256 == Document.sha256)
+        .filter(Document.uploaded_by == user_id)
+        .order_by(matches.c.score.desc(), Document.id.desc())
+        .offset(offset)
+        .limit(limit)
+    )
+    return [(doc, float(score)) for doc, score in rows]
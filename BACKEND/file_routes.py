@@ -1,29 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from fastapi.responses import FileResponse as FastAPIFileResponse
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Header, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 from typing import Optional, List
 from pydantic import BaseModel
-from models import Document
+from models import Document, DocumentVersion
 from database import get_db
-from ipfs_service import remove_file_from_ipfs, get_file_from_ipfs, add_file_to_ipfs
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-import jwt, os, mimetypes, hashlib, tempfile, shutil
+from ingest import store_content_detached
+from content_refs import acquire_ref, release_refs, unpin_orphans
+from versions import allocate_version, record_version, purge_documents
+from storage_usage import head_state, track_document
+from pagination import keyset_page, encode_cursor, decode_cursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER
+from search import search_condition, search_documents
+from extraction import schedule_extraction, search_content
+from streaming import document_stream_response
+from zip_export import export_entries, zip_stream, EXPORT_MAX_FILES
+from fastapi.responses import StreamingResponse
+import mimetypes
 from datetime import datetime
-
-# JWT setup
-SECRET_KEY = os.getenv("JWT_SECRET_KEY", "supersecretkey")
-ALGORITHM = "HS256"
-security = HTTPBearer()
-
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    token = credentials.credentials
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token has expired")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+from auth import get_current_user
 
 router = APIRouter(tags=["Files"])
 
@@ -41,36 +36,50 @@ class FileResponse(BaseModel):
     size: Optional[int] = None
     filetype: Optional[str] = None
 
+class FileSearchResponse(FileResponse):
+    rank: float
+
+class FileVersionResponse(BaseModel):
+    document_id: int
+    version: int
+    filename: str
+    sha256: str
+    cid: str
+    uploadedtime: str
+    size: Optional[int] = None
+    filetype: Optional[str] = None
+
 class FileRenameRequest(BaseModel):
     new_filename: str
 
 class FileDescriptionRequest(BaseModel):
     description: Optional[str] = None
 
-# -------------------------
-# Utility: compute SHA256
-# -------------------------
-def compute_sha256(file_path: str) -> str:
-    sha256_hash = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        for block in iter(lambda: f.read(4096), b""):
-            sha256_hash.update(block)
-    return sha256_hash.hexdigest()
+class FileExportRequest(BaseModel):
+    ids: Optional[List[int]] = None
+    q: Optional[str] = None
 
 # -------------------------
 # List files
 # -------------------------
 @router.get("/", response_model=List[FileResponse])
-def list_files(
+async def list_files(
+    response: Response,
     search: Optional[str] = None,
-    db: Session = Depends(get_db),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
+    """Newest first; the next page's cursor is returned in the X-Next-Cursor header"""
     user_id = current_user.get("user_id")
-    query = db.query(Document).filter(Document.uploaded_by == user_id)
+    stmt = select(Document).where(Document.uploaded_by == user_id)
     if search:
-        query = query.filter(Document.filename.ilike(f"%{search}%"))
-    docs = query.order_by(Document.uploadedtime.desc()).all()
+        # Indexed word-prefix match on filename and description
+        stmt = stmt.where(search_condition(db, search))
+    docs, next_cursor = await keyset_page(db, stmt, [Document.uploadedtime, Document.id], cursor, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
 
     response = []
     for doc in docs:
@@ -87,26 +96,86 @@ def list_files(
         ))
     return response
 
+# -------------------------
+# Ranked search
+# -------------------------
+@router.get("/search", response_model=List[FileSearchResponse])
+async def search_files(
+    response: Response,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Best match first; every term must prefix-match a word in the filename or description"""
+    user_id = current_user.get("user_id")
+    return await paged_search_response(response, search_documents, db, user_id, q, limit, cursor)
+
+@router.get("/search/content", response_model=List[FileSearchResponse])
+async def search_file_contents(
+    response: Response,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Search inside PDF/DOCX/text bodies; every term must appear in the document"""
+    user_id = current_user.get("user_id")
+    return await paged_search_response(response, search_content, db, user_id, q, limit, cursor)
+
+async def paged_search_response(response: Response, search_fn, db: AsyncSession, user_id: int,
+                                q: str, limit: int, cursor: Optional[str]) -> List[FileSearchResponse]:
+    (offset,) = decode_cursor(cursor, [None]) if cursor else (0,)
+    if not isinstance(offset, int) or offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    # The search helpers are written against Session; run_sync drives them on the async connection
+    results = await db.run_sync(search_fn, user_id, q, limit + 1, offset)
+    if len(results) > limit:
+        results = results[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor([offset + limit])
+
+    return [
+        FileSearchResponse(
+            id=doc.id,
+            filename=doc.filename,
+            version=doc.version,
+            sha256=doc.sha256,
+            cid=doc.cid,
+            uploadedtime=doc.uploadedtime.isoformat(),
+            description=doc.description,
+            size=doc.size,
+            filetype=doc.filetype,
+            rank=rank
+        )
+        for doc, rank in results
+    ]
+
 # -------------------------
 # Rename file
 # -------------------------
 @router.put("/{file_id}", response_model=FileResponse)
-def rename_file(
+async def rename_file(
     file_id: int,
     payload: FileRenameRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
     user_id = current_user.get("user_id")
-    doc = db.query(Document).filter(Document.id == file_id, Document.uploaded_by == user_id).first()
+    doc = await db.scalar(select(Document).where(Document.id == file_id, Document.uploaded_by == user_id))
     if not doc:
         raise HTTPException(status_code=404, detail="File not found or not owned by user")
 
-    doc.version += 1
+    # A rename is a new version with the same content (one more ref on the CID)
+    doc.version = await db.run_sync(allocate_version, doc.id)
     doc.filename = payload.new_filename
     doc.uploadedtime = datetime.utcnow()
-    db.commit()
-    db.refresh(doc)
+    await db.run_sync(record_version, doc)
+    await db.run_sync(acquire_ref, doc.cid, doc.sha256, doc.size)
+    await db.commit()
+    await db.refresh(doc)
 
     return FileResponse(
         id=doc.id,
@@ -124,20 +193,20 @@ def rename_file(
 # Update description
 # -------------------------
 @router.put("/description/{file_id}", response_model=FileResponse)
-def update_description(
+async def update_description(
     file_id: int,
     payload: FileDescriptionRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
     user_id = current_user.get("user_id")
-    doc = db.query(Document).filter(Document.id == file_id, Document.uploaded_by == user_id).first()
+    doc = await db.scalar(select(Document).where(Document.id == file_id, Document.uploaded_by == user_id))
     if not doc:
         raise HTTPException(status_code=404, detail="File not found or not owned by user")
 
     doc.description = payload.description
-    db.commit()
-    db.refresh(doc)
+    await db.commit()
+    await db.refresh(doc)
 
     return FileResponse(
         id=doc.id,
@@ -155,119 +224,121 @@ def update_description(
 # Delete file
 # -------------------------
 @router.delete("/{file_id}")
-def delete_file(
+async def delete_file(
     file_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
     user_id = current_user.get("user_id")
-    doc = db.query(Document).filter(Document.id == file_id, Document.uploaded_by == user_id).first()
+    doc = await db.scalar(select(Document).where(Document.id == file_id, Document.uploaded_by == user_id))
     if not doc:
         raise HTTPException(status_code=404, detail="File not found or not owned by user")
 
-    if doc.cid:
-        try:
-            remove_file_from_ipfs(doc.cid)
-        except:
-            pass
-
-    db.delete(doc)
-    db.commit()
-    return {"detail": f"File '{doc.filename}' deleted successfully"}
+    # Drop the document with its history; only unpin content nothing else references
+    filename = doc.filename
+    orphans = await db.run_sync(lambda session: release_refs(session, purge_documents(session, [doc.id])))
+    await db.commit()
+    unpin_orphans(orphans)
+    return {"detail": f"File '{filename}' deleted successfully"}
 
 # -------------------------
 # Download file
 # -------------------------
 @router.get("/download/{file_id}")
-def download_file(
+async def download_file(
     file_id: int,
-    db: Session = Depends(get_db),
+    range_header: Optional[str] = Header(None, alias="Range"),
+    db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
     user_id = current_user.get("user_id")
-    doc = db.query(Document).filter(Document.id == file_id, Document.uploaded_by == user_id).first()
+    doc = await db.scalar(select(Document).where(Document.id == file_id, Document.uploaded_by == user_id))
     if not doc:
         raise HTTPException(status_code=404, detail="File not found or not owned by user")
 
-    local_path = get_file_from_ipfs(doc.cid, doc.filename)
-    sha = compute_sha256(local_path)
-    if sha != doc.sha256:
-        os.remove(local_path)
-        raise HTTPException(status_code=500, detail="File integrity verification failed (SHA mismatch)")
+    # Streamed from the storage backend; full IPFS downloads are SHA256-verified on the fly
+    return await document_stream_response(doc, f"attachment; filename={doc.filename}", range_header)
 
-    mime_type = doc.filetype or mimetypes.guess_type(doc.filename)[0] or "application/octet-stream"
-    return FastAPIFileResponse(
-        path=local_path,
-        filename=doc.filename,
-        media_type=mime_type,
-        headers={"Content-Disposition": f"attachment; filename={doc.filename}"}
+# Export several files as one zip
+@router.post("/export")
+async def export_files(
+    payload: FileExportRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """Zip of the given document IDs and/or search matches, streamed as it is built"""
+    user_id = current_user.get("user_id")
+    if not payload.ids and not payload.q:
+        raise HTTPException(status_code=400, detail="Provide document ids or a search query")
+
+    stmt = select(Document).where(Document.uploaded_by == user_id)
+    if payload.ids:
+        stmt = stmt.where(Document.id.in_(payload.ids))
+    if payload.q:
+        stmt = stmt.where(search_condition(db, payload.q))
+    docs = (await db.scalars(stmt.order_by(Document.id).limit(EXPORT_MAX_FILES + 1))).all()
+    if not docs:
+        raise HTTPException(status_code=404, detail="No matching files")
+    if len(docs) > EXPORT_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Too many files (max {EXPORT_MAX_FILES})")
+
+    archive_name = f"documents-{datetime.utcnow():%Y%m%d-%H%M%S}.zip"
+    return StreamingResponse(
+        zip_stream(export_entries(docs)),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename={archive_name}"},
     )
 
 # Preview file
 @router.get("/preview/{file_id}")
-def preview_file(
+async def preview_file(
     file_id: int,
-    db: Session = Depends(get_db),
+    range_header: Optional[str] = Header(None, alias="Range"),
+    db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user),
 ):
     user_id = current_user.get("user_id")
-    doc = db.query(Document).filter(Document.id == file_id, Document.uploaded_by == user_id).first()
+    doc = await db.scalar(select(Document).where(Document.id == file_id, Document.uploaded_by == user_id))
     if not doc:
         raise HTTPException(status_code=404, detail="File not found or not owned by user")
 
-    local_path = get_file_from_ipfs(doc.cid, doc.filename)
-
-    # ✅ Use stored filetype if available, fallback to guessing
-    mime_type = doc.filetype or mimetypes.guess_type(doc.filename)[0] or "application/octet-stream"
-
-    return FastAPIFileResponse(
-        path=local_path,
-        filename=doc.filename,
-        media_type=mime_type,
-        headers={"Content-Disposition": "inline"}
-    )
+    # Range support lets PDF/video viewers seek without pulling the whole object
+    return await document_stream_response(doc, "inline", range_header)
 
 # Edit file (replace contents)
 @router.put("/upload/{file_id}", response_model=FileResponse)
-def edit_file(
+async def edit_file(
     file_id: int,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
     user_id = current_user.get("user_id")
-    doc = db.query(Document).filter(Document.id == file_id, Document.uploaded_by == user_id).first()
+    doc = await db.scalar(select(Document).where(Document.id == file_id, Document.uploaded_by == user_id))
     if not doc:
         raise HTTPException(status_code=404, detail="File not found or not owned by user")
 
-    temp_dir = tempfile.mkdtemp(prefix="ipfs_edit_")
-    temp_path = os.path.join(temp_dir, file.filename)
-    with open(temp_path, "wb") as f:
-        f.write(file.file.read())
-
-    new_sha = compute_sha256(temp_path)
-    new_cid = add_file_to_ipfs(temp_path)
+    # Hash the new content and store it (or reuse identical content), off the event loop
+    new_cid, new_sha, new_size, _ = await run_in_threadpool(store_content_detached, file.file)
+    await db.run_sync(acquire_ref, new_cid, new_sha, new_size)
 
-    if doc.cid:
-        try:
-            remove_file_from_ipfs(doc.cid)
-        except:
-            pass
-
-    doc.version += 1
+    # The previous content stays pinned: it is still referenced by its version row
+    before = head_state(doc)
+    doc.version = await db.run_sync(allocate_version, doc.id)
     doc.cid = new_cid
     doc.sha256 = new_sha
     doc.filename = file.filename
     doc.uploadedtime = datetime.utcnow()
 
     # Update size and filetype on content change
-    doc.size = os.path.getsize(temp_path)
+    doc.size = new_size
     doc.filetype = mimetypes.guess_type(file.filename)[0] or "application/octet-stream"
 
-    db.commit()
-    db.refresh(doc)
-
-    shutil.rmtree(temp_dir, ignore_errors=True)
+    await db.run_sync(track_document, before, doc)
+    await db.run_sync(record_version, doc)
+    await db.commit()
+    await db.refresh(doc)
+    schedule_extraction(doc.cid, doc.sha256, doc.filename)
 
     return FileResponse(
         id=doc.id,
@@ -280,3 +351,70 @@ def edit_file(
         size=doc.size,
         filetype=doc.filetype
     )
+
+# -------------------------
+# Version history
+# -------------------------
+def version_response(entry: DocumentVersion) -> FileVersionResponse:
+    return FileVersionResponse(
+        document_id=entry.document_id,
+        version=entry.version,
+        filename=entry.filename,
+        sha256=entry.sha256,
+        cid=entry.cid,
+        uploadedtime=entry.uploadedtime.isoformat(),
+        size=entry.size,
+        filetype=entry.filetype
+    )
+
+async def get_owned_version(db: AsyncSession, file_id: int, version: int, user_id: int) -> DocumentVersion:
+    entry = await db.scalar(select(DocumentVersion).join(Document).where(
+        DocumentVersion.document_id == file_id,
+        DocumentVersion.version == version,
+        Document.uploaded_by == user_id
+    ))
+    if not entry:
+        raise HTTPException(status_code=404, detail="Version not found or file not owned by user")
+    return entry
+
+@router.get("/{file_id}/versions", response_model=List[FileVersionResponse])
+async def list_versions(
+    file_id: int,
+    limit: int = Query(50, ge=1, le=500),
+    before: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Newest first; pass the last version seen as `before` to get the next page"""
+    user_id = current_user.get("user_id")
+    doc = await db.scalar(select(Document.id).where(Document.id == file_id, Document.uploaded_by == user_id))
+    if not doc:
+        raise HTTPException(status_code=404, detail="File not found or not owned by user")
+
+    # Served straight from the (document_id, version) primary key index
+    stmt = select(DocumentVersion).where(DocumentVersion.document_id == file_id)
+    if before is not None:
+        stmt = stmt.where(DocumentVersion.version < before)
+    entries = await db.scalars(stmt.order_by(DocumentVersion.version.desc()).limit(limit))
+    return [version_response(entry) for entry in entries]
+
+@router.get("/{file_id}/versions/{version}", response_model=FileVersionResponse)
+async def get_version(
+    file_id: int,
+    version: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    entry = await get_owned_version(db, file_id, version, current_user.get("user_id"))
+    return version_response(entry)
+
+@router.get("/{file_id}/versions/{version}/download")
+async def download_version(
+    file_id: int,
+    version: int,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    entry = await get_owned_version(db, file_id, version, current_user.get("user_id"))
+    return await document_stream_response(entry, f"attachment; filename={entry.filename}", range_header)
@@ -0,0 +1,150 @@
+# gc_scheduler.py
+import os
+import time
+import queue
+import threading
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from ipfs_client import client
+from app_logging import get_logger
+from metrics import GaugeFunction
+
+logger = get_logger(__name__)
+
+# -------------------------
+# Config
+# -------------------------
+load_dotenv()
+# Run GC at most every N seconds while unpins are pending...
+IPFS_GC_INTERVAL_SECONDS = float(os.getenv("IPFS_GC_INTERVAL_SECONDS", "600"))
+# ...or as soon as M unpins have accumulated since the last GC
+IPFS_GC_MAX_PENDING = int(os.getenv("IPFS_GC_MAX_PENDING", "100"))
+
+
+# -------------------------
+# Background unpin + GC scheduler
+# -------------------------
+class GCScheduler:
+    """
+    Unpins are queued by request handlers and applied by one background
+    thread. `repo gc` then runs in batches: after IPFS_GC_MAX_PENDING
+    unpins, or IPFS_GC_INTERVAL_SECONDS after the first pending unpin.
+    """
+
+    def __init__(self, interval: float = IPFS_GC_INTERVAL_SECONDS, max_pending: int = IPFS_GC_MAX_PENDING):
+        self.interval = interval
+        self.max_pending = max_pending
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pending_since = None
+        # Optional callable(cid) -> bool; a False answer skips the unpin
+        self.guard = None
+        # Removal and reclaim steps; storage.py points these at the configured backend
+        self.remove = client.pin_rm
+        self.collect = client.repo_gc
+        self.skipped = 0
+        self.pending_gc = 0
+        self.unpinned = 0
+        self.unpin_failures = 0
+        self.gc_runs = 0
+        self.last_gc_at = None
+        self.last_gc_duration = None
+        self.last_gc_removed = None
+        self.last_gc_error = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="ipfs-gc", daemon=True)
+                self._thread.start()
+                logger.info("Unpin/GC scheduler started")
+
+    def enqueue(self, cid: str):
+        """Queue `cid` for unpinning and return immediately"""
+        self.start()
+        self._queue.put(cid)
+
+    def _run(self):
+        while True:
+            timeout = None
+            if self._pending_since is not None:
+                timeout = max(self._pending_since + self.interval - time.monotonic(), 0)
+            try:
+                cid = self._queue.get(timeout=timeout)
+                self._unpin(cid)
+                # Drain whatever else is already queued before deciding on GC
+                while self.pending_gc < self.max_pending:
+                    self._unpin(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            if self.pending_gc and (
+                self.pending_gc >= self.max_pending
+                or time.monotonic() - self._pending_since >= self.interval
+            ):
+                self._gc()
+
+    def _unpin(self, cid: str):
+        if self.guard is not None:
+            try:
+                keep = not self.guard(cid)
+            except Exception as e:
+                keep = True
+                logger.warning("Guard check failed for CID %s: %s", cid, e)
+            if keep:
+                self.skipped += 1
+                logger.info("CID %s is still referenced, keeping pin", cid)
+                return
+        try:
+            self.remove(cid)
+            self.unpinned += 1
+            logger.info("Unpinned CID: %s", cid)
+        except RuntimeError as e:  # IPFSError, storage.StorageError
+            self.unpin_failures += 1
+            logger.warning("Could not unpin CID %s: %s", cid, e)
+            return
+        if self._pending_since is None:
+            self._pending_since = time.monotonic()
+        self.pending_gc += 1
+
+    def _gc(self):
+        started = time.monotonic()
+        try:
+            removed = self.collect()
+            self.last_gc_removed = len(removed)
+            self.last_gc_error = None
+            logger.info("Garbage collected %s blocks after %s unpins", len(removed), self.pending_gc)
+        except RuntimeError as e:
+            self.last_gc_error = str(e)
+            logger.error("Garbage collection failed: %s", e)
+        self.gc_runs += 1
+        self.last_gc_duration = round(time.monotonic() - started, 3)
+        self.last_gc_at = datetime.now(timezone.utc)
+        self.pending_gc = 0
+        self._pending_since = None
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "pending_gc": self.pending_gc,
+            "unpinned": self.unpinned,
+            "unpin_failures": self.unpin_failures,
+            "skipped": self.skipped,
+            "gc_runs": self.gc_runs,
+            "last_gc_at": self.last_gc_at.isoformat() if self.last_gc_at else None,
+            "last_gc_duration_seconds": self.last_gc_duration,
+            "last_gc_removed": self.last_gc_removed,
+            "last_gc_error": self.last_gc_error,
+            "interval_seconds": self.interval,
+            "max_pending": self.max_pending,
+        }
+
+
+# Shared scheduler used by ipfs_service
+scheduler = GCScheduler()
+
+GaugeFunction(
+    "dms_ipfs_unpin_queue", "Unpins waiting to be applied (queued) or garbage collected (pending_gc)", ["state"],
+    lambda: [(("queued",), scheduler._queue.qsize()), (("pending_gc",), scheduler.pending_gc)],
+)
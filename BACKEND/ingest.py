@@ -0,0 +1,112 @@
+# ingest.py
+import os
+import hashlib
+from typing import NamedTuple, Optional, Tuple
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from storage import storage
+from content_refs import find_content, unpin_orphans
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+# Read the body in large blocks
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", str(1024 * 1024)))
+# Sequential sources that must be buffered (tar members) keep this much in RAM before spilling to disk
+INGEST_SPOOL_MAX_MEMORY = int(os.getenv("INGEST_SPOOL_MAX_MEMORY", str(8 * 1024 * 1024)))
+
+
+class IngestResult(NamedTuple):
+    cid: str
+    sha256: str
+    size: int
+    deduplicated: bool = False
+
+
+class _HashingReader:
+    """Read-through view of `source` that hashes and counts the bytes as the backend streams them"""
+
+    def __init__(self, source):
+        self._source = source
+        self._sha256 = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._source.read(size)
+        self._sha256.update(chunk)
+        self.size += len(chunk)
+        return chunk
+
+    def hexdigest(self) -> str:
+        return self._sha256.hexdigest()
+
+
+def _is_seekable(source) -> bool:
+    try:
+        return bool(source.seekable())
+    except (AttributeError, OSError, ValueError):
+        return False
+
+
+def _hash_ahead(source) -> Tuple[str, int]:
+    """(sha256, size) of a seekable source from its current position, which is restored"""
+    start = source.tell()
+    sha256 = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = source.read(INGEST_CHUNK_SIZE)
+        if not chunk:
+            break
+        sha256.update(chunk)
+        size += len(chunk)
+    source.seek(start)
+    return sha256.hexdigest(), size
+
+
+def store_content(db: Session, source, digest: Optional[Tuple[str, int]] = None) -> IngestResult:
+    """
+    Dedupe the upload body on its hash, then send it to the storage
+    backend only if identical content is not stored yet.
+    A seekable body (UploadFile's spooled file, an open file) is hashed
+    first and rewound, so a duplicate upload never reaches the backend.
+    A body that can only be read once (archive members) is hashed while
+    the backend streams it; a duplicate then costs a repeated add, which
+    lands on the same content-addressed copy.
+    A (sha256, size) `digest` computed elsewhere skips the hashing.
+    `db` is only read; no reference is taken (content_refs.acquire_ref does that).
+    """
+    if digest is None and _is_seekable(source):
+        digest = _hash_ahead(source)
+    if digest is not None:
+        sha, size = digest
+        existing = find_content(db, sha)
+        if existing:
+            logger.info("Content already stored, reusing CID: %s", existing.cid)
+            return IngestResult(cid=existing.cid, sha256=sha, size=size, deduplicated=True)
+        return IngestResult(cid=storage.put(source), sha256=sha, size=size)
+
+    reader = _HashingReader(source)
+    cid = storage.put(reader)
+    sha, size = reader.hexdigest(), reader.size
+
+    existing = find_content(db, sha)
+    if existing is None:
+        return IngestResult(cid=cid, sha256=sha, size=size)
+    if existing.cid != cid:
+        # Same bytes under another ID (e.g. added with different chunking); the GC guard keeps it if referenced
+        unpin_orphans([cid])
+    logger.info("Content already stored, reusing CID: %s", existing.cid)
+    return IngestResult(cid=existing.cid, sha256=sha, size=size, deduplicated=True)
+
+
+def store_content_detached(source, digest: Optional[Tuple[str, int]] = None) -> IngestResult:
+    """
+    store_content() with its own short-lived session, for worker threads.
+    Async routes run this via run_in_threadpool: hashing and the storage write
+    stay off the event loop.
+    """
+    db = SessionLocal()
+    try:
+        return store_content(db, source, digest=digest)
+    finally:
+        db.close()
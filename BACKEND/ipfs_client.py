@@ -0,0 +1,278 @@
+# ipfs_client.py
+import os
+import json
+import time
+import uuid
+import asyncio
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from metrics import stage, STAGE_SECONDS, IPFS_ERRORS, IPFS_BYTES
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+# -------------------------
+# Config
+# -------------------------
+load_dotenv()
+IPFS_API_URL = os.getenv("IPFS_API_URL", "http://127.0.0.1:5001")
+IPFS_POOL_SIZE = int(os.getenv("IPFS_POOL_SIZE", "16"))
+IPFS_TIMEOUT = float(os.getenv("IPFS_TIMEOUT", "300"))
+CHUNK_SIZE = 1024 * 1024
+
+
+class IPFSError(RuntimeError):
+    """Raised when the IPFS daemon cannot be reached or rejects a call"""
+
+
+# -------------------------
+# HTTP RPC client
+# -------------------------
+class IPFSClient:
+    """
+    Thin client for the Kubo HTTP RPC API (/api/v0).
+    One requests.Session with a keep-alive pool is shared by all callers,
+    and request/response bodies are streamed in CHUNK_SIZE blocks.
+    """
+
+    def __init__(self, api_url: str = IPFS_API_URL, pool_size: int = IPFS_POOL_SIZE,
+                 timeout: float = IPFS_TIMEOUT):
+        self.base_url = api_url.rstrip("/") + "/api/v0"
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _post(self, endpoint: str, params=None, data=None, headers=None, stream: bool = False):
+        url = f"{self.base_url}/{endpoint}"
+        try:
+            response = self.session.post(
+                url, params=params, data=data, headers=headers,
+                stream=stream, timeout=self.timeout,
+            )
+        except requests.RequestException as e:
+            IPFS_ERRORS.labels(endpoint).inc()
+            raise IPFSError(f"IPFS API unreachable ({endpoint}): {e}") from e
+
+        if response.status_code != 200:
+            IPFS_ERRORS.labels(endpoint).inc()
+            try:
+                message = response.json().get("Message", response.text)
+            except ValueError:
+                message = response.text
+            response.close()
+            raise IPFSError(f"IPFS {endpoint} failed ({response.status_code}): {message}")
+        return response
+
+    @staticmethod
+    def _iter_source(source, chunk_size: int):
+        """Yield byte chunks from a binary file object or an iterable of bytes"""
+        sent = IPFS_BYTES.labels("add")
+        if hasattr(source, "read"):
+            for chunk in iter(lambda: source.read(chunk_size), b""):
+                sent.inc(len(chunk))
+                yield chunk
+        else:
+            for chunk in source:
+                if chunk:
+                    sent.inc(len(chunk))
+                    yield chunk
+
+    def _multipart(self, source, boundary: str, chunk_size: int):
+        yield (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="file"; filename="file"\r\n'
+            f"Content-Type: application/octet-stream\r\n\r\n"
+        ).encode()
+        yield from self._iter_source(source, chunk_size)
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+    def add(self, source, pin: bool = True, chunk_size: int = CHUNK_SIZE) -> str:
+        """
+        Stream `source` into the node and return its CID.
+        Pinning happens in the same call (no separate `pin add`).
+        """
+        boundary = uuid.uuid4().hex
+        # Covers streaming the body, chunking/hashing in the node and the pin
+        with stage("ipfs_add"):
+            response = self._post(
+                "add",
+                params={"pin": str(pin).lower(), "quieter": "true"},
+                data=self._multipart(source, boundary, chunk_size),
+                headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+            )
+        # The daemon answers with one JSON object per added entry; the root is last
+        lines = [line for line in response.text.splitlines() if line.strip()]
+        if not lines:
+            raise IPFSError("IPFS add returned an empty response")
+        return json.loads(lines[-1])["Hash"]
+
+    def pin_rm(self, *cids: str):
+        """Unpin one or more CIDs in one call; fails as a whole if any is not pinned"""
+        with stage("ipfs_pin_rm"):
+            self._post("pin/rm", params={"arg": list(cids)}).close()
+
+    def pin_ls(self):
+        """Yield every recursively pinned CID as the daemon streams them"""
+        params = {"type": "recursive", "stream": "true", "quiet": "true"}
+        with self._post("pin/ls", params=params, stream=True) as response:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                entry = json.loads(line)
+                if entry.get("Error"):
+                    raise IPFSError(f"IPFS pin ls failed: {entry['Error']}")
+                yield entry["Cid"]
+
+    def is_pinned(self, cid: str) -> bool:
+        try:
+            self._post("pin/ls", params={"arg": cid, "type": "recursive"}).close()
+        except IPFSError as e:
+            # The daemon reports an unpinned CID as an error; anything else is a real failure
+            if "not pinned" in str(e):
+                return False
+            raise
+        return True
+
+    def file_size(self, cid: str) -> int:
+        with self._post("files/stat", params={"arg": f"/ipfs/{cid}"}) as response:
+            return int(response.json()["Size"])
+
+    def repo_gc(self) -> list:
+        """Run garbage collection and return the CIDs that were removed"""
+        removed = []
+        with stage("ipfs_repo_gc"), self._post("repo/gc", stream=True) as response:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                entry = json.loads(line)
+                if entry.get("Error"):
+                    raise IPFSError(f"IPFS repo gc failed: {entry['Error']}")
+                key = entry.get("Key") or {}
+                if key.get("/"):
+                    removed.append(key["/"])
+        return removed
+
+    def cat(self, cid: str, offset: int = None, length: int = None, chunk_size: int = CHUNK_SIZE):
+        """Yield the content of `cid` (optionally a byte range) as it arrives"""
+        params = {"arg": cid}
+        if offset:
+            params["offset"] = offset
+        if length is not None:
+            params["length"] = length
+        start = time.perf_counter()
+        response = self._post("cat", params=params, stream=True)
+        STAGE_SECONDS.labels("ipfs_cat_first_byte").observe(time.perf_counter() - start)
+        received = IPFS_BYTES.labels("cat")
+        try:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    received.inc(len(chunk))
+                    yield chunk
+        finally:
+            response.close()
+
+    def version(self) -> dict:
+        with self._post("version") as response:
+            return response.json()
+
+
+# -------------------------
+# Async HTTP RPC client
+# -------------------------
+class AsyncIPFSClient:
+    """
+    asyncio counterpart of IPFSClient for the request path, so slow
+    downloads wait on the event loop instead of holding a thread.
+    An httpx pool is bound to the loop that opened it; a call from a
+    different loop gets a fresh pool and the previous one is closed.
+    """
+
+    def __init__(self, api_url: str = IPFS_API_URL, pool_size: int = IPFS_POOL_SIZE,
+                 timeout: float = IPFS_TIMEOUT):
+        self.base_url = api_url.rstrip("/") + "/api/v0"
+        self.timeout = timeout
+        self.limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self._http = None
+        self._loop = None
+
+    def _client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._loop is not loop:
+            self._release()
+            self._http = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+            self._loop = loop
+        return self._http
+
+    def _release(self):
+        """Close the pool opened on another loop; its connections cannot be used from this one"""
+        http, loop = self._http, self._loop
+        self._http = self._loop = None
+        if http is None:
+            return
+        if loop.is_running():
+            # Still alive in another thread: close it there
+            asyncio.run_coroutine_threadsafe(http.aclose(), loop)
+        else:
+            # Its loop has stopped, so nothing can await aclose(); the sockets close when it is collected
+            logger.warning("Dropping IPFS connection pool of a stopped event loop (missed aclose())")
+
+    async def _post(self, endpoint: str, params=None) -> httpx.Response:
+        """POST and return the response with its body still unread"""
+        http = self._client()
+        request = http.build_request("POST", f"{self.base_url}/{endpoint}", params=params)
+        try:
+            response = await http.send(request, stream=True)
+        except httpx.HTTPError as e:
+            IPFS_ERRORS.labels(endpoint).inc()
+            raise IPFSError(f"IPFS API unreachable ({endpoint}): {e}") from e
+
+        if response.status_code != 200:
+            IPFS_ERRORS.labels(endpoint).inc()
+            body = await response.aread()
+            await response.aclose()
+            try:
+                message = json.loads(body).get("Message", body.decode(errors="replace"))
+            except ValueError:
+                message = body.decode(errors="replace")
+            raise IPFSError(f"IPFS {endpoint} failed ({response.status_code}): {message}")
+        return response
+
+    async def cat(self, cid: str, offset: int = None, length: int = None, chunk_size: int = CHUNK_SIZE):
+        """Async-iterate the content of `cid` (optionally a byte range) as it arrives"""
+        params = {"arg": cid}
+        if offset:
+            params["offset"] = offset
+        if length is not None:
+            params["length"] = length
+        start = time.perf_counter()
+        response = await self._post("cat", params=params)
+        STAGE_SECONDS.labels("ipfs_cat_first_byte").observe(time.perf_counter() - start)
+        received = IPFS_BYTES.labels("cat")
+        try:
+            async for chunk in response.aiter_bytes(chunk_size):
+                if chunk:
+                    received.inc(len(chunk))
+                    yield chunk
+        finally:
+            await response.aclose()
+
+    async def version(self) -> dict:
+        response = await self._post("version")
+        try:
+            return json.loads(await response.aread())
+        finally:
+            await response.aclose()
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = self._loop = None
+
+
+# Shared pooled clients used by ipfs_service
+client = IPFSClient()
+async_client = AsyncIPFSClient()
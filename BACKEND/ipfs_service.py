@@ -1,18 +1,37 @@
 import os
+import time
+import asyncio
+import threading
 from dotenv import load_dotenv
 import subprocess
-import tempfile
-import shutil
+import httpx
 import requests
+from ipfs_client import client, async_client, IPFSError, CHUNK_SIZE
+from gc_scheduler import scheduler
+from file_lock import FileLock
+from app_logging import get_logger
+
+logger = get_logger(__name__)
 
 load_dotenv()
 IPFS_FOLDER = os.getenv("IPFS_FOLDER")
-os.makedirs(IPFS_FOLDER, exist_ok=True)
-os.environ["IPFS_PATH"] = IPFS_FOLDER
+# Unset when the node is managed elsewhere or STORAGE_BACKEND=local
+if IPFS_FOLDER:
+    os.makedirs(IPFS_FOLDER, exist_ok=True)
+    os.environ["IPFS_PATH"] = IPFS_FOLDER
+# false when the node is run elsewhere (or faked, as by benchmarks/); workers then only probe it
+IPFS_START_DAEMON = os.getenv("IPFS_START_DAEMON", "true").lower() == "true"
+# How long startup waits for the API; after that the app serves with /readyz failing
+IPFS_READY_TIMEOUT = float(os.getenv("IPFS_READY_TIMEOUT", "30"))
+# Supervisor probe interval; also how soon another worker takes over from an owner that exited
+IPFS_SUPERVISE_INTERVAL = float(os.getenv("IPFS_SUPERVISE_INTERVAL", "5"))
+IPFS_RESTART_BACKOFF_MAX = 60
 
 
 def init_ipfs():
     """Initialize IPFS repo if not already initialized"""
+    if os.path.exists(os.path.join(IPFS_FOLDER, "config")):
+        return
     try:
         subprocess.run(
             ["ipfs", "init"],
@@ -20,124 +39,298 @@ def init_ipfs():
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE
         )
-        print("[IPFS] Repo initialized")
+        logger.info("Repo initialized")
     except subprocess.CalledProcessError:
-        print("[IPFS] IPFS repo already initialized")
+        logger.info("IPFS repo already initialized")
 
 
 def start_ipfs_daemon():
-    """Start IPFS daemon programmatically"""
+    """Start IPFS daemon programmatically; returns the process, or None if it could not be started"""
     try:
-        subprocess.Popen(
-            ["ipfs", "daemon"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
-        print("[IPFS] Daemon started")
+        # Output goes to a file: an unread pipe fills up and stalls the daemon
+        with open(os.path.join(IPFS_FOLDER, "daemon.log"), "ab") as log:
+            process = subprocess.Popen(["ipfs", "daemon"], stdout=log, stderr=subprocess.STDOUT)
+        logger.info("Daemon started (pid %s)", process.pid)
+        return process
     except Exception as e:
-        print(f"[IPFS] Failed to start daemon: {e}")
+        logger.error("Failed to start daemon: %s", e)
+        return None
+
+
+# -------------------------
+# Daemon supervisor
+# -------------------------
+class DaemonSupervisor:
+    """
+    Keeps one `ipfs daemon` per repo however many server workers start.
+    The worker holding the repo's lock file owns the daemon: it
+    initialises the repo, starts the daemon and restarts it with backoff
+    if it exits. Other workers only probe the API, and one of them takes
+    the lock over when the owner goes away. Without a lock (the daemon
+    is managed elsewhere) every worker just probes.
+    """
+
+    def __init__(self, lock_path: str = None, interval: float = IPFS_SUPERVISE_INTERVAL):
+        self.lock = FileLock(lock_path) if lock_path else None
+        self.interval = interval
+        self.process = None
+        self.ready = False
+        self.ready_since = None
+        self.last_error = None
+        self.starts = 0
+        self._restart_delay = 1.0
+        self._next_start = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def owner(self) -> bool:
+        return self.lock is not None and self.lock.held
+
+    def _set_ready(self, ready: bool, error: str = None):
+        if ready and not self.ready:
+            self.ready_since = time.time()
+            logger.info("IPFS API is ready")
+        elif not ready and self.ready:
+            logger.warning("IPFS API stopped answering: %s", error)
+        self.ready = ready
+        self.last_error = error
+
+    def probe(self) -> bool:
+        try:
+            client.version()
+        except IPFSError as e:
+            self._set_ready(False, str(e))
+            return False
+        self._set_ready(True)
+        return True
+
+    def supervise_once(self):
+        if self.lock is not None and not self.lock.held and self.lock.acquire(blocking=False):
+            logger.info("Worker %s now owns the IPFS daemon", os.getpid())
+        if self.probe():
+            self._restart_delay = 1.0
+            return
+        if not self.owner:
+            return
+        if self.process is not None and self.process.poll() is None:
+            return  # Still starting up
+        if time.monotonic() < self._next_start:
+            return
+        if self.process is not None:
+            logger.warning("IPFS daemon exited with code %s, restarting", self.process.returncode)
+        init_ipfs()
+        self.process = start_ipfs_daemon()
+        self.starts += 1
+        self._next_start = time.monotonic() + self._restart_delay
+        self._restart_delay = min(self._restart_delay * 2, IPFS_RESTART_BACKOFF_MAX)
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self.supervise_once()
+            self._thread = threading.Thread(target=self._run, name="ipfs-supervisor", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.supervise_once()
+            except Exception:
+                logger.exception("IPFS supervisor check failed")
+
+    async def wait_ready(self, timeout: float = IPFS_READY_TIMEOUT) -> bool:
+        """Poll the API with exponential backoff until it answers or `timeout` passes"""
+        deadline = time.monotonic() + timeout
+        delay = 0.05
+        while True:
+            try:
+                await async_client.version()
+                self._set_ready(True)
+                return True
+            except IPFSError as e:
+                error = str(e)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._set_ready(False, error)
+                logger.warning("IPFS API not ready after %ss: %s", timeout, error)
+                return False
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, 2.0)
+
+    def stop(self, timeout: float = 10):
+        """Stop supervising; the owner also stops its daemon and releases the lock"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        process, self.process = self.process, None
+        if process is not None and process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            logger.info("Daemon stopped")
+        if self.lock is not None:
+            self.lock.release()
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "ready_since": self.ready_since,
+            "last_error": self.last_error,
+            "owner": self.owner,
+            "daemon_pid": self.process.pid if self.process is not None else None,
+            "starts": self.starts,
+            "manages_daemon": self.lock is not None,
+        }
+
+
+supervisor = DaemonSupervisor(
+    os.path.join(IPFS_FOLDER, "dms-daemon.lock") if IPFS_START_DAEMON and IPFS_FOLDER else None
+)
 
 # Add a file to IPFS
 def add_file_to_ipfs(file_path: str) -> str:
     """Add a file to IPFS, pin it, and return its CID"""
-    try:
-        result = subprocess.run(
-            ["ipfs", "add", "-Q", file_path],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        cid = result.stdout.strip()
+    with open(file_path, "rb") as f:
+        return add_stream_to_ipfs(f)
 
-        # Pin the file so it persists
-        subprocess.run(
-            ["ipfs", "pin", "add", cid],
-            check=True,
-            capture_output=True,
-            text=True
-        )
 
-        print(f"[IPFS] File added and pinned. CID: {cid}")
+def add_stream_to_ipfs(source) -> str:
+    """Stream a binary file object (or iterable of bytes) to IPFS, pin it, and return its CID"""
+    try:
+        cid = client.add(source, pin=True)
+        logger.info("File added and pinned. CID: %s", cid)
         return cid
-    except subprocess.CalledProcessError as e:
-        print(f"[IPFS] Error adding file: {e.stderr}")
+    except IPFSError as e:
+        logger.error("Error adding file: %s", e)
         return None
 
 
 # Remove a file from IPFS
 def remove_file_from_ipfs(cid: str):
-    """Safely unpin a file and run garbage collection"""
+    """Queue a file for unpinning; garbage collection runs in batches in the background"""
     if not cid:
-        print("[IPFS] No CID provided for removal")
+        logger.warning("No CID provided for removal")
         return
 
+    scheduler.enqueue(cid)
+    logger.info("Queued CID for unpin: %s", cid)
+
+# Stream a file from IPFS
+def _prepend(first: bytes, rest):
     try:
-        subprocess.run(
-            ["ipfs", "pin", "rm", cid],
-            check=True,
-            capture_output=True,
-            text=True
-        )
-        print(f"[IPFS] Unpinned CID: {cid}")
-    except subprocess.CalledProcessError as e:
-        print(f"[IPFS] Could not unpin CID {cid}: {e.stderr}")
+        if first:
+            yield first
+        yield from rest
+    finally:
+        rest.close()
+
 
+def _iter_gateway(response):
     try:
-        result = subprocess.run(
-            ["ipfs", "repo", "gc"],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        removed_cids = [line.strip() for line in result.stdout.splitlines()]
-        if cid in removed_cids:
-            print(f"[IPFS] Successfully garbage collected CID: {cid}")
-        else:
-            print(f"[IPFS] CID {cid} unpinned but not found in GC results")
-    except subprocess.CalledProcessError as e:
-        print(f"[IPFS] Garbage collection failed: {e.stderr}")
-
-# Fetch a file from IPFS
-def get_file_from_ipfs(cid: str, filename: str) -> str:
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            if chunk:
+                yield chunk
+    finally:
+        response.close()
+
+
+def stream_file_from_ipfs(cid: str, offset: int = 0, length: int = None):
     """
-    Fetch a file from IPFS and save it locally in a temporary folder.
-    Returns the local path to the file.
+    Return an iterator over the content of `cid` (or the byte range
+    offset..offset+length) without touching the local disk.
     Tries local IPFS first, then falls back to a public gateway.
+    Errors reaching either source are raised here, before any byte is yielded.
     """
     if not cid:
         raise ValueError("CID must be provided to fetch a file from IPFS")
 
-    temp_dir = tempfile.mkdtemp(prefix="ipfs_")
-    local_path = os.path.join(temp_dir, filename)
-
     try:
-        # Try local IPFS node first
-        subprocess.run(
-            ["ipfs", "get", cid, "-o", local_path],
-            check=True,
-            capture_output=True,
-            text=True
-        )
-        print(f"[IPFS] File fetched locally and saved to {local_path}")
-        return local_path
-    except subprocess.CalledProcessError as e:
-        print(f"[IPFS] Local fetch failed: {e.stderr}")
-        # Clean up temp dir and try gateway
-        shutil.rmtree(temp_dir, ignore_errors=True)
-
-    # Fallback: fetch from public gateway
+        # Try local IPFS node first; pull the first chunk so failures surface now
+        chunks = client.cat(cid, offset=offset, length=length)
+        first = next(chunks, b"")
+        return _prepend(first, chunks)
+    except IPFSError as e:
+        logger.warning("Local fetch failed: %s", e)
+
+    # Fallback: stream from public gateway
+    headers = {}
+    if offset or length is not None:
+        end = "" if length is None else str(offset + length - 1)
+        headers["Range"] = f"bytes={offset}-{end}"
     try:
-        temp_dir = tempfile.mkdtemp(prefix="ipfs_")
-        local_path = os.path.join(temp_dir, filename)
         url = f"https://ipfs.io/ipfs/{cid}"
-        response = requests.get(url, timeout=30)
+        response = requests.get(url, headers=headers, timeout=30, stream=True)
         response.raise_for_status()
+        if headers and response.status_code != 206:
+            response.close()
+            raise RuntimeError("Gateway ignored the Range request")
+    except Exception as e:
+        raise RuntimeError(f"Failed to fetch file from IPFS or gateway: {e}") from e
 
-        with open(local_path, "wb") as f:
-            f.write(response.content)
+    logger.info("Streaming CID %s from gateway", cid)
+    return _iter_gateway(response)
+
+
+async def _aprepend(first: bytes, rest):
+    try:
+        if first:
+            yield first
+        async for chunk in rest:
+            yield chunk
+    finally:
+        await rest.aclose()
 
-        print(f"[IPFS] File fetched from gateway and saved to {local_path}")
-        return local_path
+
+async def _aiter_gateway(http: httpx.AsyncClient, response: httpx.Response):
+    try:
+        async for chunk in response.aiter_bytes(CHUNK_SIZE):
+            if chunk:
+                yield chunk
+    finally:
+        await response.aclose()
+        await http.aclose()
+
+
+async def stream_file_from_ipfs_async(cid: str, offset: int = 0, length: int = None):
+    """
+    Async version of stream_file_from_ipfs() for the event loop:
+    returns an async iterator, raising here if neither the local node
+    nor the gateway can serve the content.
+    """
+    if not cid:
+        raise ValueError("CID must be provided to fetch a file from IPFS")
+
+    try:
+        chunks = async_client.cat(cid, offset=offset, length=length)
+        try:
+            first = await chunks.__anext__()
+        except StopAsyncIteration:
+            first = b""
+        return _aprepend(first, chunks)
+    except IPFSError as e:
+        logger.warning("Local fetch failed: %s", e)
+
+    headers = {}
+    if offset or length is not None:
+        end = "" if length is None else str(offset + length - 1)
+        headers["Range"] = f"bytes={offset}-{end}"
+    http = httpx.AsyncClient(timeout=30, follow_redirects=True)
+    try:
+        request = http.build_request("GET", f"https://ipfs.io/ipfs/{cid}", headers=headers)
+        response = await http.send(request, stream=True)
+        response.raise_for_status()
+        if headers and response.status_code != 206:
+            await response.aclose()
+            raise RuntimeError("Gateway ignored the Range request")
     except Exception as e:
-        shutil.rmtree(temp_dir, ignore_errors=True)
+        await http.aclose()
         raise RuntimeError(f"Failed to fetch file from IPFS or gateway: {e}") from e
+
+    logger.info("Streaming CID %s from gateway", cid)
+    return _aiter_gateway(http, response)
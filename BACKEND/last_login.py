@@ -0,0 +1,107 @@
+# last_login.py
+import os
+import atexit
+import threading
+from datetime import datetime
+from dotenv import load_dotenv
+from sqlalchemy import update
+from database import SessionLocal
+from models import User
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+# -------------------------
+# Config
+# -------------------------
+load_dotenv()
+# Logins are written at most this many seconds after they happen...
+LAST_LOGIN_FLUSH_SECONDS = float(os.getenv("LAST_LOGIN_FLUSH_SECONDS", "5"))
+# ...or as soon as this many users are waiting to be written
+LAST_LOGIN_BATCH_SIZE = int(os.getenv("LAST_LOGIN_BATCH_SIZE", "500"))
+
+
+# -------------------------
+# Write-behind buffer
+# -------------------------
+class LastLoginWriter:
+    """
+    Buffers last_login timestamps so /login does not commit. A background
+    thread writes them with one executemany UPDATE per batch; repeated
+    logins by the same user before a flush collapse into one row.
+    """
+
+    def __init__(self, interval: float = LAST_LOGIN_FLUSH_SECONDS, batch_size: int = LAST_LOGIN_BATCH_SIZE):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pending = {}  # user_id -> latest login time
+        self.flushed = 0
+        self.batches = 0
+        self.failures = 0
+        # Once per writer: start() runs again whenever the thread has died
+        atexit.register(self.flush)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="last-login", daemon=True)
+                self._thread.start()
+                logger.info("last_login writer started")
+
+    def record(self, user_id: int, at: datetime):
+        self.start()
+        with self._lock:
+            self._pending[user_id] = at
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def flush(self) -> int:
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+
+        db = SessionLocal()
+        try:
+            db.execute(update(User), [{"id": uid, "last_login": at} for uid, at in batch.items()])
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self.failures += 1
+            # Put them back unless a newer login arrived meanwhile
+            with self._lock:
+                for uid, at in batch.items():
+                    self._pending.setdefault(uid, at)
+            logger.warning("Flush of %s users failed: %s", len(batch), e)
+            return 0
+        finally:
+            db.close()
+
+        self.flushed += len(batch)
+        self.batches += 1
+        return len(batch)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "pending": pending,
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "failures": self.failures,
+            "flush_seconds": self.interval,
+            "batch_size": self.batch_size,
+        }
+
+
+writer = LastLoginWriter()
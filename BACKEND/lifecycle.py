@@ -0,0 +1,89 @@
+# lifecycle.py
+import os
+import time
+import asyncio
+import tempfile
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+from database import engine, async_engine, Base
+from storage import storage
+from passwords import warm_pool, shutdown_pool
+from last_login import writer as last_login_writer
+from auth import revocations
+from file_lock import FileLock
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+# -------------------------
+# Config
+# -------------------------
+load_dotenv()
+# Create missing tables at startup (development); migrations are run with alembic
+DB_CREATE_ALL = os.getenv("DB_CREATE_ALL", "true").lower() == "true"
+# Serialises create_all between the workers of one host
+STARTUP_LOCK_FILE = os.getenv("STARTUP_LOCK_FILE", os.path.join(tempfile.gettempdir(), "dms-startup.lock"))
+READY_CHECK_TIMEOUT = float(os.getenv("READY_CHECK_TIMEOUT", "2"))
+
+state = {"started_at": None, "startup_seconds": None, "shutting_down": False}
+
+
+def _create_tables():
+    # Concurrent CREATE TABLEs from several workers fail on some databases
+    with FileLock(STARTUP_LOCK_FILE):
+        Base.metadata.create_all(bind=engine)
+
+
+# -------------------------
+# Startup / shutdown
+# -------------------------
+@asynccontextmanager
+async def lifespan(app):
+    started = time.perf_counter()
+    if DB_CREATE_ALL:
+        await run_in_threadpool(_create_tables)
+    # Independent of each other: wait for storage while the hashing workers spawn
+    await asyncio.gather(storage.startup(), warm_pool())
+    revocations.start()
+    state["started_at"] = time.time()
+    state["startup_seconds"] = round(time.perf_counter() - started, 3)
+    logger.info("Worker %s started in %ss (storage %s, ready: %s)",
+                os.getpid(), state["startup_seconds"], storage.name, storage.ready())
+    try:
+        yield
+    finally:
+        state["shutting_down"] = True
+        # Pending last_login updates would otherwise wait for the atexit flush
+        await run_in_threadpool(last_login_writer.flush)
+        await run_in_threadpool(shutdown_pool)
+        await storage.shutdown()
+        logger.info("Worker %s shut down", os.getpid())
+
+
+# -------------------------
+# Readiness
+# -------------------------
+async def _ping_database():
+    async with async_engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+async def _database_ready() -> bool:
+    try:
+        # Bounded, so an exhausted pool fails the check instead of hanging the probe
+        await asyncio.wait_for(_ping_database(), READY_CHECK_TIMEOUT)
+        return True
+    except Exception as e:
+        logger.warning("Readiness: database check failed: %s", e)
+        return False
+
+
+async def readiness() -> dict:
+    checks = {
+        "database": await _database_ready(),
+        "storage": storage.ready(),
+        "accepting": not state["shutting_down"],
+    }
+    return {"ready": all(checks.values()), "checks": checks}
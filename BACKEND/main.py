@@ -1,36 +1,36 @@
 # main.py
 
-from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Security
+from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import JSONResponse, Response
 from sqlalchemy.orm import Session
-from database import engine, Base, get_db
+from database import get_db, get_sync_db
+from sqlalchemy.ext.asyncio import AsyncSession
 import crud_schemas
-import jwt
-import os
-import shutil
+from typing import List, Optional
+from pydantic import BaseModel
 from datetime import datetime, timedelta, timezone
 
 # Indian Standard Time (UTC+5:30)
 IST = timezone(timedelta(hours=5, minutes=30))
 
 
-from ipfs_service import init_ipfs, start_ipfs_daemon
-from upload import upload_document
+from lifecycle import lifespan, readiness
+from auth import create_access_token, get_current_user, revocations
+from last_login import writer as last_login_writer
+from app_logging import RequestIdMiddleware, REQUEST_ID_HEADER
+from metrics import MetricsMiddleware, render_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from upload import upload_document_async
+from bulk_upload import bulk_upload, expand_uploads
+from upload_sessions import create_session, get_session, write_chunk, session_progress, finalize_session, abort_session
 from file_routes import router as file_router
 from admin_routes import router as admin_router
 
-# -------------------------
-# Initialize & start IPFS
-# -------------------------
-init_ipfs()
-start_ipfs_daemon()
-
 # -------------------------
 # FastAPI app instance
 # -------------------------
-app = FastAPI(title="PERSPECTIV-DMS")
+# Tables, the IPFS daemon and worker pools are set up per worker in lifecycle.lifespan
+app = FastAPI(title="PERSPECTIV-DMS", lifespan=lifespan)
 
 # -------------------------
 # CORS setup (allow React frontend)
@@ -46,60 +46,58 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["Authorization", "Content-Type"],
+    expose_headers=["X-Next-Cursor", REQUEST_ID_HEADER],
 )
 
-# -------------------------
-# Create database tables
-# -------------------------
-Base.metadata.create_all(bind=engine)
+# Correlation id on every request, its log lines and its response
+app.add_middleware(RequestIdMiddleware)
+# Per-route latency, status and body bytes for /metrics
+app.add_middleware(MetricsMiddleware)
 
 # -------------------------
-# JWT Config
+# Root endpoint
 # -------------------------
-SECRET_KEY = os.getenv("JWT_SECRET_KEY", "supersecretkey")
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60
-security = HTTPBearer()
+@app.get("/")
+async def root():
+    return {"message": "Hello World"}
 
 
-def create_access_token(data: dict, expires_delta: timedelta = None):
-    to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+# -------------------------
+# Health checks
+# -------------------------
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    """Liveness: the worker is up and its event loop is responsive"""
+    return {"status": "ok"}
 
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Security(security)):
-    token = credentials.credentials
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token has expired")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    """Readiness: database reachable and storage (the IPFS API) answering"""
+    result = await readiness()
+    return JSONResponse(result, status_code=200 if result["ready"] else 503)
 
 
 # -------------------------
-# Root endpoint
+# Prometheus metrics
 # -------------------------
-@app.get("/")
-def root():
-    return {"message": "Hello World"}
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(render_metrics(), media_type=METRICS_CONTENT_TYPE)
 
 
 # -------------------------
 # Register endpoint
 # -------------------------
 @app.post("/register")
-def register_user(user: crud_schemas.UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: crud_schemas.UserCreate, db: AsyncSession = Depends(get_db)):
     if getattr(user, "role", "user") not in ("user", "admin"):
         raise HTTPException(status_code=400, detail="Invalid role")
 
-    if crud_schemas.get_user_by_email(db, user.email):
+    if await crud_schemas.get_user_by_email(db, user.email):
         raise HTTPException(status_code=400, detail="User already exists")
 
-    crud_schemas.create_user(db, user)
+    await crud_schemas.create_user(db, user)
     return {"status": 200, "message": "User successfully registered"}
 
 
@@ -112,19 +110,17 @@ from datetime import datetime, timedelta, timezone
 IST = timezone(timedelta(hours=5, minutes=30))
 
 @app.post("/login")
-def login_user(user: crud_schemas.UserLogin, db: Session = Depends(get_db)):
-    db_user = crud_schemas.verify_user(db, user.email, user.password)
+async def login_user(user: crud_schemas.UserLogin, db: AsyncSession = Depends(get_db)):
+    db_user = await crud_schemas.verify_user(db, user.email, user.password)
     if not db_user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password",
         )
 
-    # ✅ Update last_login timestamp in IST
-    db_user.last_login = datetime.now(IST)
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    # ✅ Update last_login timestamp in IST (written behind, in batches)
+    last_login = datetime.now(IST)
+    last_login_writer.record(db_user.id, last_login)
 
     payload = {
         "user_id": db_user.id,
@@ -139,34 +135,38 @@ def login_user(user: crud_schemas.UserLogin, db: Session = Depends(get_db)):
             "email": db_user.email,
             "full_name": db_user.full_name,
             "role": db_user.role,
-            "last_login": db_user.last_login.isoformat(),  # send to frontend
+            "last_login": last_login.isoformat(),  # send to frontend
         },
         "token": token,
     }
 
 
-
 # -------------------------
-# Upload endpoint
+# Logout endpoint
 # -------------------------
-UPLOAD_TEMP_DIR = r"C:\Users\gouth\Desktop\DMS\temp_uploads"
-os.makedirs(UPLOAD_TEMP_DIR, exist_ok=True)
+@app.post("/logout")
+async def logout_user(current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    """Revoke the token this request was made with"""
+    revocations.revoke_token(db, current_user)
+    await db.commit()
+    return {"message": "Logged out"}
 
 
+
+# -------------------------
+# Upload endpoint
+# -------------------------
 @app.post("/upload")
 async def upload_file(
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user),
 ):
     user_id = current_user["user_id"]
-    temp_path = os.path.join(UPLOAD_TEMP_DIR, file.filename)
-
-    with open(temp_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
 
     try:
-        doc = upload_document(db, user_id, temp_path, file.filename)
+        # Hashing + IPFS add run in the threadpool, the inserts on the event loop
+        doc = await upload_document_async(db, user_id, file.file, file.filename)
         response = {
             "filename": doc.filename,
             "version": doc.version,
@@ -176,10 +176,102 @@ async def upload_file(
     except Exception as e:
         response = {"filename": file.filename, "error": str(e)}
 
-    os.remove(temp_path)
     return JSONResponse(content=response)
 
 
+# -------------------------
+# Bulk upload endpoint
+# -------------------------
+# Sync on purpose: archive expansion and the worker pool block, so this runs in the threadpool
+@app.post("/upload/bulk")
+def upload_files(
+    files: List[UploadFile] = File(...),
+    expand_archives: bool = Form(True),
+    db: Session = Depends(get_sync_db),
+    current_user: dict = Depends(get_current_user),
+):
+    user_id = current_user["user_id"]
+
+    entries = expand_uploads(((f.filename, f.file) for f in files), expand_archives)
+    results = bulk_upload(db, user_id, entries)
+    return JSONResponse(content={
+        "uploaded": sum(1 for r in results if "error" not in r),
+        "failed": sum(1 for r in results if "error" in r),
+        "files": results,
+    })
+
+
+
+# -------------------------
+# Resumable upload endpoints
+# -------------------------
+# Sync like bulk upload: chunk writes are fsynced and completion hashes the file
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: int
+    sha256: Optional[str] = None
+
+
+@app.post("/upload/sessions")
+def open_upload_session(
+    payload: UploadSessionCreate,
+    db: Session = Depends(get_sync_db),
+    current_user: dict = Depends(get_current_user),
+):
+    session = create_session(db, current_user["user_id"], payload.filename, payload.size, payload.sha256)
+    return session_progress(db, session)
+
+
+@app.put("/upload/sessions/{session_id}")
+def upload_chunk(
+    session_id: str,
+    offset: int,
+    chunk: UploadFile = File(...),
+    db: Session = Depends(get_sync_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """Write one chunk at `offset`; chunks may arrive in any order and be retried"""
+    session = get_session(db, session_id, current_user["user_id"])
+    return write_chunk(db, session, offset, chunk.file)
+
+
+@app.get("/upload/sessions/{session_id}")
+def upload_session_progress(
+    session_id: str,
+    db: Session = Depends(get_sync_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """Bytes received so far and the [start, end) ranges still missing"""
+    session = get_session(db, session_id, current_user["user_id"])
+    return session_progress(db, session)
+
+
+@app.post("/upload/sessions/{session_id}/complete")
+def complete_upload_session(
+    session_id: str,
+    db: Session = Depends(get_sync_db),
+    current_user: dict = Depends(get_current_user),
+):
+    session = get_session(db, session_id, current_user["user_id"])
+    doc = finalize_session(db, session)
+    return {
+        "filename": doc.filename,
+        "version": doc.version,
+        "sha256": doc.sha256,
+        "cid": doc.cid,
+    }
+
+
+@app.delete("/upload/sessions/{session_id}")
+def cancel_upload_session(
+    session_id: str,
+    db: Session = Depends(get_sync_db),
+    current_user: dict = Depends(get_current_user),
+):
+    session = get_session(db, session_id, current_user["user_id"])
+    abort_session(db, session)
+    return {"detail": "Upload session cancelled"}
+
 
 app.include_router(file_router, prefix="/files", tags=["Files"])
 app.include_router(admin_router, prefix="/admin", tags=["Admin"])
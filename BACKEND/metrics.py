@@ -0,0 +1,301 @@
+# metrics.py
+import os
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Iterable, Sequence, Tuple
+
+# Prometheus text exposition format 0.0.4
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; spans a cached 1 KB download up to a multi-GB upload
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# -------------------------
+# Metric types
+# -------------------------
+class _Metric:
+    """
+    In-process metric with optional labels. `labels(...)` returns a child
+    that is cached per label tuple, so the hot path is a dict lookup plus
+    an uncontended lock. Values are per process: with several server
+    workers each one is scraped (or aggregated) separately.
+    """
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            yield f"{self.name}{_labels(self.labelnames, values)} {_number(child.value)}"
+
+
+class _HistogramChild:
+    __slots__ = ("upper_bounds", "counts", "sum", "_lock")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.upper_bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.upper_bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.upper_bounds)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.upper_bounds + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _number(float(bound)) + '"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, values)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, values)} {cumulative}"
+
+
+class GaugeFunction(_Metric):
+    """Gauge read at scrape time from `fn`, which yields (label values, value) pairs"""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str],
+                 fn: Callable[[], Iterable[Tuple[tuple, float]]]):
+        self.fn = fn
+        super().__init__(name, documentation, labelnames)
+
+    def _samples(self):
+        for values, value in self.fn():
+            yield f"{self.name}{_labels(self.labelnames, values)} {_number(value)}"
+
+
+def render_metrics() -> str:
+    with _registry_lock:
+        metrics = list(_registry)
+    blocks = []
+    for metric in metrics:
+        try:
+            blocks.append(metric.render())
+        except Exception as e:
+            # A failing gauge callback must not take the whole scrape down
+            blocks.append(f"# {metric.name} unavailable: {_escape(e)}")
+    return "\n".join(blocks) + "\n"
+
+
+# -------------------------
+# Application metrics
+# -------------------------
+HTTP_REQUEST_SECONDS = Histogram(
+    "dms_http_request_duration_seconds",
+    "Time from request start until the last response byte was sent",
+    ["method", "route", "status"],
+)
+HTTP_EXCEPTIONS = Counter("dms_http_exceptions_total", "Unhandled exceptions raised by route handlers", ["route", "exception"])
+HTTP_BYTES_IN = Counter("dms_http_request_bytes_total", "Request body bytes received", ["route"])
+HTTP_BYTES_OUT = Counter("dms_http_response_bytes_total", "Response body bytes sent", ["route"])
+
+STAGE_SECONDS = Histogram(
+    "dms_stage_duration_seconds",
+    "Duration of individual upload/download stages (storage writes, IPFS calls, DB commit)",
+    ["stage"],
+)
+IPFS_ERRORS = Counter("dms_ipfs_errors_total", "Failed IPFS RPC calls", ["endpoint"])
+IPFS_BYTES = Counter("dms_ipfs_bytes_total", "Bytes streamed to IPFS (add) or read from it (cat)", ["op"])
+
+DB_SESSION_SECONDS = Histogram(
+    "dms_db_session_duration_seconds",
+    "Lifetime of a request-scoped database session",
+    ["kind"],
+)
+
+
+def stage(name: str):
+    """Context manager timing one stage into dms_stage_duration_seconds"""
+    return STAGE_SECONDS.labels(name).time()
+
+
+# -------------------------
+# HTTP middleware
+# -------------------------
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+GaugeFunction("dms_http_requests_in_flight", "Requests currently being handled", [], lambda: [((), _in_flight)])
+
+
+def _track(delta: int):
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight += delta
+
+
+def _route_of(scope) -> str:
+    """
+    Template of the route the router matched, read once the request has
+    been routed. Anything that matched no route shares one label, so raw
+    paths never become label values.
+    """
+    # FastAPI versions that resolve included routers lazily leave the route's
+    # own template in scope["route"] and record the prefixed one here
+    effective = scope.get("fastapi", {}).get("effective_route_context")
+    template = getattr(effective, "path", None) or getattr(scope.get("route"), "path", None)
+    return template if isinstance(template, str) else "unmatched"
+
+
+def _file_size(path) -> int:
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return 0
+
+
+class MetricsMiddleware:
+    """
+    Plain ASGI middleware recording latency, status and body bytes per
+    route template. Timing ends when the last body chunk is sent, so
+    streamed downloads are measured in full; files handed to the server
+    with http.response.pathsend (FileResponse) count their size.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+        bytes_in = 0
+        bytes_out = 0
+
+        async def receive_counted():
+            nonlocal bytes_in
+            message = await receive()
+            if message["type"] == "http.request":
+                bytes_in += len(message.get("body", b""))
+            return message
+
+        async def send_counted(message):
+            nonlocal status, bytes_out
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                bytes_out += len(message.get("body", b""))
+            elif message["type"] == "http.response.pathsend":
+                bytes_out += _file_size(message["path"])
+            await send(message)
+
+        _track(1)
+        try:
+            await self.app(scope, receive_counted, send_counted)
+        except Exception as e:
+            HTTP_EXCEPTIONS.labels(_route_of(scope), type(e).__name__).inc()
+            raise
+        finally:
+            _track(-1)
+            route = _route_of(scope)
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route, str(status)).observe(time.perf_counter() - start)
+            if bytes_in:
+                HTTP_BYTES_IN.labels(route).inc(bytes_in)
+            if bytes_out:
+                HTTP_BYTES_OUT.labels(route).inc(bytes_out)
@@ -1,7 +1,10 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, Date, DateTime, Boolean, Index, Text, false
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone, timedelta
 from database import Base
+from app_logging import get_logger
+
+logger = get_logger(__name__)
 
 # -------------------------
 # Timezone setup
@@ -30,7 +33,7 @@ class User(Base):
     # Relationship to documents
     documents = relationship("Document", back_populates="owner")
 
-print("[models.py] User model loaded")
+logger.debug("User model loaded")
 
 # -------------------------
 # DOCUMENTS Table
@@ -41,19 +44,186 @@ class Document(Base):
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, nullable=False)
     filetype = Column(String, nullable=False)
-    size = Column(Integer, nullable=True)
+    size = Column(BigInteger, nullable=True)
     description = Column(String, nullable=True)
     version = Column(Integer, default=1)
     uploadedtime = Column(DateTime(timezone=True), default=lambda: datetime.now(IST))
 
     # IPFS fields
-    cid = Column(String, nullable=False)
-    sha256 = Column(String, nullable=False)
+    cid = Column(String, nullable=False, index=True)
+    sha256 = Column(String, nullable=False, index=True)
 
     uploaded_by = Column(Integer, ForeignKey("users.id"))
     owner = relationship("User", back_populates="documents")
 
     # Soft delete flag
     deleted = Column(Boolean, default=False)
+    # Set by reconcile.py when storage no longer holds the content
+    content_missing = Column(Boolean, default=False, nullable=False, server_default=false())
+
+    # Full history; `version` above is the latest allocated version number
+    versions = relationship("DocumentVersion", back_populates="document",
+                            cascade="all, delete-orphan", passive_deletes=True, lazy="dynamic")
+
+    __table_args__ = (
+        Index("ix_documents_owner_filename", "uploaded_by", "filename"),
+        # Keyset pagination: per-user listing and the admin listing
+        Index("ix_documents_owner_uploadedtime_id", "uploaded_by", "uploadedtime", "id"),
+        Index("ix_documents_uploadedtime_id", "uploadedtime", "id"),
+    )
+
+logger.debug("Document model loaded")
+
+# -------------------------
+# DOCUMENT VERSIONS Table
+# -------------------------
+class DocumentVersion(Base):
+    __tablename__ = "document_versions"
+
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), primary_key=True)
+    version = Column(Integer, primary_key=True)
+    filename = Column(String, nullable=False)
+    filetype = Column(String, nullable=False)
+    size = Column(BigInteger, nullable=True)
+    cid = Column(String, nullable=False, index=True)
+    sha256 = Column(String, nullable=False)
+    uploadedtime = Column(DateTime(timezone=True), default=lambda: datetime.now(IST))
+    uploaded_by = Column(Integer, ForeignKey("users.id"))
+    content_missing = Column(Boolean, default=False, nullable=False, server_default=false())
+
+    document = relationship("Document", back_populates="versions")
+
+logger.debug("DocumentVersion model loaded")
+
+# -------------------------
+# CONTENT REFS Table
+# -------------------------
+# One row per distinct pinned CID; refcount = number of document versions using it
+class ContentRef(Base):
+    __tablename__ = "content_refs"
+
+    cid = Column(String, primary_key=True)
+    sha256 = Column(String, index=True, nullable=False)
+    size = Column(BigInteger, nullable=True)
+    refcount = Column(Integer, default=0, nullable=False)
+    createdtime = Column(DateTime(timezone=True), default=lambda: datetime.now(IST))
+
+logger.debug("ContentRef model loaded")
+
+# Stored content an applying reconcile run found unreferenced. It is only
+# unpinned by a later run, once first_seen is past the grace period;
+# rows not seen again by a run are dropped.
+class ReconcileOrphan(Base):
+    __tablename__ = "reconcile_orphans"
+
+    cid = Column(String, primary_key=True)
+    first_seen = Column(DateTime(timezone=True), nullable=False)
+    last_seen = Column(DateTime(timezone=True), nullable=False, index=True)
+
+logger.debug("ReconcileOrphan model loaded")
+
+# -------------------------
+# STORAGE USAGE Tables
+# -------------------------
+# Running totals kept by storage_usage.py in the same transaction as each document
+# change, so admin dashboards read O(users x types) rows instead of scanning documents.
+# files/bytes count head documents; versions/version_bytes count history rows.
+class StorageUsage(Base):
+    __tablename__ = "storage_usage"
+
+    user_id = Column(Integer, primary_key=True)
+    filetype = Column(String, primary_key=True)
+    files = Column(Integer, default=0, nullable=False)
+    bytes = Column(BigInteger, default=0, nullable=False)
+    deleted_files = Column(Integer, default=0, nullable=False)
+    deleted_bytes = Column(BigInteger, default=0, nullable=False)
+    versions = Column(Integer, default=0, nullable=False)
+    version_bytes = Column(BigInteger, default=0, nullable=False)
+
+logger.debug("StorageUsage model loaded")
+
+# Versions uploaded per day and user (still stored), for growth over time
+class StorageUsageDaily(Base):
+    __tablename__ = "storage_usage_daily"
+
+    day = Column(Date, primary_key=True)
+    user_id = Column(Integer, primary_key=True, index=True)
+    versions = Column(Integer, default=0, nullable=False)
+    bytes = Column(BigInteger, default=0, nullable=False)
+
+logger.debug("StorageUsageDaily model loaded")
+
+# -------------------------
+# CONTENT TEXT Tables
+# -------------------------
+# Extracted body text, keyed by content hash so identical files are extracted once
+class DocumentText(Base):
+    __tablename__ = "document_texts"
+
+    sha256 = Column(String, primary_key=True)
+    status = Column(String, nullable=False)  # "done", "unsupported" or "failed"
+    text = Column(Text, nullable=True)
+    error = Column(String, nullable=True)
+    extractedtime = Column(DateTime(timezone=True), default=lambda: datetime.now(IST))
+
+logger.debug("DocumentText model loaded")
+
+# Inverted index: one row per (token, content hash) with the term frequency
+class ContentPosting(Base):
+    __tablename__ = "content_postings"
+
+    token = Column(String, primary_key=True)
+    sha256 = Column(String, primary_key=True, index=True)
+    tf = Column(Integer, nullable=False)
+
+logger.debug("ContentPosting model loaded")
+
+# -------------------------
+# RESUMABLE UPLOAD Tables
+# -------------------------
+# An in-progress chunked upload; bytes are assembled in a file under UPLOAD_SESSION_DIR
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+
+    id = Column(String, primary_key=True)
+    # Deleting the user drops their sessions; expire_sessions() removes the data left behind
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    filename = Column(String, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    expected_sha256 = Column(String, nullable=True)
+    status = Column(String, default="open", nullable=False)  # "open", "finalizing" or "completed"
+    # Chunk writes committed so far, from any worker; finalize compares it with its own hasher's count
+    chunk_writes = Column(Integer, default=0, nullable=False, server_default="0")
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="SET NULL"), nullable=True)
+    createdtime = Column(DateTime(timezone=True), default=lambda: datetime.now(IST))
+    updatedtime = Column(DateTime(timezone=True), default=lambda: datetime.now(IST))
+
+logger.debug("UploadSession model loaded")
+
+# One row per chunk written to disk (re-sending an offset overwrites it)
+class UploadChunk(Base):
+    __tablename__ = "upload_chunks"
+
+    session_id = Column(String, ForeignKey("upload_sessions.id", ondelete="CASCADE"), primary_key=True)
+    offset = Column(BigInteger, primary_key=True)
+    length = Column(Integer, nullable=False)
+
+logger.debug("UploadChunk model loaded")
+
+# -------------------------
+# AUTH Tables
+# -------------------------
+# A revoked token (jti) or every token a user was issued before `issued_before`.
+# `issued_before` is epoch milliseconds, compared with the token's `iat_ms` claim;
+# `expires_at` is epoch seconds like `exp`. Rows are pruned once `expires_at`
+# passes and no covered token can still be valid.
+class TokenRevocation(Base):
+    __tablename__ = "token_revocations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    jti = Column(String, nullable=True)
+    user_id = Column(Integer, nullable=True)
+    issued_before = Column(BigInteger, nullable=True)
+    expires_at = Column(BigInteger, nullable=False, index=True)
 
-print("[models.py] Document model loaded")
+logger.debug("TokenRevocation model loaded")
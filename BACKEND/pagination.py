@@ -0,0 +1,62 @@
+# pagination.py
+import json
+import base64
+from datetime import datetime
+from typing import List, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy import tuple_, DateTime, Select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Response header carrying the cursor for the next page (absent on the last page)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+# -------------------------
+# Opaque cursors
+# -------------------------
+def encode_cursor(values: list) -> str:
+    """Pack the sort-key values of the last row into an opaque, URL-safe token"""
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns: list) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("cursor shape mismatch")
+        return [
+            datetime.fromisoformat(v) if isinstance(getattr(col, "type", None), DateTime) and v is not None else v
+            for col, v in zip(columns, values)
+        ]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+# -------------------------
+# Keyset pagination
+# -------------------------
+async def keyset_page(db: AsyncSession, stmt: Select, columns: list, cursor: Optional[str], limit: int,
+                      descending: bool = True) -> Tuple[List, Optional[str]]:
+    """
+    Return one page of the entity selected by `stmt`, ordered by `columns`,
+    plus the cursor for the next page. The cursor is a row-value comparison
+    on the sort key, so every page is an index range scan instead of an
+    ever-growing OFFSET. The last column must be unique (e.g. the primary key).
+    """
+    if cursor:
+        key = tuple_(*columns)
+        values = tuple_(*decode_cursor(cursor, columns))
+        stmt = stmt.where(key < values if descending else key > values)
+
+    order = [col.desc() if descending else col.asc() for col in columns]
+    rows = (await db.execute(stmt.order_by(*order).limit(limit + 1))).scalars().all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], col.key) for col in columns])
+    return rows, next_cursor
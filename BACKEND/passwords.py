@@ -0,0 +1,130 @@
+# passwords.py
+import os
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from passlib.context import CryptContext
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+# -------------------------
+# Config
+# -------------------------
+load_dotenv()
+# bcrypt cost factor; hashes made with another cost are rehashed on the next successful login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(os.cpu_count() or 1, 4))))
+# Hashes queued or running; beyond this, logins and registrations get 503 instead of waiting
+PASSWORD_HASH_QUEUE_MAX = int(os.getenv("PASSWORD_HASH_QUEUE_MAX", "64"))
+
+# -------------------------
+# Password hashing setup
+# -------------------------
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+def verify_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """(matches, new hash if the stored one uses an outdated scheme or cost)"""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+# -------------------------
+# Process pool
+# -------------------------
+# bcrypt holds the GIL for most of its run, so threads would serialise on it
+# and stall request handling; worker processes hash in parallel instead.
+# "spawn" keeps workers from inheriting the server's threads and sockets.
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(PASSWORD_HASH_QUEUE_MAX)
+stats = {"hashed": 0, "verified": 0, "rehashed": 0, "rejected": 0, "pool_restarts": 0}
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=PASSWORD_HASH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            logger.info("Hashing pool started with %s workers", PASSWORD_HASH_WORKERS)
+        return _executor
+
+
+def _reset_pool(broken: ProcessPoolExecutor):
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+            stats["pool_restarts"] += 1
+    broken.shutdown(wait=False)
+
+
+async def warm_pool():
+    """Start the workers now, so the first logins do not pay for spawning them"""
+    pool = _pool()
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(loop.run_in_executor(pool, os.getpid) for _ in range(PASSWORD_HASH_WORKERS)))
+
+
+def shutdown_pool():
+    global _executor
+    with _executor_lock:
+        pool, _executor = _executor, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+async def _run(fn, *args):
+    if not _slots.acquire(blocking=False):
+        stats["rejected"] += 1
+        raise HTTPException(
+            status_code=503,
+            detail="Too many logins in progress, try again shortly",
+            headers={"Retry-After": "1"},
+        )
+    pool = _pool()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM-killed); the next call starts a fresh pool
+        _reset_pool(pool)
+        raise HTTPException(status_code=503, detail="Password service unavailable, try again shortly")
+    finally:
+        _slots.release()
+
+
+async def hash_password_async(password: str) -> str:
+    hashed = await _run(hash_password, password)
+    stats["hashed"] += 1
+    return hashed
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """verify_and_update() in the hashing pool"""
+    result = await _run(verify_and_update, plain_password, hashed_password)
+    stats["verified"] += 1
+    if result[1] is not None:
+        stats["rehashed"] += 1
+    return result
+
+
+def password_stats() -> dict:
+    return {
+        **stats,
+        "workers": PASSWORD_HASH_WORKERS,
+        "queue_max": PASSWORD_HASH_QUEUE_MAX,
+        "bcrypt_rounds": BCRYPT_ROUNDS,
+    }
@@ -0,0 +1,381 @@
+# reconcile.py
+"""
+Reconcile stored content with the database.
+
+    python reconcile.py              # dry run: report only
+    python reconcile.py --apply      # unpin orphans, flag rows whose content is missing
+
+Orphans are unpinned only by a later --apply run, once
+RECONCILE_ORPHAN_GRACE_MINUTES have passed since a run first found them,
+so content from an upload that has not committed yet is left alone.
+
+Also available as POST /admin/reconcile (a background job, one at a time).
+"""
+import os
+import sys
+import json
+import time
+import heapq
+import argparse
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Iterator, List
+from dotenv import load_dotenv
+from sqlalchemy import select, update, delete, func, or_
+from database import SessionLocal
+from models import Document, DocumentVersion, ContentRef, ReconcileOrphan
+from storage import storage, StorageError
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+# -------------------------
+# Config
+# -------------------------
+load_dotenv()
+# CIDs per unpin call, re-check query and flag UPDATE
+RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", "500"))
+# Storage calls per second (unpins and existence re-checks), so the node keeps serving downloads
+RECONCILE_RATE = float(os.getenv("RECONCILE_RATE", "100"))
+# IDs sorted in memory before a sorted run is spilled to disk (~100 bytes each)
+RECONCILE_SORT_RUN_SIZE = int(os.getenv("RECONCILE_SORT_RUN_SIZE", "500000"))
+# Orphans/missing CIDs listed in the report
+RECONCILE_SAMPLE_SIZE = int(os.getenv("RECONCILE_SAMPLE_SIZE", "20"))
+# An orphan is unpinned by a later run, once this long has passed since it was first found
+RECONCILE_ORPHAN_GRACE_MINUTES = float(os.getenv("RECONCILE_ORPHAN_GRACE_MINUTES", "60"))
+
+
+# -------------------------
+# External sort
+# -------------------------
+class SortedIds:
+    """
+    Sorted, de-duplicated copy of a stream of IDs. Runs of
+    RECONCILE_SORT_RUN_SIZE are sorted in memory and written to
+    `directory`; iterating merges the runs, so memory stays at one run
+    however many IDs there are.
+    """
+
+    def __init__(self, ids: Iterable[str], directory: str, name: str, run_size: int = RECONCILE_SORT_RUN_SIZE):
+        self.runs = []
+        self.count = 0
+        run = []
+        for cid in ids:
+            self.count += 1
+            run.append(cid)
+            if len(run) >= run_size:
+                self._spill(run, directory, name)
+                run = []
+        if run:
+            self._spill(run, directory, name)
+
+    def _spill(self, run: List[str], directory: str, name: str):
+        path = os.path.join(directory, f"{name}-{len(self.runs)}")
+        with open(path, "w") as f:
+            f.writelines(cid + "\n" for cid in sorted(set(run)))
+        self.runs.append(path)
+
+    @staticmethod
+    def _read(path: str) -> Iterator[str]:
+        with open(path) as f:
+            for line in f:
+                yield line.rstrip("\n")
+
+    def __iter__(self) -> Iterator[str]:
+        previous = None
+        for cid in heapq.merge(*(self._read(path) for path in self.runs)):
+            if cid != previous:
+                yield cid
+                previous = cid
+
+
+def diff_sorted(stored: Iterable[str], referenced: Iterable[str]) -> Iterator[tuple]:
+    """Merge-join two sorted unique streams into ("orphan", id) and ("missing", id)"""
+    stored, referenced = iter(stored), iter(referenced)
+    s, r = next(stored, None), next(referenced, None)
+    while s is not None or r is not None:
+        if r is None or (s is not None and s < r):
+            yield "orphan", s
+            s = next(stored, None)
+        elif s is None or r < s:
+            yield "missing", r
+            r = next(referenced, None)
+        else:
+            s, r = next(stored, None), next(referenced, None)
+
+
+# -------------------------
+# Database side
+# -------------------------
+def _referenced_cids(db) -> Iterator[str]:
+    """Every CID a row points at, streamed with a server-side cursor"""
+    for column in (Document.cid, DocumentVersion.cid):
+        stmt = select(column).where(column.isnot(None), column != "").execution_options(yield_per=10000)
+        yield from db.scalars(stmt)
+    stmt = select(ContentRef.cid).where(ContentRef.refcount > 0).execution_options(yield_per=10000)
+    yield from db.scalars(stmt)
+
+
+def _still_referenced(db, cids: List[str]) -> set:
+    """Which of `cids` gained a reference since the listing (uploads in flight)"""
+    found = set()
+    for column, extra in ((Document.cid, None), (DocumentVersion.cid, None), (ContentRef.cid, ContentRef.refcount > 0)):
+        stmt = select(column).where(column.in_(cids))
+        if extra is not None:
+            stmt = stmt.where(extra)
+        found.update(db.scalars(stmt))
+    return found
+
+
+def _due_orphans(db, cids: List[str], run_started: datetime, cutoff: datetime) -> List[str]:
+    """Which of `cids` an earlier run found unreferenced at or before `cutoff`"""
+    stmt = select(ReconcileOrphan.cid).where(
+        ReconcileOrphan.cid.in_(cids),
+        ReconcileOrphan.first_seen < run_started,
+        ReconcileOrphan.first_seen <= cutoff,
+    )
+    due = set(db.scalars(stmt))
+    return [cid for cid in cids if cid in due]
+
+
+def _record_orphans(db, cids: List[str], run_started: datetime):
+    """Mark `cids` as seen unreferenced by this run, keeping first_seen of known ones. Caller commits."""
+    known = set(db.scalars(select(ReconcileOrphan.cid).where(ReconcileOrphan.cid.in_(cids))))
+    if known:
+        db.execute(
+            update(ReconcileOrphan).where(ReconcileOrphan.cid.in_(known)).values(last_seen=run_started)
+            .execution_options(synchronize_session=False)
+        )
+    db.add_all(ReconcileOrphan(cid=cid, first_seen=run_started, last_seen=run_started) for cid in cids if cid not in known)
+
+
+def _chunks(items: List[str], size: int) -> Iterator[List[str]]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+# -------------------------
+# Reconciler
+# -------------------------
+class Reconciler:
+    """
+    Diffs storage.iter_ids() against the CIDs the database references.
+    Storage is listed before the database, so content added by an upload
+    in flight is either in both listings or re-checked before removal:
+    orphans are re-checked against the database and missing CIDs against
+    storage right before acting on them.
+    An upload that has stored its content but not yet committed its rows
+    looks orphaned to both checks, so applying runs record orphans in
+    reconcile_orphans and only unpin those an earlier run found at least
+    `grace` ago; the rest are reported as deferred.
+    """
+
+    def __init__(self, batch_size: int = RECONCILE_BATCH_SIZE, rate: float = RECONCILE_RATE,
+                 grace: timedelta = timedelta(minutes=RECONCILE_ORPHAN_GRACE_MINUTES)):
+        self.batch_size = batch_size
+        self.rate = rate
+        self.grace = grace
+        self._lock = threading.Lock()
+        self._thread = None
+        self.phase = None
+        self.progress = {}
+        self.last_report = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, dry_run: bool = True, rate: float = None) -> bool:
+        """Run in a background thread; False if a run is already in progress"""
+        with self._lock:
+            if self.running:
+                return False
+            self._thread = threading.Thread(
+                target=self._run_logged, args=(dry_run, rate), name="reconcile", daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def _run_logged(self, dry_run: bool, rate: float):
+        try:
+            self.run(dry_run, rate)
+        except Exception as e:
+            logger.exception("Reconciliation failed")
+            self.last_report = {"error": str(e), "finished_at": datetime.now(timezone.utc).isoformat()}
+            self.phase = None
+
+    def _throttle(self, calls: int, started: float, rate: float):
+        if rate > 0:
+            ahead = calls / rate - (time.monotonic() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+    def run(self, dry_run: bool = True, rate: float = None) -> dict:
+        rate = self.rate if rate is None else rate
+        started_at = datetime.now(timezone.utc)
+        cutoff = started_at - self.grace
+        started = time.monotonic()
+        p = self.progress = {"stored": 0, "referenced": 0, "orphans": 0, "missing": 0, "unpinned": 0,
+                             "unpin_failures": 0, "skipped_referenced": 0, "deferred": 0, "skipped_present": 0}
+        orphan_sample, missing_sample = [], []
+        missing_confirmed = []
+        calls = 0
+
+        db = SessionLocal()
+        try:
+            with tempfile.TemporaryDirectory(prefix="dms-reconcile-") as workdir:
+                self.phase = "listing storage"
+                stored = SortedIds(storage.iter_ids(), workdir, "stored")
+                p["stored"] = stored.count
+                self.phase = "listing database"
+                referenced = SortedIds(_referenced_cids(db), workdir, "referenced")
+                p["referenced"] = referenced.count
+
+                self.phase = "diffing"
+                orphans, missing = [], []
+                throttle_start = time.monotonic()
+
+                def handle_orphans(batch):
+                    nonlocal calls
+                    keep = _still_referenced(db, batch)
+                    p["skipped_referenced"] += len(keep)
+                    batch = [cid for cid in batch if cid not in keep]
+                    if not batch:
+                        return
+                    due = _due_orphans(db, batch, started_at, cutoff)
+                    p["deferred"] += len(batch) - len(due)
+                    if dry_run:
+                        return
+                    _record_orphans(db, batch, started_at)
+                    db.commit()
+                    if not due:
+                        return
+                    self._throttle(calls + len(due), throttle_start, rate)
+                    removed = storage.delete_many(due)
+                    calls += len(due)
+                    p["unpinned"] += len(removed)
+                    p["unpin_failures"] += len(due) - len(removed)
+                    if removed:
+                        db.execute(delete(ReconcileOrphan).where(ReconcileOrphan.cid.in_(removed)))
+                        db.commit()
+
+                def handle_missing(batch):
+                    nonlocal calls
+                    for cid in batch:
+                        self._throttle(calls + 1, throttle_start, rate)
+                        calls += 1
+                        try:
+                            present = storage.exists(cid)
+                        except StorageError as e:
+                            logger.warning("Could not re-check %s: %s", cid, e)
+                            continue
+                        if present:
+                            p["skipped_present"] += 1
+                        else:
+                            missing_confirmed.append(cid)
+
+                for kind, cid in diff_sorted(stored, referenced):
+                    if kind == "orphan":
+                        p["orphans"] += 1
+                        if len(orphan_sample) < RECONCILE_SAMPLE_SIZE:
+                            orphan_sample.append(cid)
+                        orphans.append(cid)
+                        if len(orphans) >= self.batch_size:
+                            handle_orphans(orphans)
+                            orphans = []
+                    else:
+                        p["missing"] += 1
+                        if len(missing_sample) < RECONCILE_SAMPLE_SIZE:
+                            missing_sample.append(cid)
+                        missing.append(cid)
+                        if len(missing) >= self.batch_size:
+                            handle_missing(missing)
+                            missing = []
+                if orphans:
+                    handle_orphans(orphans)
+                if missing:
+                    handle_missing(missing)
+                if not dry_run:
+                    # Referenced again or gone from storage since an earlier run
+                    db.execute(delete(ReconcileOrphan).where(ReconcileOrphan.last_seen < started_at))
+                    db.commit()
+            db.rollback()  # End the read transaction before writing flags
+
+            flagged = self._flag_missing(db, missing_confirmed, dry_run)
+        finally:
+            db.close()
+
+        collected = None
+        if not dry_run and p["unpinned"]:
+            self.phase = "collecting"
+            try:
+                collected = len(storage.collect())
+            except StorageError as e:
+                logger.warning("Collection after reconciliation failed: %s", e)
+
+        report = {
+            "dry_run": dry_run,
+            "started_at": started_at.isoformat(),
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "duration_seconds": round(time.monotonic() - started, 3),
+            "backend": storage.name,
+            **p,
+            "missing_confirmed": len(missing_confirmed),
+            **flagged,
+            "collected": collected,
+            "sample_orphans": orphan_sample,
+            "sample_missing": missing_sample,
+        }
+        self.last_report = report
+        self.phase = None
+        logger.info("Reconciliation finished", extra={"report": {k: v for k, v in report.items() if not k.startswith("sample_")}})
+        return report
+
+    def _flag_missing(self, db, missing: List[str], dry_run: bool) -> dict:
+        """Replace the content_missing flags with this run's findings, in one transaction"""
+        self.phase = "flagging"
+        no_cid = [or_(model.cid.is_(None), model.cid == "") for model in (Document, DocumentVersion)]
+        counts = {"documents_flagged": 0, "versions_flagged": 0}
+        if dry_run:
+            # Rows that would be flagged
+            for key, model, cond in zip(counts, (Document, DocumentVersion), no_cid):
+                for chunk in _chunks(missing, self.batch_size):
+                    counts[key] += db.scalar(select(func.count()).select_from(model).where(model.cid.in_(chunk)))
+                counts[key] += db.scalar(select(func.count()).select_from(model).where(cond))
+            return counts
+
+        try:
+            for key, model, cond in zip(counts, (Document, DocumentVersion), no_cid):
+                db.execute(update(model).where(model.content_missing == True).values(content_missing=False))
+                for chunk in _chunks(missing, self.batch_size):
+                    counts[key] += db.execute(update(model).where(model.cid.in_(chunk)).values(content_missing=True)).rowcount
+                counts[key] += db.execute(update(model).where(cond).values(content_missing=True)).rowcount
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return counts
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "phase": self.phase,
+            "progress": self.progress if self.running else None,
+            "last_report": self.last_report,
+            "batch_size": self.batch_size,
+            "rate": self.rate,
+            "orphan_grace_minutes": self.grace.total_seconds() / 60,
+        }
+
+
+reconciler = Reconciler()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apply", action="store_true", help="Unpin orphans and flag missing content (default: dry run)")
+    parser.add_argument("--rate", type=float, default=RECONCILE_RATE, help="Storage calls per second (0 = unlimited)")
+    args = parser.parse_args()
+    json.dump(reconciler.run(dry_run=not args.apply, rate=args.rate), sys.stdout, indent=2)
+    print()
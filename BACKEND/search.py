@@ -0,0 +1,148 @@
+# search.py
+import re
+from typing import List, Tuple
+from sqlalchemy import event, text, func, literal_column, false, Float
+from sqlalchemy.orm import Session
+from models import Document
+
+# -------------------------
+# Index definitions
+# -------------------------
+# PostgreSQL: weighted full-text vector over filename (A) and description (B).
+# Punctuation is folded to spaces first so "q3_report.pdf" yields q3, report, pdf.
+# The query below must use this exact expression for the GIN index to apply.
+def _pg_vector(prefix: str = "") -> str:
+    def part(column: str, weight: str) -> str:
+        return (
+            f"setweight(to_tsvector('simple', regexp_replace(coalesce({prefix}{column}, ''), "
+            f"'[^[:alnum:]]+', ' ', 'g')), '{weight}')"
+        )
+    return f"({part('filename', 'A')} || {part('description', 'B')})"
+
+PG_INDEX_DDL = [
+    f"CREATE INDEX IF NOT EXISTS ix_documents_search ON documents USING gin ({_pg_vector()})",
+]
+
+# SQLite fallback: external-content FTS5 table kept in sync by triggers
+SQLITE_INDEX_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+        filename, description, content='documents', content_rowid='id', tokenize='unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS documents_fts_ai AFTER INSERT ON documents BEGIN
+        INSERT INTO documents_fts(rowid, filename, description)
+        VALUES (new.id, new.filename, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS documents_fts_ad AFTER DELETE ON documents BEGIN
+        INSERT INTO documents_fts(documents_fts, rowid, filename, description)
+        VALUES ('delete', old.id, old.filename, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS documents_fts_au AFTER UPDATE OF filename, description ON documents BEGIN
+        INSERT INTO documents_fts(documents_fts, rowid, filename, description)
+        VALUES ('delete', old.id, old.filename, old.description);
+        INSERT INTO documents_fts(rowid, filename, description)
+        VALUES (new.id, new.filename, new.description);
+    END""",
+    "INSERT INTO documents_fts(documents_fts) VALUES ('rebuild')",
+]
+
+
+def install_search_index(connection):
+    """Create the dialect's search index (idempotent)"""
+    dialect = connection.dialect.name
+    ddl = PG_INDEX_DDL if dialect == "postgresql" else SQLITE_INDEX_DDL if dialect == "sqlite" else []
+    for statement in ddl:
+        connection.execute(text(statement))
+
+
+@event.listens_for(Document.__table__, "after_create")
+def _create_search_index(target, connection, **kw):
+    install_search_index(connection)
+
+
+# -------------------------
+# Query helpers
+# -------------------------
+def tokenize(query: str) -> List[str]:
+    return re.findall(r"[^\W_]+", query.lower())
+
+
+def _pg_tsquery(tokens: List[str]) -> str:
+    # Every term must match; each term matches as a prefix
+    return " & ".join(f"{token}:*" for token in tokens)
+
+
+def _fts5_query(tokens: List[str]) -> str:
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def _pg_document_vector():
+    return literal_column(_pg_vector("documents."))
+
+
+def _pg_query(tokens: List[str]):
+    return func.to_tsquery(literal_column("'simple'"), _pg_tsquery(tokens))
+
+
+def search_condition(db: Session, query: str):
+    """WHERE clause matching documents whose filename/description contain every term as a prefix"""
+    tokens = tokenize(query)
+    if not tokens:
+        return false()
+
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return _pg_document_vector().op("@@")(_pg_query(tokens))
+    if dialect == "sqlite":
+        return Document.id.in_(
+            text("SELECT rowid FROM documents_fts WHERE documents_fts MATCH :search_q")
+            .bindparams(search_q=_fts5_query(tokens))
+            .columns(rowid=Document.id.type)
+        )
+
+    # Other databases: unindexed substring match on every term
+    condition = None
+    for token in tokens:
+        term = Document.filename.ilike(f"%{token}%") | Document.description.ilike(f"%{token}%")
+        condition = term if condition is None else condition & term
+    return condition
+
+
+def search_documents(db: Session, user_id: int, query: str, limit: int, offset: int = 0) -> List[Tuple[Document, float]]:
+    """Ranked search over the user's documents; filename hits outrank description hits"""
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+
+    base = db.query(Document).filter(Document.uploaded_by == user_id)
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        rank = func.ts_rank(_pg_document_vector(), _pg_query(tokens)).label("rank")
+        rows = (
+            base.add_columns(rank)
+            .filter(search_condition(db, query))
+            .order_by(rank.desc(), Document.id.desc())
+        )
+    elif dialect == "sqlite":
+        # bm25() is lower-is-better; negate it so higher rank means better everywhere
+        fts = (
+            text(
+                "SELECT rowid AS doc_id, -bm25(documents_fts, 10.0, 1.0) AS rank "
+                "FROM documents_fts WHERE documents_fts MATCH :search_q"
+            )
+            .bindparams(search_q=_fts5_query(tokens))
+            .columns(doc_id=Document.id.type, rank=Float())
+            .subquery()
+        )
+        rows = (
+            base.join(fts, fts.c.doc_id == Document.id)
+            .add_columns(fts.c.rank)
+            .order_by(fts.c.rank.desc(), Document.id.desc())
+        )
+    else:
+        rows = (
+            base.add_columns(literal_column("0.0").label("rank"))
+            .filter(search_condition(db, query))
+            .order_by(Document.uploadedtime.desc(), Document.id.desc())
+        )
+
+    return [(doc, float(rank or 0)) for doc, rank in rows.offset(offset).limit(limit)]
@@ -0,0 +1,349 @@
+# storage.py
+import os
+import mmap
+import time
+import uuid
+import hashlib
+from typing import Iterator, List, Optional
+from dotenv import load_dotenv
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from ipfs_client import client, async_client, IPFSError, CHUNK_SIZE
+from ipfs_service import add_stream_to_ipfs, stream_file_from_ipfs, stream_file_from_ipfs_async, supervisor
+from gc_scheduler import scheduler
+from metrics import stage
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+# -------------------------
+# Config
+# -------------------------
+load_dotenv()
+# "ipfs" (default) or "local"; switching does not migrate content stored by the other backend
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "ipfs").lower()
+STORAGE_LOCAL_DIR = os.getenv("STORAGE_LOCAL_DIR", os.path.join(os.getcwd(), "storage"))
+# Interrupted writes older than this are removed by collect()
+STORAGE_LOCAL_TMP_MAX_AGE = float(os.getenv("STORAGE_LOCAL_TMP_MAX_AGE", "3600"))
+LOCAL_ID_PREFIX = "sha256-"
+TMP_DIR = ".tmp"
+
+
+class StorageError(RuntimeError):
+    """Raised when the storage backend cannot store, serve or remove content"""
+
+
+# -------------------------
+# Backend interface
+# -------------------------
+class StorageBackend:
+    """
+    Content-addressed blob store. Content IDs are derived from the bytes,
+    so storing identical content twice yields the same ID and one copy.
+    `delete` removes immediately; request paths queue removals through
+    gc_scheduler instead, which re-checks references first.
+    """
+
+    name = "abstract"
+
+    def put(self, source) -> str:
+        """Store a binary file object (or iterable of bytes) and return its content ID"""
+        raise NotImplementedError
+
+    def get(self, cid: str, offset: int = 0, length: Optional[int] = None) -> Iterator[bytes]:
+        """Iterate the content (or a byte range); raises StorageError before the first byte"""
+        raise NotImplementedError
+
+    async def aget(self, cid: str, offset: int = 0, length: Optional[int] = None):
+        """get() as an async iterator, for the event loop"""
+        return iterate_in_threadpool(self.get(cid, offset, length))
+
+    def delete(self, cid: str):
+        raise NotImplementedError
+
+    def delete_many(self, cids: List[str]) -> List[str]:
+        """Delete several IDs; returns those removed (or already gone), failures are logged"""
+        done = []
+        for cid in cids:
+            try:
+                self.delete(cid)
+                done.append(cid)
+            except StorageError as e:
+                logger.warning("Could not delete %s: %s", cid, e)
+        return done
+
+    def iter_ids(self) -> Iterator[str]:
+        """Every stored content ID, streamed in no particular order"""
+        raise NotImplementedError
+
+    def exists(self, cid: str) -> bool:
+        raise NotImplementedError
+
+    def stat(self, cid: str) -> Optional[int]:
+        """Size in bytes, or None if the content is not stored"""
+        raise NotImplementedError
+
+    def local_path(self, cid: str) -> Optional[str]:
+        """Path of a plain file holding the content, if the backend keeps one"""
+        return None
+
+    def collect(self) -> List[str]:
+        """Reclaim space after deletes; returns what was removed"""
+        return []
+
+    async def startup(self):
+        """Called once per worker from the app's lifespan"""
+
+    async def shutdown(self):
+        pass
+
+    def ready(self) -> bool:
+        """Whether requests can be served; backs /readyz"""
+        return True
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
+
+
+# -------------------------
+# IPFS
+# -------------------------
+class IPFSBackend(StorageBackend):
+    """The local Kubo node via ipfs_service (pinned adds, gateway fallback on reads)"""
+
+    name = "ipfs"
+
+    async def startup(self):
+        # The first check may init the repo and start the daemon (subprocesses)
+        await run_in_threadpool(supervisor.start)
+        await supervisor.wait_ready()
+
+    async def shutdown(self):
+        await run_in_threadpool(supervisor.stop)
+        await async_client.aclose()
+
+    def ready(self) -> bool:
+        return supervisor.ready
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "daemon": supervisor.stats()}
+
+    def put(self, source) -> str:
+        cid = add_stream_to_ipfs(source)
+        if not cid:
+            raise StorageError("Failed to add file to IPFS")
+        return cid
+
+    def get(self, cid: str, offset: int = 0, length: Optional[int] = None):
+        return stream_file_from_ipfs(cid, offset=offset, length=length)
+
+    async def aget(self, cid: str, offset: int = 0, length: Optional[int] = None):
+        return await stream_file_from_ipfs_async(cid, offset=offset, length=length)
+
+    def delete(self, cid: str):
+        try:
+            client.pin_rm(cid)
+        except IPFSError as e:
+            if "not pinned" in str(e):
+                return
+            raise StorageError(str(e)) from e
+
+    def delete_many(self, cids: List[str]) -> List[str]:
+        try:
+            client.pin_rm(*cids)
+            return list(cids)
+        except IPFSError:
+            # One CID that is no longer pinned fails the whole call; retry one by one
+            return super().delete_many(cids)
+
+    def iter_ids(self) -> Iterator[str]:
+        try:
+            yield from client.pin_ls()
+        except IPFSError as e:
+            raise StorageError(str(e)) from e
+
+    def exists(self, cid: str) -> bool:
+        try:
+            return client.is_pinned(cid)
+        except IPFSError as e:
+            raise StorageError(str(e)) from e
+
+    def stat(self, cid: str) -> Optional[int]:
+        if not self.exists(cid):
+            return None
+        try:
+            return client.file_size(cid)
+        except IPFSError as e:
+            raise StorageError(str(e)) from e
+
+    def collect(self) -> List[str]:
+        try:
+            return client.repo_gc()
+        except IPFSError as e:
+            raise StorageError(str(e)) from e
+
+
+# -------------------------
+# Local content-addressed directory
+# -------------------------
+class LocalStore(StorageBackend):
+    """
+    Files named by their SHA256 under two levels of shard directories
+    (ab/cd/sha256-abcd...), so no directory grows past a few thousand
+    entries. Writes go to a temp file that is fsynced and renamed into
+    place, so a content ID never points at partial data. Whole-file
+    reads are served from local_path() (sendfile via FileResponse);
+    ranges are sliced from an mmap of the file.
+    """
+
+    name = "local"
+
+    def __init__(self, directory: str = STORAGE_LOCAL_DIR):
+        self.directory = directory
+        self._tmp = os.path.join(directory, TMP_DIR)
+        os.makedirs(self._tmp, exist_ok=True)
+        self.puts = 0
+        self.deduplicated = 0
+        self.deletes = 0
+
+    def _path(self, cid: str) -> str:
+        if not cid.startswith(LOCAL_ID_PREFIX):
+            raise StorageError(f"Not a local content ID: {cid}")
+        digest = cid[len(LOCAL_ID_PREFIX):]
+        if len(digest) != 64 or not all(c in "0123456789abcdef" for c in digest):
+            raise StorageError(f"Malformed content ID: {cid}")
+        return os.path.join(self.directory, digest[:2], digest[2:4], cid)
+
+    @staticmethod
+    def _chunks(source):
+        if hasattr(source, "read"):
+            yield from iter(lambda: source.read(CHUNK_SIZE), b"")
+        else:
+            for chunk in source:
+                if chunk:
+                    yield chunk
+
+    def put(self, source) -> str:
+        tmp_path = os.path.join(self._tmp, uuid.uuid4().hex)
+        sha256_hash = hashlib.sha256()
+        try:
+            with stage("storage_put"), open(tmp_path, "wb") as f:
+                for chunk in self._chunks(source):
+                    sha256_hash.update(chunk)
+                    f.write(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+            cid = LOCAL_ID_PREFIX + sha256_hash.hexdigest()
+            path = self._path(cid)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+                self.deduplicated += 1
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            self.puts += 1
+        except OSError as e:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise StorageError(f"Failed to store file: {e}") from e
+        logger.info("File stored. Content ID: %s", cid)
+        return cid
+
+    def get(self, cid: str, offset: int = 0, length: Optional[int] = None):
+        path = self._path(cid)
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            raise StorageError(f"Content {cid} not found in {self.directory}")
+        return self._read(f, offset, length)
+
+    @staticmethod
+    def _read(f, offset: int, length: Optional[int]):
+        try:
+            size = os.fstat(f.fileno()).st_size
+            end = size if length is None else min(offset + length, size)
+            if offset >= end:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for start in range(offset, end, CHUNK_SIZE):
+                    yield mapped[start:min(start + CHUNK_SIZE, end)]
+        finally:
+            f.close()
+
+    def delete(self, cid: str):
+        try:
+            os.remove(self._path(cid))
+            self.deletes += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            raise StorageError(f"Failed to delete {cid}: {e}") from e
+
+    def iter_ids(self) -> Iterator[str]:
+        for root, dirs, files in os.walk(self.directory):
+            if root == self.directory:
+                dirs[:] = [d for d in dirs if d != TMP_DIR]
+            for name in files:
+                if name.startswith(LOCAL_ID_PREFIX):
+                    yield name
+
+    def exists(self, cid: str) -> bool:
+        return os.path.isfile(self._path(cid))
+
+    def stat(self, cid: str) -> Optional[int]:
+        try:
+            return os.stat(self._path(cid)).st_size
+        except FileNotFoundError:
+            return None
+
+    def local_path(self, cid: str) -> Optional[str]:
+        try:
+            path = self._path(cid)
+        except StorageError:
+            # Not an ID this store issued (e.g. a CID from the IPFS backend)
+            return None
+        return path if os.path.isfile(path) else None
+
+    def ready(self) -> bool:
+        return os.access(self.directory, os.W_OK)
+
+    def collect(self) -> List[str]:
+        """Remove temp files left behind by interrupted writes"""
+        removed = []
+        cutoff = time.time() - STORAGE_LOCAL_TMP_MAX_AGE
+        with os.scandir(self._tmp) as entries:
+            for entry in entries:
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                        removed.append(entry.name)
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "directory": self.directory,
+            "puts": self.puts,
+            "deduplicated": self.deduplicated,
+            "deletes": self.deletes,
+        }
+
+
+def _make_backend() -> StorageBackend:
+    if STORAGE_BACKEND == "ipfs":
+        return IPFSBackend()
+    if STORAGE_BACKEND == "local":
+        return LocalStore()
+    raise ValueError(f"[storage.py] ERROR: unknown STORAGE_BACKEND {STORAGE_BACKEND!r} (expected ipfs or local)")
+
+
+# Shared backend used by ingest, downloads, exports and extraction
+storage = _make_backend()
+logger.info("Storage backend: %s", storage.name)
+
+# Queued removals (content_refs.unpin_orphans) are applied through the backend
+scheduler.remove = storage.delete
+scheduler.collect = storage.collect
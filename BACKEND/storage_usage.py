@@ -0,0 +1,310 @@
+# storage_usage.py
+"""
+Storage analytics kept as running totals.
+
+    python storage_usage.py     # rebuild both tables from documents and versions
+
+Every path that uploads, edits, soft deletes or purges documents applies
+its change here inside its own transaction, so the totals commit or roll
+back with it. POST /admin/analytics/rebuild recomputes them from scratch.
+"""
+import sys
+import json
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, List, Optional
+from fastapi import HTTPException
+from sqlalchemy import select, update, insert, delete, func, case, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import User, Document, DocumentVersion, StorageUsage, StorageUsageDaily
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+TOTAL_FIELDS = ("files", "bytes", "deleted_files", "deleted_bytes", "versions", "version_bytes")
+DAILY_FIELDS = ("versions", "bytes")
+SORT_FIELDS = ("bytes", "files", "deleted_bytes", "version_bytes")
+
+
+def day_of(ts: Optional[datetime]) -> Optional[date]:
+    """Upload day in IST like the rest of the app; naive timestamps are taken as stored"""
+    if ts is None:
+        return None
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(IST)
+    return ts.date()
+
+
+# -------------------------
+# Deltas
+# -------------------------
+class UsageDelta:
+    """Changes to both tables, collected first and then applied row by row in key order"""
+
+    def __init__(self):
+        self.totals = defaultdict(lambda: dict.fromkeys(TOTAL_FIELDS, 0))
+        self.daily = defaultdict(lambda: dict.fromkeys(DAILY_FIELDS, 0))
+
+    def head(self, user_id: Optional[int], filetype: str, size: Optional[int], deleted: bool, sign: int = 1, count: int = 1):
+        """`count` head documents totalling `size` bytes"""
+        row = self.totals[(user_id or 0, filetype)]
+        prefix = "deleted_" if deleted else ""
+        row[prefix + "files"] += sign * count
+        row[prefix + "bytes"] += sign * (size or 0)
+
+    def version(self, user_id: Optional[int], filetype: str, size: Optional[int], uploadedtime, sign: int = 1):
+        row = self.totals[(user_id or 0, filetype)]
+        row["versions"] += sign
+        row["version_bytes"] += sign * (size or 0)
+        day = day_of(uploadedtime)
+        if day is not None:
+            row = self.daily[(day, user_id or 0)]
+            row["versions"] += sign
+            row["bytes"] += sign * (size or 0)
+
+    def apply(self, db: Session):
+        # A fixed order keeps concurrent transactions from locking the same rows in opposite orders
+        for (user_id, filetype), values in sorted(self.totals.items()):
+            _bump(db, StorageUsage, {"user_id": user_id, "filetype": filetype}, values)
+        for (day, user_id), values in sorted(self.daily.items()):
+            _bump(db, StorageUsageDaily, {"day": day, "user_id": user_id}, values)
+
+
+def _bump(db: Session, model, key: dict, values: dict):
+    """Add `values` to the row at `key`, creating it on first use. Caller commits."""
+    values = {name: n for name, n in values.items() if n}
+    if not values:
+        return
+    where = [getattr(model, name) == v for name, v in key.items()]
+    stmt = (
+        update(model)
+        .where(*where)
+        .values({getattr(model, name): getattr(model, name) + n for name, n in values.items()})
+        .execution_options(synchronize_session=False)
+    )
+    if db.execute(stmt).rowcount:
+        return
+
+    try:
+        with db.begin_nested():
+            db.execute(insert(model).values(**key, **values))
+    except IntegrityError:
+        # Another transaction created the row first; add to it
+        db.execute(stmt)
+
+
+# -------------------------
+# Tracking
+# -------------------------
+def head_state(doc: Document) -> tuple:
+    """What a head document contributes; take it before changing the row"""
+    return doc.uploaded_by, doc.filetype, doc.size, bool(doc.deleted)
+
+
+def track_document(db: Session, before: Optional[tuple], doc: Document):
+    """Move `doc` from its head_state() `before` (None for a new document) to its current state"""
+    after = head_state(doc)
+    if before == after:
+        return
+    delta = UsageDelta()
+    if before is not None:
+        delta.head(*before, sign=-1)
+    delta.head(*after)
+    delta.apply(db)
+
+
+def track_version(db: Session, entry: DocumentVersion):
+    delta = UsageDelta()
+    delta.version(entry.uploaded_by, entry.filetype, entry.size, entry.uploadedtime)
+    delta.apply(db)
+
+
+def track_flagged(db: Session, document_ids: List[int], deleted: bool):
+    """After a set-based UPDATE flipped `deleted` on every one of `document_ids`"""
+    if not document_ids:
+        return
+    delta = UsageDelta()
+    rows = db.execute(
+        select(Document.uploaded_by, Document.filetype, func.count(), func.sum(Document.size))
+        .where(Document.id.in_(document_ids))
+        .group_by(Document.uploaded_by, Document.filetype)
+    )
+    for user_id, filetype, count, size in rows:
+        delta.head(user_id, filetype, size, not deleted, sign=-1, count=count)
+        delta.head(user_id, filetype, size, deleted, count=count)
+    delta.apply(db)
+
+
+def track_owners_flagged(db: Session, user_ids: Iterable[int], deleted: bool):
+    """After every document of `user_ids` was set to `deleted`: one UPDATE per call, no document scan"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    src, dst = ("", "deleted_") if deleted else ("deleted_", "")
+    col = lambda name: getattr(StorageUsage, name)
+    # Right-hand sides see the old values, so the moved amounts and the zeroing do not interfere
+    db.execute(
+        update(StorageUsage)
+        .where(StorageUsage.user_id.in_(user_ids))
+        .values({
+            col(dst + "files"): col(dst + "files") + col(src + "files"),
+            col(dst + "bytes"): col(dst + "bytes") + col(src + "bytes"),
+            col(src + "files"): 0,
+            col(src + "bytes"): 0,
+        })
+        .execution_options(synchronize_session=False)
+    )
+
+
+def track_purge(db: Session, document_ids: List[int]):
+    """Before documents and their versions are deleted (see versions.purge_documents)"""
+    delta = UsageDelta()
+    heads = db.execute(
+        select(Document.uploaded_by, Document.filetype, Document.deleted, func.count(), func.sum(Document.size))
+        .where(Document.id.in_(document_ids))
+        .group_by(Document.uploaded_by, Document.filetype, Document.deleted)
+    )
+    for user_id, filetype, deleted, count, size in heads:
+        delta.head(user_id, filetype, size, bool(deleted), sign=-1, count=count)
+    versions = db.execute(
+        select(DocumentVersion.uploaded_by, DocumentVersion.filetype, DocumentVersion.size, DocumentVersion.uploadedtime)
+        .where(DocumentVersion.document_id.in_(document_ids))
+    )
+    for user_id, filetype, size, uploadedtime in versions:
+        delta.version(user_id, filetype, size, uploadedtime, sign=-1)
+    delta.apply(db)
+
+
+# -------------------------
+# Rebuild
+# -------------------------
+def rebuild(db: Session) -> dict:
+    """
+    Recompute both tables from documents and document_versions in one
+    transaction. On PostgreSQL the tables are locked first, so concurrent
+    writers wait and then apply their change on top of the fresh totals.
+    """
+    started = time.monotonic()
+    try:
+        if db.get_bind().dialect.name == "postgresql":
+            db.execute(text("LOCK TABLE storage_usage, storage_usage_daily IN EXCLUSIVE MODE"))
+        db.execute(delete(StorageUsage))
+        db.execute(delete(StorageUsageDaily))
+
+        delta = UsageDelta()
+        heads = db.execute(
+            select(Document.uploaded_by, Document.filetype, Document.deleted, func.count(), func.sum(Document.size))
+            .group_by(Document.uploaded_by, Document.filetype, Document.deleted)
+        )
+        for user_id, filetype, deleted, count, size in heads:
+            delta.head(user_id, filetype, size, bool(deleted), count=count)
+        # Days are bucketed here rather than in SQL, with the same day_of() the writers use
+        versions = db.execute(
+            select(DocumentVersion.uploaded_by, DocumentVersion.filetype, DocumentVersion.size, DocumentVersion.uploadedtime)
+            .execution_options(yield_per=10000)
+        )
+        for user_id, filetype, size, uploadedtime in versions:
+            delta.version(user_id, filetype, size, uploadedtime)
+
+        totals = [{"user_id": u, "filetype": t, **values} for (u, t), values in delta.totals.items()]
+        daily = [{"day": d, "user_id": u, **values} for (d, u), values in delta.daily.items()]
+        if totals:
+            db.execute(insert(StorageUsage), totals)
+        if daily:
+            db.execute(insert(StorageUsageDaily), daily)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    report = {
+        "users": len({u for u, _ in delta.totals}),
+        "rows": len(totals),
+        "daily_rows": len(daily),
+        "duration_seconds": round(time.monotonic() - started, 3),
+    }
+    logger.info("Storage usage rebuilt", extra={"report": report})
+    return report
+
+
+# -------------------------
+# Dashboard queries
+# -------------------------
+def _sums(*fields: str) -> list:
+    return [func.coalesce(func.sum(getattr(StorageUsage, name)), 0).label(name) for name in fields]
+
+
+def _in_use():
+    # Purged users leave zeroed rows behind
+    return StorageUsage.files + StorageUsage.deleted_files + StorageUsage.versions > 0
+
+
+def usage_summary(db: Session) -> dict:
+    users = func.count(func.distinct(case((_in_use(), StorageUsage.user_id))))
+    row = db.execute(select(users, *_sums(*TOTAL_FIELDS))).one()
+    return {"users": row[0], **{name: row[i + 1] for i, name in enumerate(TOTAL_FIELDS)}}
+
+
+def usage_by_user(db: Session, limit: int, sort: str = "bytes") -> List[dict]:
+    """Top `limit` users by `sort`; reads the user's few filetype rows, never their documents"""
+    if sort not in SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(SORT_FIELDS)}")
+    sums = _sums(*TOTAL_FIELDS)
+    per_user = (
+        select(StorageUsage.user_id, *sums)
+        .where(_in_use())
+        .group_by(StorageUsage.user_id)
+        .subquery()
+    )
+    rows = db.execute(
+        select(per_user, User.email)
+        .outerjoin(User, User.id == per_user.c.user_id)
+        .order_by(per_user.c[sort].desc(), per_user.c.user_id)
+        .limit(limit)
+    )
+    return [{"user_id": r.user_id, "email": r.email, **{name: r[name] for name in TOTAL_FIELDS}} for r in rows.mappings()]
+
+
+def usage_by_type(db: Session) -> List[dict]:
+    rows = db.execute(
+        select(StorageUsage.filetype, *_sums(*TOTAL_FIELDS))
+        .group_by(StorageUsage.filetype)
+        .order_by(func.sum(StorageUsage.bytes).desc(), StorageUsage.filetype)
+    )
+    return [dict(r) for r in rows.mappings() if any(r[name] for name in TOTAL_FIELDS)]
+
+
+def usage_by_day(db: Session, since: date, until: date, user_id: Optional[int] = None) -> List[dict]:
+    """Versions and bytes uploaded per day (of content still stored), with the running total"""
+    where = [] if user_id is None else [StorageUsageDaily.user_id == user_id]
+    before = db.scalar(
+        select(func.coalesce(func.sum(StorageUsageDaily.bytes), 0)).where(StorageUsageDaily.day < since, *where)
+    )
+    rows = db.execute(
+        select(StorageUsageDaily.day, func.sum(StorageUsageDaily.versions), func.sum(StorageUsageDaily.bytes))
+        .where(StorageUsageDaily.day >= since, StorageUsageDaily.day <= until, *where)
+        .group_by(StorageUsageDaily.day)
+        .order_by(StorageUsageDaily.day)
+    )
+    days, total = [], before
+    for day, versions, size in rows:
+        if not versions:
+            continue
+        total += size
+        days.append({"day": day.isoformat(), "versions": versions, "bytes": size, "cumulative_bytes": total})
+    return days
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        json.dump(rebuild(db), sys.stdout, indent=2)
+        print()
+    finally:
+        db.close()
@@ -0,0 +1,191 @@
+# streaming.py
+import os
+import time
+import hashlib
+import mimetypes
+from typing import Optional, Tuple, Union
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse, FileResponse
+from models import Document, DocumentVersion
+from storage import storage, StorageError
+from cid_cache import cache
+from metrics import STAGE_SECONDS
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+FILE_CHUNK_SIZE = 1024 * 1024
+
+
+# -------------------------
+# Range header parsing
+# -------------------------
+def parse_range(range_header: Optional[str], size: Optional[int]) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range `bytes=` header into an inclusive (start, end).
+    Returns None when the whole object should be sent.
+    """
+    if not range_header or size is None:
+        return None
+
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        # Unsupported unit or multi-range: ignore and send the full body
+        return None
+
+    start_s, _, end_s = spec.strip().partition("-")
+    try:
+        if start_s:
+            start = int(start_s)
+            end = int(end_s) if end_s else size - 1
+        else:
+            # Suffix range: last N bytes
+            start = max(size - int(end_s), 0)
+            end = size - 1
+    except ValueError:
+        return None
+
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
+
+
+# -------------------------
+# SHA256-verified stream
+# -------------------------
+def verified_stream(chunks, expected_sha: str):
+    """
+    Pass chunks through while hashing them. The last chunk is held back
+    until the digest is checked, so a mismatch aborts the response before
+    it completes and the client never receives a full, corrupt body.
+    """
+    sha256_hash = hashlib.sha256()
+    hashing = 0.0
+    pending = None
+    try:
+        for chunk in chunks:
+            start = time.perf_counter()
+            sha256_hash.update(chunk)
+            hashing += time.perf_counter() - start
+            if pending is not None:
+                yield pending
+            pending = chunk
+        # Time spent re-hashing, not waiting on IPFS or the client
+        STAGE_SECONDS.labels("verify_hash").observe(hashing)
+        if sha256_hash.hexdigest() != expected_sha:
+            logger.error("SHA mismatch for expected %s, aborting stream", expected_sha)
+            raise RuntimeError("File integrity verification failed (SHA mismatch)")
+        if pending is not None:
+            yield pending
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+async def averified_stream(chunks, expected_sha: str):
+    """verified_stream() for an async iterator of chunks"""
+    sha256_hash = hashlib.sha256()
+    hashing = 0.0
+    pending = None
+    try:
+        async for chunk in chunks:
+            start = time.perf_counter()
+            sha256_hash.update(chunk)
+            hashing += time.perf_counter() - start
+            if pending is not None:
+                yield pending
+            pending = chunk
+        STAGE_SECONDS.labels("verify_hash").observe(hashing)
+        if sha256_hash.hexdigest() != expected_sha:
+            logger.error("SHA mismatch for expected %s, aborting stream", expected_sha)
+            raise RuntimeError("File integrity verification failed (SHA mismatch)")
+        if pending is not None:
+            yield pending
+    finally:
+        if hasattr(chunks, "aclose"):
+            await chunks.aclose()
+
+
+def iter_open_file(f, start: int, length: int):
+    """Read a byte range from an open binary file, closing it when done"""
+    with f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(FILE_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def iter_file_range(path: str, start: int, length: int):
+    yield from iter_open_file(open(path, "rb"), start, length)
+
+
+# -------------------------
+# Streaming response for a document
+# -------------------------
+async def document_stream_response(doc: Union[Document, DocumentVersion], disposition: str, range_header: Optional[str] = None):
+    """
+    Serve a document's content, honouring a `Range` request.
+    Content the backend keeps as a plain file (the local store) is sent
+    with FileResponse, which uses the server's sendfile/pathsend path when
+    available; ranges are read through the backend's mmap. Cache hits are
+    streamed from the file the cache opened, since another worker may
+    evict the entry before a path would be reopened. Misses stream from
+    the backend on the event loop and fill the cache on the way through.
+    """
+    mime_type = doc.filetype or mimetypes.guess_type(doc.filename)[0] or "application/octet-stream"
+    headers = {"Content-Disposition": disposition}
+    if doc.size is not None:
+        headers["Accept-Ranges"] = "bytes"
+
+    byte_range = parse_range(range_header, doc.size)
+
+    stored_path = storage.local_path(doc.cid)
+    if stored_path:
+        if byte_range:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{doc.size}"
+            headers["Content-Length"] = str(end - start + 1)
+            try:
+                body = storage.get(doc.cid, start, end - start + 1)
+            except StorageError as e:
+                raise HTTPException(status_code=502, detail=f"Could not fetch file from storage: {e}")
+            return StreamingResponse(body, status_code=206, media_type=mime_type, headers=headers)
+        return FileResponse(stored_path, media_type=mime_type, headers=headers)
+
+    cached = cache.open(doc.cid)
+    if cached:
+        size = os.fstat(cached.fileno()).st_size
+        if byte_range:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{doc.size}"
+            headers["Content-Length"] = str(end - start + 1)
+            body = iter_open_file(cached, start, end - start + 1)
+            return StreamingResponse(body, status_code=206, media_type=mime_type, headers=headers)
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(iter_open_file(cached, 0, size), media_type=mime_type, headers=headers)
+
+    try:
+        if byte_range:
+            start, end = byte_range
+            length = end - start + 1
+            body = await storage.aget(doc.cid, offset=start, length=length)
+            headers["Content-Range"] = f"bytes {start}-{end}/{doc.size}"
+            headers["Content-Length"] = str(length)
+            return StreamingResponse(body, status_code=206, media_type=mime_type, headers=headers)
+
+        chunks = await storage.aget(doc.cid)
+        body = cache.afill(doc.cid, averified_stream(chunks, doc.sha256), doc.size)
+    except (ValueError, RuntimeError) as e:
+        raise HTTPException(status_code=502, detail=f"Could not fetch file from storage: {e}")
+
+    if doc.size is not None:
+        headers["Content-Length"] = str(doc.size)
+    return StreamingResponse(body, media_type=mime_type, headers=headers)
@@ -0,0 +1,62 @@
+# tests/conftest.py
+import os
+import sys
+import shutil
+import tempfile
+import pytest
+
+# Modules live flat in BACKEND/, next to this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Module-level config is read at import: point everything at a scratch directory first
+_workdir = tempfile.mkdtemp(prefix="dms-tests-")
+for name, value in {
+    "SQLALDBURL": f"sqlite:///{os.path.join(_workdir, 'test.db')}",
+    "STORAGE_BACKEND": "local",
+    "STORAGE_LOCAL_DIR": os.path.join(_workdir, "storage"),
+    "UPLOAD_SESSION_DIR": os.path.join(_workdir, "upload_sessions"),
+    "CID_CACHE_DIR": os.path.join(_workdir, "cid_cache"),
+    "IPFS_START_DAEMON": "false",
+    "LOG_LEVEL": "WARNING",
+}.items():
+    os.environ[name] = value
+
+from benchmarks import fake_ipfs
+
+
+@pytest.fixture(scope="session")
+def _fake_server():
+    server, node, url = fake_ipfs.start()
+    yield node, url
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def fake_node(_fake_server):
+    """The in-process fake IPFS node, emptied for each test; yields (node, api_url)"""
+    node, url = _fake_server
+    with node.lock:
+        node.blocks.clear()
+        node.pins.clear()
+    yield node, url
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _cleanup_workdir():
+    yield
+    shutil.rmtree(_workdir, ignore_errors=True)
+
+
+@pytest.fixture
+def db():
+    """A session on the scratch SQLite database, tables created on first use"""
+    from database import SessionLocal, engine, Base
+    import models  # noqa: F401  (registers the tables)
+
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
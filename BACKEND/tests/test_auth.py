@@ -0,0 +1,61 @@
+# tests/test_auth.py
+import time
+import itertools
+import pytest
+from auth import create_access_token, revocations, verify_token
+from fastapi import HTTPException
+
+_user_ids = itertools.count(1000)
+
+
+def _payload(user_id: int) -> dict:
+    return verify_token(create_access_token({"user_id": user_id, "role": "user"}))
+
+
+def test_token_issued_right_after_a_revocation_is_valid(db):
+    user_id = next(_user_ids)
+    old = create_access_token({"user_id": user_id})
+    revocations.revoke_user(db, user_id)
+    db.commit()
+    time.sleep(0.002)
+
+    # Same second as the cutoff (whole-second `iat` alone could not tell them apart)
+    assert _payload(user_id)["user_id"] == user_id
+    with pytest.raises(HTTPException, match="revoked"):
+        verify_token(old)
+
+
+def test_tokens_without_iat_ms_fall_back_to_whole_seconds():
+    user_id = next(_user_ids)
+    revocations._apply((None, user_id, int(time.time() * 1000), int(time.time()) + 60))
+    assert revocations.is_revoked({"user_id": user_id, "iat": int(time.time())})
+    assert not revocations.is_revoked({"user_id": user_id, "iat": int(time.time()) + 1})
+
+
+def test_revocation_applies_only_after_commit(db):
+    user_id = next(_user_ids)
+    payload = _payload(user_id)
+    revocations.revoke_user(db, user_id)
+    assert not revocations.is_revoked(payload)
+    db.commit()
+    assert revocations.is_revoked(payload)
+
+
+def test_rolled_back_revocation_is_dropped(db):
+    user_id = next(_user_ids)
+    payload = _payload(user_id)
+    revocations.revoke_user(db, user_id)
+    revocations.revoke_token(db, payload)
+    db.rollback()
+    db.commit()
+    assert not revocations.is_revoked(payload)
+
+
+def test_savepoint_rollback_keeps_pending_revocations(db):
+    user_id = next(_user_ids)
+    payload = _payload(user_id)
+    revocations.revoke_user(db, user_id)
+    with db.begin_nested() as savepoint:
+        savepoint.rollback()
+    db.commit()
+    assert revocations.is_revoked(payload)
@@ -0,0 +1,78 @@
+# tests/test_bulk_upload.py
+import io
+import os
+import tarfile
+import zipfile
+import pytest
+from bulk_upload import ArchiveLimitError, ExpansionBudget, _BoundedMember, expand_uploads, iter_archive
+
+
+def _zip(members: dict, compression=zipfile.ZIP_STORED) -> io.BytesIO:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", compression=compression) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    buf.seek(0)
+    return buf
+
+
+def _tar(members: dict) -> io.BytesIO:
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as archive:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    buf.seek(0)
+    return buf
+
+
+def _read_all(entries) -> dict:
+    out = {}
+    for name, opener in entries:
+        with opener() as source:
+            out[name] = source.read()
+    return out
+
+
+def test_archive_within_limits_expands():
+    members = {"a.txt": os.urandom(1000), "dir/b.txt": os.urandom(2000)}
+    assert _read_all(iter_archive(_zip(members), "docs.zip")) == members
+    assert _read_all(iter_archive(_tar(members), "docs.tar")) == members
+
+
+def test_zip_over_total_is_refused_before_any_member_is_read():
+    budget = ExpansionBudget(limit=2500)
+    entries = iter_archive(_zip({"a.txt": os.urandom(1000), "b.txt": os.urandom(2000)}), "docs.zip", budget)
+    with pytest.raises(ArchiveLimitError, match="more than 2500 bytes"):
+        next(entries)
+
+
+def test_tar_over_total_stops_at_the_member_that_crosses_it():
+    budget = ExpansionBudget(limit=2500)
+    entries = iter_archive(_tar({"a.txt": os.urandom(1000), "b.txt": os.urandom(2000)}), "docs.tar", budget)
+    assert next(entries)[0] == "a.txt"
+    with pytest.raises(ArchiveLimitError):
+        next(entries)
+
+
+def test_highly_compressed_zip_is_refused():
+    bomb = _zip({"zeros.bin": b"\0" * (4 * 1024 * 1024)}, zipfile.ZIP_DEFLATED)
+    with pytest.raises(ArchiveLimitError, match="expands more than 100x"):
+        list(iter_archive(bomb, "bomb.zip", ExpansionBudget(ratio=100)))
+
+
+def test_budget_is_shared_across_a_requests_archives(monkeypatch):
+    monkeypatch.setattr("bulk_upload.BULK_MAX_UNCOMPRESSED_BYTES", 1500)
+    files = [("one.zip", _zip({"a.txt": os.urandom(1000)})), ("two.zip", _zip({"b.txt": os.urandom(1000)}))]
+    entries = list(expand_uploads(files))
+    assert [name for name, _ in entries] == ["a.txt", "two.zip"]
+    with pytest.raises(ArchiveLimitError):
+        entries[1][1]()
+
+
+def test_member_larger_than_declared_is_aborted():
+    member = _BoundedMember(io.BytesIO(b"x" * 100), "lying.bin", declared=64)
+    assert len(member.read(64)) == 64
+    with pytest.raises(ArchiveLimitError, match="declared 64 bytes"):
+        member.read(64)
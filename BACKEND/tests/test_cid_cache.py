@@ -0,0 +1,127 @@
+# tests/test_cid_cache.py
+import os
+import time
+import asyncio
+import hashlib
+import pytest
+import streaming
+from cid_cache import CIDCache, PART_SUFFIX
+from models import Document
+from streaming import document_stream_response
+
+
+def _fill(cache: CIDCache, cid: str, data: bytes):
+    assert b"".join(cache.fill(cid, iter([data]), len(data))) == data
+
+
+def _read(cache: CIDCache, cid: str):
+    f = cache.open(cid)
+    if f is None:
+        return None
+    with f:
+        return f.read()
+
+
+def test_workers_share_one_cache(tmp_path):
+    # Two instances on one directory stand in for two server workers
+    a, b = CIDCache(str(tmp_path)), CIDCache(str(tmp_path))
+    _fill(a, "bafy-one", b"1" * 100)
+    assert _read(b, "bafy-one") == b"1" * 100
+    assert b.stats()["entries"] == 1
+    assert b.stats()["bytes"] == 100
+
+
+def test_budget_covers_every_worker(tmp_path):
+    a, b = CIDCache(str(tmp_path), max_bytes=1000), CIDCache(str(tmp_path), max_bytes=1000)
+    for i in range(10):
+        _fill(a if i % 2 else b, f"bafy-{i}", os.urandom(300))
+        time.sleep(0.01)  # distinct mtimes for the LRU order
+    on_disk = sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, files in os.walk(tmp_path) for name in files if not name.startswith(".")
+    )
+    assert on_disk <= 1000
+    assert a.stats()["bytes"] == on_disk
+    # The newest entry survives, the oldest ones went first
+    assert _read(a, "bafy-9") is not None
+    assert _read(b, "bafy-0") is None
+
+
+def test_hit_keeps_an_entry_from_eviction(tmp_path):
+    cache = CIDCache(str(tmp_path), max_bytes=1000)
+    _fill(cache, "bafy-old", os.urandom(400))
+    time.sleep(0.01)
+    _fill(cache, "bafy-mid", os.urandom(400))
+    time.sleep(0.01)
+    assert _read(cache, "bafy-old") is not None
+    _fill(cache, "bafy-new", os.urandom(400))
+    assert _read(cache, "bafy-old") is not None
+    assert _read(cache, "bafy-mid") is None
+
+
+def test_starting_a_worker_keeps_fills_in_progress(tmp_path):
+    CIDCache(str(tmp_path))
+    active = tmp_path / f"4242-active{PART_SUFFIX}"
+    abandoned = tmp_path / f"4242-abandoned{PART_SUFFIX}"
+    active.write_bytes(b"partial")
+    abandoned.write_bytes(b"partial")
+    old = time.time() - 7200
+    os.utime(abandoned, (old, old))
+
+    CIDCache(str(tmp_path))
+    assert active.exists()
+    assert not abandoned.exists()
+
+
+def test_open_entry_survives_eviction(tmp_path):
+    if os.name == "nt":
+        pytest.skip("Windows does not delete open files")
+    a, b = CIDCache(str(tmp_path), max_bytes=500), CIDCache(str(tmp_path), max_bytes=500)
+    _fill(a, "bafy-held", b"h" * 400)
+    held = a.open("bafy-held")
+    time.sleep(0.01)
+    _fill(b, "bafy-other", b"o" * 400)
+    assert b.open("bafy-held") is None
+    with held:
+        assert held.read() == b"h" * 400
+
+
+def test_failed_fill_reports_the_source_error(tmp_path):
+    cache = CIDCache(str(tmp_path))
+
+    def chunks():
+        yield b"start"
+        # Another worker's startup swept our temp file
+        for name in os.listdir(tmp_path):
+            if name.endswith(PART_SUFFIX):
+                os.remove(tmp_path / name)
+        raise RuntimeError("IPFS cat timed out")
+
+    with pytest.raises(RuntimeError, match="timed out"):
+        b"".join(cache.fill("bafy-x", chunks()))
+    assert cache.open("bafy-x") is None
+
+
+def test_evicted_entry_falls_back_to_storage(db, tmp_path, monkeypatch):
+    data = b"cached report " * 100
+    doc = Document(cid="bafy-evicted", sha256=hashlib.sha256(data).hexdigest(), size=len(data),
+                   filename="report.txt", filetype="text/plain")
+    cache = CIDCache(str(tmp_path))
+    _fill(cache, doc.cid, data)
+    os.remove(cache._path(doc.cid))  # evicted by another worker
+    monkeypatch.setattr(streaming, "cache", cache)
+
+    async def aget(cid, offset=0, length=None):
+        async def chunks():
+            yield data
+        return chunks()
+
+    monkeypatch.setattr(streaming.storage, "aget", aget)
+
+    async def serve():
+        response = await document_stream_response(doc, "inline")
+        return b"".join([chunk async for chunk in response.body_iterator])
+
+    assert asyncio.run(serve()) == data
+    assert cache.stats()["misses"] == 1
+    assert _read(cache, doc.cid) == data
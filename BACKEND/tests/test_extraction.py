@@ -0,0 +1,86 @@
+# tests/test_extraction.py
+import io
+import os
+import hashlib
+import pytest
+import extraction
+from extraction import _extract_and_index
+from models import DocumentText, ContentPosting
+from storage import storage, StorageError
+
+
+@pytest.fixture
+def stored(db):
+    """A text file in storage; returns (cid, sha256)"""
+    data = b"quarterly revenue forecast " + os.urandom(8).hex().encode()
+    return storage.put(io.BytesIO(data)), hashlib.sha256(data).hexdigest()
+
+
+def _status(db, sha256):
+    db.expire_all()
+    row = db.get(DocumentText, sha256)
+    return row.status if row else None
+
+
+def _unavailable(*args, **kwargs):
+    raise StorageError("IPFS cat timed out")
+
+
+def test_read_failure_is_not_recorded(db, stored, monkeypatch):
+    cid, sha = stored
+    monkeypatch.setattr(storage, "get", _unavailable)
+    _extract_and_index(cid, sha, "report.txt")
+    assert _status(db, sha) is None
+
+    # Storage is back: the next upload of the same content indexes it
+    monkeypatch.undo()
+    _extract_and_index(cid, sha, "report.txt")
+    assert _status(db, sha) == "done"
+    assert db.query(ContentPosting).filter_by(sha256=sha, token="revenue").count() == 1
+
+
+def test_failed_extraction_is_retried(db, stored, monkeypatch):
+    cid, sha = stored
+
+    def broken(data, filename):
+        raise ValueError("corrupt file")
+
+    monkeypatch.setattr(extraction, "extract_text", broken)
+    _extract_and_index(cid, sha, "report.txt")
+    assert _status(db, sha) == "failed"
+
+    monkeypatch.undo()
+    _extract_and_index(cid, sha, "report.txt")
+    assert _status(db, sha) == "done"
+
+
+def test_done_content_is_not_extracted_again(db, stored, monkeypatch):
+    cid, sha = stored
+    _extract_and_index(cid, sha, "report.txt")
+    monkeypatch.setattr(storage, "get", _unavailable)
+    skipped = extraction.stats["skipped"]
+    _extract_and_index(cid, sha, "report.txt")
+    assert extraction.stats["skipped"] == skipped + 1
+    assert _status(db, sha) == "done"
+
+
+def test_index_goes_with_the_last_reference(db, stored):
+    from content_refs import release_refs
+    from ingest import IngestResult
+    from upload import record_document
+    from versions import purge_documents
+    cid, sha = stored
+    content = IngestResult(cid, sha, 64)
+    first = record_document(db, 1, content, "report.txt")
+    second = record_document(db, 1, content, "copy of report.txt")
+    db.commit()
+    _extract_and_index(cid, sha, "report.txt")
+
+    assert release_refs(db, purge_documents(db, [first.id])) == []
+    db.commit()
+    assert _status(db, sha) == "done"
+
+    assert release_refs(db, purge_documents(db, [second.id])) == [cid]
+    db.commit()
+    assert _status(db, sha) is None
+    assert db.query(ContentPosting).filter_by(sha256=sha).count() == 0
@@ -0,0 +1,96 @@
+# tests/test_ingest.py
+import io
+import os
+import hashlib
+import ingest
+from ingest import store_content
+from models import ContentRef
+from storage import storage
+
+
+class _Counting(io.BytesIO):
+    """Seekable body (like UploadFile's spooled file) that counts the bytes handed out"""
+
+    bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+class _Stream(_Counting):
+    """Body that can only be read once (like an archive member)"""
+
+    def seekable(self):
+        return False
+
+
+def _no_put(monkeypatch):
+    monkeypatch.setattr(storage, "put", lambda source: (_ for _ in ()).throw(AssertionError("stored")))
+
+
+def test_stream_is_read_once(db):
+    data = os.urandom(3 * 1024 * 1024 + 17)
+    source = _Stream(data)
+    content = store_content(db, source)
+
+    assert source.bytes_read == len(data)
+    assert content.sha256 == hashlib.sha256(data).hexdigest()
+    assert content.size == len(data)
+    assert not content.deduplicated
+    assert b"".join(storage.get(content.cid)) == data
+
+
+def test_known_content_reuses_its_cid(db):
+    data = os.urandom(4096)
+    first = store_content(db, io.BytesIO(data))
+    db.add(ContentRef(cid=first.cid, sha256=first.sha256, size=first.size, refcount=1))
+    db.commit()
+
+    again = store_content(db, _Counting(data))
+    assert again.deduplicated
+    assert again.cid == first.cid
+
+
+def test_seekable_duplicate_is_not_sent_to_storage(db, monkeypatch):
+    data = os.urandom(4096)
+    first = store_content(db, io.BytesIO(data))
+    db.add(ContentRef(cid=first.cid, sha256=first.sha256, size=first.size, refcount=1))
+    db.commit()
+    _no_put(monkeypatch)
+
+    again = store_content(db, io.BytesIO(data))
+    assert again == ingest.IngestResult(first.cid, first.sha256, first.size, True)
+
+
+def test_seekable_body_is_stored_from_the_start(db):
+    data = os.urandom(300 * 1024)
+    content = store_content(db, io.BytesIO(data))
+    assert not content.deduplicated
+    assert b"".join(storage.get(content.cid)) == data
+
+
+def test_duplicate_under_another_cid_is_released(db, monkeypatch):
+    data = os.urandom(4096)
+    sha = hashlib.sha256(data).hexdigest()
+    db.add(ContentRef(cid="bafy-older-chunking", sha256=sha, size=len(data), refcount=1))
+    db.commit()
+    released = []
+    monkeypatch.setattr(ingest, "unpin_orphans", released.extend)
+
+    content = store_content(db, _Stream(data))
+    assert content.cid == "bafy-older-chunking"
+    assert content.deduplicated
+    assert released == [storage.put(io.BytesIO(data))]
+
+
+def test_digest_skips_the_upload_when_known(db, monkeypatch):
+    data = os.urandom(4096)
+    sha = hashlib.sha256(data).hexdigest()
+    db.add(ContentRef(cid="bafy-known", sha256=sha, size=len(data), refcount=1))
+    db.commit()
+    _no_put(monkeypatch)
+
+    content = store_content(db, io.BytesIO(data), digest=(sha, len(data)))
+    assert content == ingest.IngestResult("bafy-known", sha, len(data), True)
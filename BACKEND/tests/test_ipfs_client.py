@@ -0,0 +1,185 @@
+# tests/test_ipfs_client.py
+import io
+import os
+import socket
+import asyncio
+import pytest
+from ipfs_client import IPFSClient, AsyncIPFSClient, IPFSError
+
+
+@pytest.fixture
+def client(fake_node):
+    _, url = fake_node
+    return IPFSClient(api_url=url, timeout=5)
+
+
+def _closed_port_url() -> str:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    return f"http://127.0.0.1:{port}"
+
+
+# -------------------------
+# add
+# -------------------------
+def test_add_pins_in_the_same_call(client, fake_node):
+    node, _ = fake_node
+    data = os.urandom(3000)
+    cid = client.add(io.BytesIO(data))
+    assert cid == node.cid_for(data)
+    assert node.blocks[cid] == data
+    assert cid in node.pins
+
+
+def test_add_without_pin(client, fake_node):
+    node, _ = fake_node
+    cid = client.add(io.BytesIO(b"unpinned"), pin=False)
+    assert cid in node.blocks
+    assert cid not in node.pins
+
+
+def test_add_streams_an_iterable_in_chunks(client, fake_node):
+    node, _ = fake_node
+    parts = [os.urandom(1000), b"", os.urandom(500)]
+    cid = client.add(iter(parts), chunk_size=256)
+    assert node.blocks[cid] == b"".join(parts)
+
+
+# -------------------------
+# cat
+# -------------------------
+def test_cat_returns_the_whole_content(client):
+    data = os.urandom(5000)
+    cid = client.add(io.BytesIO(data))
+    assert b"".join(client.cat(cid)) == data
+
+
+@pytest.mark.parametrize("offset,length", [(0, 10), (100, 1), (4000, None), (4990, 100), (1234, 0)])
+def test_cat_honours_offset_and_length(client, offset, length):
+    data = os.urandom(5000)
+    cid = client.add(io.BytesIO(data))
+    end = None if length is None else offset + length
+    assert b"".join(client.cat(cid, offset=offset, length=length)) == data[offset:end]
+
+
+def test_async_cat_honours_offset_and_length(fake_node):
+    _, url = fake_node
+    data = os.urandom(5000)
+    cid = IPFSClient(api_url=url).add(io.BytesIO(data))
+
+    async def read():
+        client = AsyncIPFSClient(api_url=url, timeout=5)
+        try:
+            return b"".join([chunk async for chunk in client.cat(cid, offset=10, length=20)])
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(read()) == data[10:30]
+
+
+# -------------------------
+# Pins
+# -------------------------
+def test_pin_rm_several_cids_in_one_call(client, fake_node):
+    node, _ = fake_node
+    cids = [client.add(io.BytesIO(os.urandom(100))) for _ in range(3)]
+    client.pin_rm(*cids[:2])
+    assert node.pins == {cids[2]}
+
+
+def test_pin_rm_fails_as_a_whole_if_one_is_not_pinned(client, fake_node):
+    node, _ = fake_node
+    pinned = client.add(io.BytesIO(b"a"))
+    unpinned = client.add(io.BytesIO(b"b"), pin=False)
+    with pytest.raises(IPFSError, match="not pinned"):
+        client.pin_rm(pinned, unpinned)
+    assert pinned in node.pins
+
+
+def test_is_pinned(client):
+    pinned = client.add(io.BytesIO(b"pinned"))
+    unpinned = client.add(io.BytesIO(b"loose"), pin=False)
+    assert client.is_pinned(pinned) is True
+    assert client.is_pinned(unpinned) is False
+
+
+def test_pin_ls_streams_every_pin(client):
+    cids = {client.add(io.BytesIO(os.urandom(50))) for _ in range(4)}
+    assert set(client.pin_ls()) == cids
+
+
+def test_file_size(client):
+    cid = client.add(io.BytesIO(b"x" * 777))
+    assert client.file_size(cid) == 777
+
+
+# -------------------------
+# Errors
+# -------------------------
+def test_non_200_is_raised_as_ipfs_error(client):
+    with pytest.raises(IPFSError, match=r"cat failed \(500\): block was not found"):
+        list(client.cat("QmMissing"))
+
+
+def test_unknown_endpoint_is_raised_as_ipfs_error(client):
+    with pytest.raises(IPFSError, match=r"\(404\)"):
+        client._post("no/such/command")
+
+
+def test_is_pinned_raises_other_errors():
+    client = IPFSClient(api_url=_closed_port_url(), timeout=2)
+    with pytest.raises(IPFSError, match="unreachable"):
+        client.is_pinned("QmAnything")
+
+
+def test_unreachable_daemon_is_raised_as_ipfs_error():
+    client = IPFSClient(api_url=_closed_port_url(), timeout=2)
+    with pytest.raises(IPFSError, match=r"unreachable \(add\)"):
+        client.add(io.BytesIO(b"data"))
+    with pytest.raises(IPFSError, match=r"unreachable \(version\)"):
+        client.version()
+
+
+def test_async_errors_are_raised_as_ipfs_error(fake_node):
+    _, url = fake_node
+
+    async def cat(api_url):
+        client = AsyncIPFSClient(api_url=api_url, timeout=2)
+        try:
+            return [chunk async for chunk in client.cat("QmMissing")]
+        finally:
+            await client.aclose()
+
+    with pytest.raises(IPFSError, match=r"\(500\)"):
+        asyncio.run(cat(url))
+    with pytest.raises(IPFSError, match="unreachable"):
+        asyncio.run(cat(_closed_port_url()))
+
+
+def test_pool_of_a_previous_loop_is_closed(fake_node):
+    import threading
+    _, url = fake_node
+    client = AsyncIPFSClient(api_url=url, timeout=5)
+    other = asyncio.new_event_loop()
+    thread = threading.Thread(target=other.run_forever, daemon=True)
+    thread.start()
+    try:
+        asyncio.run_coroutine_threadsafe(client.version(), other).result(5)
+        first = client._http
+
+        async def version():
+            try:
+                return await client.version()
+            finally:
+                await client.aclose()
+
+        assert asyncio.run(version())
+        assert client._http is None
+        # The old pool is closed on its own loop
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0.1), other).result(5)
+        assert first.is_closed
+    finally:
+        other.call_soon_threadsafe(other.stop)
+        thread.join(5)
+        other.close()
@@ -0,0 +1,15 @@
+# tests/test_last_login.py
+import last_login
+from last_login import LastLoginWriter
+
+
+def test_restarting_the_writer_registers_the_exit_flush_once(monkeypatch):
+    registered = []
+    monkeypatch.setattr(last_login.atexit, "register", registered.append)
+    monkeypatch.setattr(LastLoginWriter, "_run", lambda self: None)
+
+    writer = LastLoginWriter()
+    for _ in range(3):
+        writer.start()
+        writer._thread.join()  # the thread died; the next start() replaces it
+    assert registered == [writer.flush]
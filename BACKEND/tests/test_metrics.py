@@ -0,0 +1,67 @@
+# tests/test_metrics.py
+import asyncio
+from types import SimpleNamespace
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+from metrics import MetricsMiddleware, HTTP_BYTES_OUT, HTTP_REQUEST_SECONDS
+
+
+def _requests(route: str) -> int:
+    child = HTTP_REQUEST_SECONDS._children.get(("GET", route, "200"))
+    return child.counts[-1] + sum(child.counts[:-1]) if child else 0
+
+
+def _bytes_out(route: str) -> int:
+    return HTTP_BYTES_OUT.labels(route).value
+
+
+def _client() -> TestClient:
+    router = APIRouter()
+
+    @router.get("/{file_id}/meta")
+    def meta(file_id: int):
+        return {"id": file_id}
+
+    app = FastAPI()
+    app.include_router(router, prefix="/metrics-test/{tenant}/files")
+    app.add_middleware(MetricsMiddleware)
+    return TestClient(app)
+
+
+def test_included_routes_are_labelled_with_their_prefixed_template():
+    before = _requests("/metrics-test/{tenant}/files/{file_id}/meta")
+    client = _client()
+    for file_id in (1, 2, 3):
+        assert client.get(f"/metrics-test/acme/files/{file_id}/meta").status_code == 200
+    assert _requests("/metrics-test/{tenant}/files/{file_id}/meta") == before + 3
+    assert not any("acme" in values[1] for values in HTTP_REQUEST_SECONDS._children)
+
+
+def test_unrouted_requests_share_one_label():
+    client = _client()
+    assert client.get("/metrics-test/nothing/here/42").status_code == 404
+    labels = {values[1] for values in HTTP_REQUEST_SECONDS._children}
+    assert "unmatched" in labels
+    assert not any(label.startswith("/metrics-test/nothing") for label in labels)
+
+
+def test_pathsend_counts_the_file_size(tmp_path):
+    path = tmp_path / "cached.bin"
+    path.write_bytes(b"x" * 12345)
+
+    async def app(scope, receive, send):
+        scope["route"] = SimpleNamespace(path="/metrics-test/download")
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.pathsend", "path": str(path)})
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    before = _bytes_out("/metrics-test/download")
+    scope = {"type": "http", "method": "GET", "path": "/metrics-test/download",
+             "extensions": {"http.response.pathsend": {}}}
+    asyncio.run(MetricsMiddleware(app)(scope, receive, send))
+    assert _bytes_out("/metrics-test/download") == before + 12345
@@ -0,0 +1,66 @@
+# tests/test_reconcile.py
+import io
+import os
+import hashlib
+from datetime import datetime, timedelta, timezone
+from models import ContentRef, ReconcileOrphan
+from reconcile import Reconciler
+from storage import storage
+
+
+def _orphan() -> str:
+    return storage.put(io.BytesIO(os.urandom(256)))
+
+
+def _seen(db, cid: str):
+    db.expire_all()
+    return db.get(ReconcileOrphan, cid)
+
+
+def test_orphan_is_only_unpinned_by_a_later_run(db):
+    cid = _orphan()
+    reconciler = Reconciler(rate=0, grace=timedelta(0))
+
+    first = reconciler.run(dry_run=False)
+    assert first["deferred"] >= 1
+    assert storage.exists(cid)
+    assert _seen(db, cid) is not None
+
+    reconciler.run(dry_run=False)
+    assert not storage.exists(cid)
+    assert _seen(db, cid) is None
+
+
+def test_orphan_waits_out_the_grace_period(db):
+    cid = _orphan()
+    reconciler = Reconciler(rate=0, grace=timedelta(hours=1))
+    reconciler.run(dry_run=False)
+    reconciler.run(dry_run=False)
+    assert storage.exists(cid)
+
+    _seen(db, cid).first_seen = datetime.now(timezone.utc) - timedelta(hours=2)
+    db.commit()
+    reconciler.run(dry_run=False)
+    assert not storage.exists(cid)
+
+
+def test_content_referenced_after_the_first_run_is_kept(db):
+    data = os.urandom(256)
+    cid = storage.put(io.BytesIO(data))
+    reconciler = Reconciler(rate=0, grace=timedelta(0))
+    reconciler.run(dry_run=False)
+
+    # The upload that stored it commits its rows
+    db.add(ContentRef(cid=cid, sha256=hashlib.sha256(data).hexdigest(), size=len(data), refcount=1))
+    db.commit()
+    reconciler.run(dry_run=False)
+    assert storage.exists(cid)
+    assert _seen(db, cid) is None
+
+
+def test_dry_run_records_nothing(db):
+    cid = _orphan()
+    report = Reconciler(rate=0, grace=timedelta(0)).run(dry_run=True)
+    assert report["deferred"] >= 1
+    assert _seen(db, cid) is None
+    assert storage.exists(cid)
@@ -0,0 +1,49 @@
+# tests/test_streaming.py
+import io
+import os
+import asyncio
+import hashlib
+import pytest
+from fastapi import HTTPException
+from fastapi.responses import FileResponse, StreamingResponse
+from models import Document
+from storage import storage
+from streaming import document_stream_response
+
+FOREIGN_CID = "bafybeigdyrzt5sfp7udm7hu76uh7y26nf3efuylqabf3oclgtqy55fbzdi"
+
+
+def _doc(cid: str, data: bytes) -> Document:
+    return Document(cid=cid, sha256=hashlib.sha256(data).hexdigest(), size=len(data),
+                    filename="report.pdf", filetype="application/pdf")
+
+
+def _serve(doc: Document, range_header=None):
+    return asyncio.run(document_stream_response(doc, "inline", range_header))
+
+
+def test_stored_file_is_sent_from_disk(db):
+    data = os.urandom(2048)
+    response = _serve(_doc(storage.put(io.BytesIO(data)), data))
+    assert isinstance(response, FileResponse)
+    assert open(response.path, "rb").read() == data
+
+
+def test_ranged_read_of_stored_file(db):
+    data = os.urandom(2048)
+    response = _serve(_doc(storage.put(io.BytesIO(data)), data), "bytes=100-199")
+    assert isinstance(response, StreamingResponse)
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == "bytes 100-199/2048"
+
+
+def test_local_path_ignores_foreign_ids():
+    assert storage.local_path(FOREIGN_CID) is None
+
+
+@pytest.mark.parametrize("range_header", [None, "bytes=0-9"])
+def test_foreign_id_is_a_storage_error_not_a_crash(db, range_header):
+    # A document row pointing at an IPFS CID while the local store is configured
+    with pytest.raises(HTTPException) as raised:
+        _serve(_doc(FOREIGN_CID, b"x" * 64), range_header)
+    assert raised.value.status_code == 502
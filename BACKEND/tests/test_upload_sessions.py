@@ -0,0 +1,162 @@
+# tests/test_upload_sessions.py
+import io
+import os
+import hashlib
+import pytest
+from fastapi import HTTPException
+import upload_sessions
+from upload_sessions import create_session, write_chunk, finalize_session
+from models import UploadSession
+
+
+def _upload(db, session, data: bytes, chunk: int):
+    for offset in range(0, len(data), chunk):
+        write_chunk(db, session, offset, io.BytesIO(data[offset:offset + chunk]))
+
+
+def _read_back(db, doc) -> bytes:
+    from storage import storage
+    return b"".join(storage.get(doc.cid))
+
+
+def test_finalize_records_the_hash_of_the_assembled_file(db):
+    data = os.urandom(10_000)
+    session = create_session(db, 1, "plain.bin", len(data))
+    _upload(db, session, data, 3000)
+    doc = finalize_session(db, session)
+    assert doc.sha256 == hashlib.sha256(data).hexdigest()
+    assert _read_back(db, doc) == data
+
+
+def test_resend_through_another_worker_is_rehashed(db, monkeypatch):
+    data = bytearray(os.urandom(10_000))
+    session = create_session(db, 1, "resent.bin", len(data))
+    _upload(db, session, bytes(data), 3000)
+
+    # Another worker (its own hasher table) re-sends the first chunk with different bytes
+    local = upload_sessions._hashers
+    monkeypatch.setattr(upload_sessions, "_hashers", {})
+    data[:3000] = os.urandom(3000)
+    write_chunk(db, session, 0, io.BytesIO(bytes(data[:3000])))
+    monkeypatch.setattr(upload_sessions, "_hashers", local)
+
+    # Finalized here, where the running hash still covers the old first chunk
+    doc = finalize_session(db, session)
+    assert db.get(UploadSession, session.id).chunk_writes == 5
+    assert doc.sha256 == hashlib.sha256(data).hexdigest()
+    assert _read_back(db, doc) == bytes(data)
+
+
+def test_resend_in_the_same_worker_rewinds(db):
+    data = bytearray(os.urandom(8000))
+    session = create_session(db, 1, "rewind.bin", len(data))
+    _upload(db, session, bytes(data), 2000)
+    data[2000:4000] = os.urandom(2000)
+    write_chunk(db, session, 2000, io.BytesIO(bytes(data[2000:4000])))
+    doc = finalize_session(db, session)
+    assert doc.sha256 == hashlib.sha256(data).hexdigest()
+
+
+def test_write_racing_a_finalize_is_rejected(db):
+    from database import SessionLocal
+    session = create_session(db, 1, "late.bin", 10)
+    write_chunk(db, session, 0, io.BytesIO(b"0123456789"))
+    db.refresh(session)
+
+    # Claimed by a finalize elsewhere after this request loaded the session
+    other = SessionLocal()
+    other.query(UploadSession).filter(UploadSession.id == session.id).update({"status": "finalizing"})
+    other.commit()
+    other.close()
+
+    assert session.status == "open"
+    with pytest.raises(HTTPException, match="being finalized") as e:
+        write_chunk(db, session, 0, io.BytesIO(b"x"))
+    assert e.value.status_code == 409
+
+
+def _mark_finalizing(db, session, age_minutes: float):
+    from datetime import datetime, timedelta
+    from models import IST
+    db.query(UploadSession).filter(UploadSession.id == session.id).update(
+        {"status": "finalizing", "updatedtime": datetime.now(IST) - timedelta(minutes=age_minutes)}
+    )
+    db.commit()
+    db.refresh(session)
+
+
+def test_failure_while_recording_leaves_the_session_retryable(db, monkeypatch):
+    from models import Document
+    data = os.urandom(5000)
+    session = create_session(db, 1, "retry.bin", len(data))
+    _upload(db, session, data, 2500)
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("connection reset")
+
+    monkeypatch.setattr(upload_sessions, "record_document", broken)
+    with pytest.raises(RuntimeError):
+        finalize_session(db, session)
+    assert db.get(UploadSession, session.id).status == "open"
+    assert db.query(Document).filter_by(filename="retry.bin").count() == 0
+
+    monkeypatch.undo()
+    doc = finalize_session(db, session)
+    completed = db.get(UploadSession, session.id)
+    assert (completed.status, completed.document_id) == ("completed", doc.id)
+    # Calling it again returns the same document
+    assert finalize_session(db, completed).id == doc.id
+
+
+def test_stale_finalize_claim_can_be_taken_over(db):
+    data = os.urandom(4000)
+    session = create_session(db, 1, "stale.bin", len(data))
+    _upload(db, session, data, 2000)
+
+    _mark_finalizing(db, session, age_minutes=1)
+    with pytest.raises(HTTPException, match="already being finalized"):
+        finalize_session(db, session)
+    with pytest.raises(HTTPException, match="being finalized"):
+        upload_sessions.abort_session(db, session)
+
+    # The worker that claimed it died
+    _mark_finalizing(db, session, age_minutes=upload_sessions.UPLOAD_FINALIZE_TIMEOUT_MINUTES + 1)
+    doc = finalize_session(db, session)
+    assert doc.sha256 == hashlib.sha256(data).hexdigest()
+
+
+def test_stale_finalize_claim_can_be_aborted(db):
+    session = create_session(db, 1, "abandoned.bin", 10)
+    write_chunk(db, session, 0, io.BytesIO(b"0123456789"))
+    _mark_finalizing(db, session, age_minutes=upload_sessions.UPLOAD_FINALIZE_TIMEOUT_MINUTES + 1)
+    session_id = session.id
+    upload_sessions.abort_session(db, session)
+    db.expunge_all()
+    assert db.get(UploadSession, session_id) is None
+    assert not os.path.exists(upload_sessions._data_path(session_id))
+
+
+def test_chunks_are_written_without_pwrite(db, monkeypatch):
+    # Windows has no os.pwrite
+    monkeypatch.delattr(os, "pwrite", raising=False)
+    data = os.urandom(6000)
+    session = create_session(db, 1, "portable.bin", len(data))
+    _upload(db, session, data, 2500)
+    assert finalize_session(db, session).sha256 == hashlib.sha256(data).hexdigest()
+
+
+def test_expiry_removes_data_of_deleted_sessions(db):
+    import time
+    session = create_session(db, 1, "owner-deleted.bin", 10)
+    directory = os.path.dirname(upload_sessions._data_path(session.id))
+    # The row went with its user (ON DELETE CASCADE)
+    db.query(UploadSession).filter(UploadSession.id == session.id).delete()
+    db.commit()
+
+    upload_sessions.expire_sessions(db)
+    assert os.path.isdir(directory)  # too recent: could be a session being created
+
+    old = time.time() - (upload_sessions.UPLOAD_SESSION_TTL_HOURS + 1) * 3600
+    os.utime(directory, (old, old))
+    upload_sessions.expire_sessions(db)
+    assert not os.path.exists(directory)
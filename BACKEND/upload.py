@@ -1,64 +1,104 @@
 # upload_service.py
 from datetime import datetime, timezone, timedelta
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 from models import Document
-from ipfs_service import add_file_to_ipfs  
-import hashlib
+from ingest import store_content, store_content_detached, IngestResult
+from content_refs import acquire_ref
+from versions import allocate_version, record_version
+from storage_usage import head_state, track_document
+from extraction import schedule_extraction
+from metrics import stage
 import os
+from app_logging import get_logger
 
-IST = timezone(timedelta(hours=5, minutes=30))
-
-# SHA256 Hashing
+logger = get_logger(__name__)
 
-def compute_sha(file_path: str) -> str:
-    sha256_hash = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            sha256_hash.update(chunk)
-    return sha256_hash.hexdigest()
+IST = timezone(timedelta(hours=5, minutes=30))
 
-def upload_document(db: Session, user_id: int, file_path: str, filename: str):
+def record_document(db: Session, user_id: int, content: IngestResult, filename: str) -> Document:
     """
-    Uploads a file to IPFS and records it in the database with metadata:
-    filename, filetype, size, version, uploaded time, user, CID, SHA256.
+    Record stored content as a document version: takes a reference on the
+    CID, allocates the version and writes the history row. Caller commits.
     """
-    # Compute SHA256
-    sha = compute_sha(file_path)
-
-    # Add file to IPFS
-    cid = add_file_to_ipfs(file_path)
+    cid, sha, size, _ = content
+    acquire_ref(db, cid, sha, size)
 
     # Extract filetype from filename extension
     filetype = os.path.splitext(filename)[1][1:].lower() or "unknown"
 
-    # Get file size in bytes
-    size = os.path.getsize(file_path)
-
-    # Versioning: increment if same filename exists for this user
-    existing_docs = db.query(Document).filter(
+    # Versioning: a re-upload of the same filename becomes the next version
+    # of that document; the number is allocated atomically on the document row
+    doc = db.query(Document).filter(
+        Document.uploaded_by == user_id,
         Document.filename == filename,
-        Document.uploaded_by == user_id
-    ).all()
-    version = len(existing_docs) + 1
+        Document.deleted == False
+    ).order_by(Document.id.desc()).first()
+
+    before = head_state(doc) if doc else None
+    if doc:
+        doc.version = allocate_version(db, doc.id)
+        doc.filetype = filetype
+        doc.size = size
+        doc.uploadedtime = datetime.now(IST)
+        doc.cid = cid
+        doc.sha256 = sha
+    else:
+        doc = Document(
+            filename=filename,
+            filetype=filetype,
+            size=size,
+            version=1,
+            uploadedtime=datetime.now(IST),
+            uploaded_by=user_id,
+            cid=cid,
+            sha256=sha
+        )
+        db.add(doc)
+        db.flush()
 
-    # Create Document record
-    doc = Document(
-        filename=filename,
-        filetype=filetype,
-        size=size,
-        version=version,
-        uploadedtime=datetime.now(IST),
-        uploaded_by=user_id,
-        cid=cid,
-        sha256=sha
-    )
+    track_document(db, before, doc)
+    record_version(db, doc)
+    return doc
+
+def upload_document(db: Session, user_id: int, source, filename: str, digest=None):
+    """
+    Uploads a file to IPFS and records it in the database with metadata:
+    filename, filetype, size, version, uploaded time, user, CID, SHA256.
+    `source` is a binary file object. Content already stored (same SHA256)
+    is not added to IPFS again; its CID gains a reference instead.
+    Pass `digest=(sha256, size)` when the caller already hashed the body.
+    """
+    # Hash, measure and add to IPFS (or reuse existing content)
+    content = store_content(db, source, digest=digest)
+    doc = record_document(db, user_id, content, filename)
 
     # Save to DB
-    db.add(doc)
-    db.commit()
+    with stage("db_commit"):
+        db.commit()
     db.refresh(doc)
 
-    print(f"[Upload] Document uploaded: {filename}, Type: {filetype}, "
-          f"Size: {size} bytes, Version: {version}, CID: {cid}, SHA256: {sha}")
+    logger.info("Document uploaded: %s, Type: %s, Size: %s bytes, Version: %s, CID: %s, SHA256: %s",
+                filename, doc.filetype, doc.size, doc.version, doc.cid, doc.sha256)
+
+    # Index the body text in the background (skipped if this content is already indexed)
+    schedule_extraction(doc.cid, doc.sha256, filename)
+
+    return doc
+
+async def upload_document_async(db: AsyncSession, user_id: int, source, filename: str):
+    """
+    upload_document() for async routes: hashing and the IPFS add run in
+    the threadpool, the inserts run on the event loop through `db`.
+    """
+    content = await run_in_threadpool(store_content_detached, source)
+    doc = await db.run_sync(record_document, user_id, content, filename)
+    with stage("db_commit"):
+        await db.commit()
+
+    logger.info("Document uploaded: %s, Type: %s, Size: %s bytes, Version: %s, CID: %s, SHA256: %s",
+                filename, doc.filetype, doc.size, doc.version, doc.cid, doc.sha256)
 
+    schedule_extraction(doc.cid, doc.sha256, filename)
     return doc
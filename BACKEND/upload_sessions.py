@@ -0,0 +1,337 @@
+# upload_sessions.py
+import os
+import uuid
+import shutil
+import hashlib
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from sqlalchemy import select, update, or_, and_
+from sqlalchemy.orm import Session
+from models import UploadSession, UploadChunk, Document, IST
+from upload import record_document
+from ingest import store_content, INGEST_CHUNK_SIZE
+from extraction import schedule_extraction
+from metrics import stage
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+# -------------------------
+# Config
+# -------------------------
+load_dotenv()
+# Must outlive the process: sessions are resumed after a restart
+UPLOAD_SESSION_DIR = os.getenv("UPLOAD_SESSION_DIR", os.path.join(tempfile.gettempdir(), "dms_upload_sessions"))
+UPLOAD_CHUNK_MAX_BYTES = int(os.getenv("UPLOAD_CHUNK_MAX_BYTES", str(64 * 1024 * 1024)))
+UPLOAD_SESSION_TTL_HOURS = int(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24"))
+# A "finalizing" claim older than this was left by a worker that died; finalize or abort may take it over
+UPLOAD_FINALIZE_TIMEOUT_MINUTES = float(os.getenv("UPLOAD_FINALIZE_TIMEOUT_MINUTES", "30"))
+
+
+def _data_path(session_id: str) -> str:
+    return os.path.join(UPLOAD_SESSION_DIR, session_id, "data")
+
+
+# -------------------------
+# Incremental hashing
+# -------------------------
+class _PrefixHasher:
+    """
+    SHA256 of the contiguous prefix received so far; advanced as gaps fill
+    in. Only valid if every chunk write of the session went through this
+    hasher: `writes` counts them, to compare with the session's chunk_writes.
+    """
+
+    def __init__(self):
+        # Re-entrant: write_chunk() holds it across rewind() and the write
+        self.lock = threading.RLock()
+        self.sha256 = hashlib.sha256()
+        self.offset = 0
+        self.writes = 0
+
+    def reset(self):
+        with self.lock:
+            self.sha256 = hashlib.sha256()
+            self.offset = 0
+
+    def rewind(self, offset: int):
+        """Forget hashed bytes from `offset` on (a chunk there is being re-sent)"""
+        with self.lock:
+            if offset < self.offset:
+                self.reset()
+
+    def advance(self, path: str, end: int):
+        with self.lock:
+            if end <= self.offset:
+                return
+            # Just-written chunks are still in the page cache
+            with open(path, "rb") as f:
+                f.seek(self.offset)
+                remaining = end - self.offset
+                while remaining > 0:
+                    chunk = f.read(min(INGEST_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    self.sha256.update(chunk)
+                    self.offset += len(chunk)
+                    remaining -= len(chunk)
+
+
+# Per-process state; after a restart, or when chunks went to other workers, finalize hashes the whole file
+_hashers = {}
+_hashers_lock = threading.Lock()
+
+
+def _hasher(session_id: str) -> _PrefixHasher:
+    with _hashers_lock:
+        return _hashers.setdefault(session_id, _PrefixHasher())
+
+
+# -------------------------
+# Session state
+# -------------------------
+def received_ranges(db: Session, session_id: str) -> List[Tuple[int, int]]:
+    """Merged [start, end) ranges written so far"""
+    chunks = (
+        db.query(UploadChunk.offset, UploadChunk.length)
+        .filter(UploadChunk.session_id == session_id)
+        .order_by(UploadChunk.offset)
+    )
+    ranges = []
+    for offset, length in chunks:
+        end = offset + length
+        if ranges and offset <= ranges[-1][1]:
+            ranges[-1] = (ranges[-1][0], max(ranges[-1][1], end))
+        else:
+            ranges.append((offset, end))
+    return ranges
+
+
+def session_progress(db: Session, session: UploadSession) -> dict:
+    ranges = received_ranges(db, session.id)
+    missing = []
+    position = 0
+    for start, end in ranges:
+        if start > position:
+            missing.append([position, start])
+        position = end
+    if position < session.size:
+        missing.append([position, session.size])
+
+    return {
+        "session_id": session.id,
+        "filename": session.filename,
+        "size": session.size,
+        "received": sum(end - start for start, end in ranges),
+        "missing": missing,
+        "status": session.status,
+        "document_id": session.document_id,
+        "chunk_max_bytes": UPLOAD_CHUNK_MAX_BYTES,
+    }
+
+
+def get_session(db: Session, session_id: str, user_id: int) -> UploadSession:
+    session = db.query(UploadSession).filter(
+        UploadSession.id == session_id, UploadSession.user_id == user_id
+    ).first()
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+
+def _finalize_stale_before() -> datetime:
+    return datetime.now(IST) - timedelta(minutes=UPLOAD_FINALIZE_TIMEOUT_MINUTES)
+
+
+def _discard(session_id: str):
+    with _hashers_lock:
+        _hashers.pop(session_id, None)
+    shutil.rmtree(os.path.join(UPLOAD_SESSION_DIR, session_id), ignore_errors=True)
+
+
+# -------------------------
+# Protocol
+# -------------------------
+def create_session(db: Session, user_id: int, filename: str, size: int,
+                   expected_sha256: Optional[str] = None) -> UploadSession:
+    if size < 0:
+        raise HTTPException(status_code=400, detail="Invalid size")
+    expire_sessions(db)
+
+    session = UploadSession(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        filename=filename,
+        size=size,
+        expected_sha256=expected_sha256.lower() if expected_sha256 else None,
+    )
+    # Sparse file of the final size; chunks are written in place at their offsets
+    os.makedirs(os.path.dirname(_data_path(session.id)), exist_ok=True)
+    with open(_data_path(session.id), "wb") as f:
+        f.truncate(size)
+
+    db.add(session)
+    db.commit()
+    db.refresh(session)
+    logger.info("Session %s opened for %s (%s bytes)", session.id, filename, size)
+    return session
+
+
+def write_chunk(db: Session, session: UploadSession, offset: int, source) -> dict:
+    """Write one chunk at `offset`; sending the same offset again overwrites it"""
+    if session.status != "open":
+        raise HTTPException(status_code=409, detail=f"Upload session is {session.status}")
+    if offset < 0 or offset > session.size:
+        raise HTTPException(status_code=400, detail="Offset outside the file")
+
+    hasher = _hasher(session.id)
+    length = 0
+    # Plain seek + write rather than os.pwrite, which Windows lacks
+    with open(_data_path(session.id), "r+b") as f:
+        # Held until the bytes are written, so a concurrent advance() cannot
+        # hash the old contents of a re-sent range after the rewind
+        with hasher.lock:
+            hasher.rewind(offset)
+            for chunk in iter(lambda: source.read(INGEST_CHUNK_SIZE), b""):
+                if offset + length + len(chunk) > session.size:
+                    raise HTTPException(status_code=400, detail="Chunk extends past the declared size")
+                if length + len(chunk) > UPLOAD_CHUNK_MAX_BYTES:
+                    raise HTTPException(status_code=413, detail=f"Chunk larger than {UPLOAD_CHUNK_MAX_BYTES} bytes")
+                f.seek(offset + length)
+                f.write(chunk)
+                length += len(chunk)
+            # Only record the chunk once its bytes are durable
+            f.flush()
+            os.fsync(f.fileno())
+
+    if length:
+        counted = db.execute(
+            update(UploadSession)
+            .where(UploadSession.id == session.id, UploadSession.status == "open")
+            .values(chunk_writes=UploadSession.chunk_writes + 1, updatedtime=datetime.now(IST))
+        ).rowcount
+        if not counted:
+            db.rollback()
+            raise HTTPException(status_code=409, detail="Upload session is being finalized")
+        db.merge(UploadChunk(session_id=session.id, offset=offset, length=length))
+        db.commit()
+        with hasher.lock:
+            hasher.writes += 1
+
+    progress = session_progress(db, session)
+    prefix_end = progress["missing"][0][0] if progress["missing"] else session.size
+    hasher.advance(_data_path(session.id), prefix_end)
+    return progress
+
+
+def finalize_session(db: Session, session: UploadSession) -> Document:
+    """
+    Store the assembled file and record it as a document; safe to call
+    again after success. The document and the session's "completed"
+    status commit in one transaction, so a failure in between cannot
+    leave a document behind a session stuck in "finalizing".
+    """
+    if session.status == "completed" and session.document_id:
+        return db.get(Document, session.document_id)
+
+    progress = session_progress(db, session)
+    if progress["missing"]:
+        raise HTTPException(status_code=409, detail={"message": "Upload incomplete", "missing": progress["missing"]})
+
+    # Only one finalize may run per session; a claim whose worker died expires
+    claimable = or_(
+        UploadSession.status == "open",
+        and_(UploadSession.status == "finalizing", UploadSession.updatedtime < _finalize_stale_before()),
+    )
+    claimed = db.execute(
+        update(UploadSession)
+        .where(UploadSession.id == session.id, claimable)
+        .values(status="finalizing", updatedtime=datetime.now(IST))
+        .returning(UploadSession.chunk_writes)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    db.commit()
+    if claimed is None:
+        raise HTTPException(status_code=409, detail="Upload session is already being finalized")
+
+    try:
+        path = _data_path(session.id)
+        hasher = _hasher(session.id)
+        with hasher.lock:
+            # A chunk written (or re-sent) through another worker or before a
+            # restart never reached this hasher: hash the assembled file instead
+            if hasher.writes != claimed:
+                logger.info("Session %s: %s of %s chunk writes seen here, re-hashing", session.id, hasher.writes, claimed)
+                hasher.reset()
+            hasher.advance(path, session.size)
+            sha = hasher.sha256.hexdigest()
+        if session.expected_sha256 and sha != session.expected_sha256:
+            raise HTTPException(status_code=400, detail="SHA256 of the assembled file does not match")
+
+        with open(path, "rb") as f:
+            content = store_content(db, f, digest=(sha, session.size))
+        doc = record_document(db, session.user_id, content, session.filename)
+        session.status = "completed"
+        session.document_id = doc.id
+        session.updatedtime = datetime.now(IST)
+        db.query(UploadChunk).filter(UploadChunk.session_id == session.id).delete(synchronize_session=False)
+        with stage("db_commit"):
+            db.commit()
+    except Exception:
+        db.rollback()
+        session.status = "open"
+        session.updatedtime = datetime.now(IST)
+        db.commit()
+        raise
+
+    logger.info("Session %s finalized as document %s, version %s (CID %s)", session.id, doc.id, doc.version, doc.cid)
+    schedule_extraction(doc.cid, doc.sha256, session.filename)
+    _discard(session.id)
+    return doc
+
+
+def abort_session(db: Session, session: UploadSession):
+    # A live finalize keeps its session; one whose worker died can be aborted
+    session_id = session.id
+    deleted = db.query(UploadSession).filter(
+        UploadSession.id == session_id,
+        or_(UploadSession.status != "finalizing", UploadSession.updatedtime < _finalize_stale_before()),
+    ).delete(synchronize_session=False)
+    if not deleted:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Upload session is being finalized")
+    db.query(UploadChunk).filter(UploadChunk.session_id == session_id).delete(synchronize_session=False)
+    db.commit()
+    _discard(session_id)
+
+
+def expire_sessions(db: Session) -> int:
+    """Drop sessions idle for longer than UPLOAD_SESSION_TTL_HOURS along with their data"""
+    cutoff = datetime.now(IST) - timedelta(hours=UPLOAD_SESSION_TTL_HOURS)
+    stale = db.query(UploadSession).filter(UploadSession.updatedtime < cutoff).all()
+    for session in stale:
+        db.query(UploadChunk).filter(UploadChunk.session_id == session.id).delete(synchronize_session=False)
+        db.delete(session)
+        _discard(session.id)
+    if stale:
+        db.commit()
+        logger.info("Expired %s upload sessions", len(stale))
+
+    # Data whose session row is gone (deleted along with its user); fresh
+    # directories may belong to a session that is still being created
+    known = set(db.scalars(select(UploadSession.id)))
+    try:
+        with os.scandir(UPLOAD_SESSION_DIR) as entries:
+            leftovers = [
+                entry.name for entry in entries
+                if entry.is_dir() and entry.name not in known and entry.stat().st_mtime < cutoff.timestamp()
+            ]
+    except FileNotFoundError:
+        leftovers = []
+    for session_id in leftovers:
+        _discard(session_id)
+    return len(stale)
@@ -0,0 +1,73 @@
+# versions.py
+from typing import Iterable, List
+from sqlalchemy import update, exists
+from sqlalchemy.orm import Session
+from models import Document, DocumentVersion
+from storage_usage import track_version, track_purge
+
+
+# -------------------------
+# Version allocation
+# -------------------------
+def allocate_version(db: Session, document_id: int) -> int:
+    """
+    Atomically bump documents.version and return the new number.
+    The UPDATE takes the row lock, so concurrent uploads of the same
+    document get distinct, gap-free versions; nothing is counted.
+    """
+    return db.execute(
+        update(Document)
+        .where(Document.id == document_id)
+        .values(version=Document.version + 1)
+        .returning(Document.version)
+    ).scalar_one()
+
+
+def record_version(db: Session, doc: Document) -> DocumentVersion:
+    """Snapshot the document's current head fields as history row `doc.version`. Caller commits."""
+    entry = DocumentVersion(
+        document_id=doc.id,
+        version=doc.version,
+        filename=doc.filename,
+        filetype=doc.filetype,
+        size=doc.size,
+        cid=doc.cid,
+        sha256=doc.sha256,
+        uploadedtime=doc.uploadedtime,
+        uploaded_by=doc.uploaded_by,
+    )
+    db.add(entry)
+    track_version(db, entry)
+    return entry
+
+
+# -------------------------
+# Permanent deletion
+# -------------------------
+def purge_documents(db: Session, document_ids: Iterable[int]) -> List[str]:
+    """
+    Delete documents and their whole version history. Returns one CID per
+    deleted version row, ready for content_refs.release_refs(). Caller commits.
+    """
+    document_ids = list(document_ids)
+    if not document_ids:
+        return []
+    track_purge(db, document_ids)
+
+    cids = [
+        cid for (cid,) in
+        db.query(DocumentVersion.cid).filter(DocumentVersion.document_id.in_(document_ids))
+    ]
+    # Rows created before version tracking only reference their head CID
+    cids += [
+        cid for (cid,) in
+        db.query(Document.cid).filter(
+            Document.id.in_(document_ids),
+            ~exists().where(DocumentVersion.document_id == Document.id),
+        )
+    ]
+    db.query(DocumentVersion).filter(
+        DocumentVersion.document_id.in_(document_ids)
+    ).delete(synchronize_session=False)
+    db.query(Document).filter(Document.id.in_(document_ids)).delete(synchronize_session=False)
+    return cids
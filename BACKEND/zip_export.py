@@ -0,0 +1,121 @@
+# zip_export.py
+import os
+import zipfile
+from datetime import datetime
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+from dotenv import load_dotenv
+from models import Document
+from storage import storage
+from cid_cache import cache
+from streaming import verified_stream, iter_file_range, iter_open_file
+from bulk_upload import safe_archive_name
+from app_logging import get_logger
+
+logger = get_logger(__name__)
+
+# -------------------------
+# Config
+# -------------------------
+load_dotenv()
+EXPORT_MAX_FILES = int(os.getenv("EXPORT_MAX_FILES", "1000"))
+# Most documents (PDF, DOCX, images) are already compressed, so entries are stored by default
+EXPORT_ZIP_COMPRESSION = (
+    zipfile.ZIP_DEFLATED if os.getenv("EXPORT_ZIP_DEFLATE", "false").lower() == "true" else zipfile.ZIP_STORED
+)
+ERRORS_ENTRY = "EXPORT_ERRORS.txt"
+
+
+class ExportEntry(NamedTuple):
+    name: str
+    cid: str
+    sha256: str
+    size: Optional[int]
+    modified: datetime
+
+
+def export_entries(docs: Iterable[Document]) -> List[ExportEntry]:
+    """
+    Snapshot what the archive needs from each document so the stream
+    does not hold a DB session open. Member names are made safe and unique.
+    """
+    seen = set()
+    entries = []
+    for doc in docs:
+        name = safe_archive_name(doc.filename) or f"document-{doc.id}"
+        stem, ext = os.path.splitext(name)
+        n = 1
+        while name in seen:
+            n += 1
+            name = f"{stem} ({n}){ext}"
+        seen.add(name)
+        entries.append(ExportEntry(name, doc.cid, doc.sha256, doc.size, doc.uploadedtime))
+    return entries
+
+
+# -------------------------
+# Streaming zip writer
+# -------------------------
+class _ChunkSink:
+    """Write-only, non-seekable target: ZipFile writes into it and the generator drains it"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data) -> int:
+        if data:
+            self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _content_chunks(entry: ExportEntry):
+    stored_path = storage.local_path(entry.cid)
+    if stored_path:
+        return iter_file_range(stored_path, 0, os.path.getsize(stored_path))
+    cached = cache.open(entry.cid)
+    if cached:
+        # Cache entries were verified when they were filled
+        return iter_open_file(cached, 0, os.fstat(cached.fileno()).st_size)
+    return cache.fill(entry.cid, verified_stream(storage.get(entry.cid), entry.sha256), entry.size)
+
+
+def zip_stream(entries: List[ExportEntry]) -> Iterator[bytes]:
+    """
+    Yield a zip archive of `entries` as it is built. Members use data
+    descriptors (the archive is never seeked), so memory stays at about
+    one chunk. Files the storage backend cannot serve are skipped and listed in
+    EXPORT_ERRORS.txt; a SHA256 mismatch aborts the download.
+    """
+    sink = _ChunkSink()
+    failed = []
+    with zipfile.ZipFile(sink, "w", compression=EXPORT_ZIP_COMPRESSION, allowZip64=True) as archive:
+        for entry in entries:
+            try:
+                chunks = _content_chunks(entry)
+            except (ValueError, RuntimeError) as e:
+                logger.warning("Skipping %s: %s", entry.name, e)
+                failed.append(f"{entry.name}: {e}")
+                continue
+
+            info = zipfile.ZipInfo(entry.name, date_time=entry.modified.timetuple()[:6])
+            info.compress_type = EXPORT_ZIP_COMPRESSION
+            info.file_size = entry.size or 0
+            with archive.open(info, "w", force_zip64=entry.size is None) as member:
+                for chunk in chunks:
+                    member.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            yield sink.drain()
+
+        if failed:
+            archive.writestr(ERRORS_ENTRY, "\n".join(failed) + "\n")
+    yield sink.drain()
+    logger.info("Streamed %s of %s files", len(entries) - len(failed), len(entries))
@@ -33,4 +33,18 @@ api.interceptors.response.use(
   }
 );
 
+// List endpoints are cursor-paginated: follow X-Next-Cursor until the last page
+export async function getAllPages(path, params = {}) {
+  const items = [];
+  let cursor = null;
+  do {
+    const res = await api.get(path, {
+      params: cursor ? { ...params, cursor } : params,
+    });
+    if (Array.isArray(res.data)) items.push(...res.data);
+    cursor = res.headers["x-next-cursor"];
+  } while (cursor);
+  return items;
+}
+
 export default api;
@@ -36,16 +36,21 @@ export function useFiles() {
   const fetchFiles = async () => {
     if (!token) return;
     try {
-      const url = search
-        ? `http://127.0.0.1:8000/files?search=${encodeURIComponent(search)}`
-        : `http://127.0.0.1:8000/files`;
-      const res = await fetch(url, {
-        headers: { Authorization: `Bearer ${token}` },
-      });
-      if (res.ok) {
-        const data = await res.json();
-        setFiles(data);
-      }
+      // Listing is cursor-paginated: keep following X-Next-Cursor
+      const all = [];
+      let cursor = null;
+      do {
+        const params = new URLSearchParams();
+        if (search) params.set("search", search);
+        if (cursor) params.set("cursor", cursor);
+        const res = await fetch(`http://127.0.0.1:8000/files?${params}`, {
+          headers: { Authorization: `Bearer ${token}` },
+        });
+        if (!res.ok) return;
+        all.push(...(await res.json()));
+        cursor = res.headers.get("X-Next-Cursor");
+      } while (cursor);
+      setFiles(all);
     } catch (err) {
       console.error(err);
     }
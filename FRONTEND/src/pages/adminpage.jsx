@@ -2,7 +2,7 @@
 import { useEffect, useState } from "react";
 import { useSelector } from "react-redux";
 import { Link } from "react-router-dom";
-import api from "../api";
+import api, { getAllPages } from "../api";
 import { showSuccessToast, showErrorToast } from "../utils/toast";
 
 export default function AdminPage() {
@@ -25,8 +25,7 @@ export default function AdminPage() {
     setUsersLoading(true);
     setUsersError("");
     try {
-      const res = await api.get("/admin/users");
-      const users = Array.isArray(res.data) ? res.data : [];
+      const users = await getAllPages("/admin/users");
       setActiveUsers(users.filter((u) => !u.deleted));
       setDeletedUsers(users.filter((u) => u.deleted));
     } catch (err) {
@@ -41,8 +40,7 @@ export default function AdminPage() {
     setFilesLoading(true);
     setFilesError("");
     try {
-      const res = await api.get("/admin/files");
-      const files = Array.isArray(res.data) ? res.data : [];
+      const files = await getAllPages("/admin/files");
       setActiveFiles(files.filter((f) => !f.deleted));
       setDeletedFiles(files.filter((f) => f.deleted));
     } catch (err) {